@@ -0,0 +1,476 @@
+"""Multi-process mode: one front polls Telegram and hands every update to one of
+N worker processes, picked by chat id so a chat is always served by the same worker.
+
+Front and workers talk over the workers' standard streams: the front writes one
+JSON-encoded update per line to a worker's stdin, and the worker answers on its
+stdout with `{"ready": true}` once it has started and then one
+`{"update_id": ..., "ok": ...}` line per handled update. Logs go to stderr.
+Closing a worker's stdin asks it to drain and exit. Updates lost with a worker
+that died get a message asking the user to repeat the action.
+
+Workers share the SQLite database (WAL), FSM state (`FSM_STORAGE=sqlite`) and file
+storage. Per-process state (the scheduler, in-flight limits, callback debounce)
+stays correct because every update of a chat lands on the same worker, which
+handles a chat's updates one at a time in the order they arrived.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from contextlib import AbstractAsyncContextManager, nullcontext, suppress
+from functools import partial
+from typing import Awaitable, Callable, Mapping
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.base import BaseSession
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.enums import ParseMode
+from aiogram.types import Update
+from aiogram.utils.backoff import Backoff, BackoffConfig
+
+from .config import ROOT_DIR, Settings
+from .db import Database, prepare_schema
+from .logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Updates can carry long texts and captions; keep well clear of the stream reader's default 64 KiB.
+LINE_LIMIT = 16 * 1024 * 1024
+POLLING_TIMEOUT = 10
+BACKOFF = BackoffConfig(min_delay=1.0, max_delay=5.0, factor=1.3, jitter=0.1)
+# A worker that dies is restarted on its next update, but not more often than this.
+RESTART_INTERVAL = 10.0
+LOST_TEXT = "⚠️ Бот перезапускался и не успел обработать твоё последнее действие. Повтори его, пожалуйста."
+
+WorkerCommand = Callable[[int], list[str]]
+WorkerEnv = Callable[[int], Mapping[str, str]]
+LostHandler = Callable[[Update], Awaitable[None]]
+UpdateHandler = Callable[[Update], Awaitable[None]]
+UpdateGuard = Callable[[], AbstractAsyncContextManager[None]]
+
+
+def chat_key(update: Update) -> int:
+    """The update's chat id, falling back to its user; 0 for updates with neither."""
+    context = UserContextMiddleware.resolve_event_context(update)
+    return context.chat_id or context.user_id or 0
+
+
+def shard(update: Update, workers: int) -> int:
+    """Index of the worker that owns the update's chat (falling back to its user)."""
+    return chat_key(update) % workers
+
+
+def worker_command(index: int, workers: int) -> list[str]:
+    return [sys.executable, "-m", "src.bot_photo.cluster", "--worker", str(index), "--workers", str(workers)]
+
+
+def worker_slots(settings: Settings, workers: int) -> tuple[int, int]:
+    """Upstream concurrency and reserved priority slots of each worker.
+
+    Both are split evenly; every worker keeps at least one reserved slot when any
+    are configured, since each one serves its own share of the priority users.
+    """
+    concurrency = max(1, settings.generation_concurrency // workers)
+    reserved = max(1, settings.priority_reserved_slots // workers) if settings.priority_reserved_slots > 0 else 0
+    return concurrency, reserved
+
+
+def check_worker_slots(settings: Settings, workers: int) -> None:
+    """Refuse a split that would leave a worker without a shared slot, which the
+    scheduler would otherwise fix by silently shrinking the priority lane."""
+    concurrency, reserved = worker_slots(settings, workers)
+    if reserved and reserved >= concurrency:
+        raise ValueError(
+            f"PRIORITY_RESERVED_SLOTS={settings.priority_reserved_slots} leaves no shared slot with "
+            f"GENERATION_CONCURRENCY={settings.generation_concurrency} split between {workers} workers "
+            f"({concurrency} each); raise the concurrency, lower the reservation or run fewer workers"
+        )
+
+
+def worker_env(settings: Settings, index: int, workers: int, base: Mapping[str, str] | None = None) -> dict[str, str]:
+    """Environment of one worker: the front's, with the upstream concurrency and
+    reserved slots split between workers, shared FSM storage and a metrics port of its own."""
+    env = dict(os.environ if base is None else base)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT_DIR.as_posix(), env.get("PYTHONPATH")]))
+    env["BOT_WORKERS"] = "1"
+    env["FSM_STORAGE"] = "sqlite"
+    concurrency, reserved = worker_slots(settings, workers)
+    env["GENERATION_CONCURRENCY"] = str(concurrency)
+    env["PRIORITY_RESERVED_SLOTS"] = str(reserved)
+    if settings.metrics_port:
+        env["METRICS_PORT"] = str(settings.metrics_port + index)
+    if index:
+        # Worker 0 receives the webhooks; credits land in the shared database.
+        env["CRYPTO_PAY_WEBHOOK_PATH"] = ""
+    return env
+
+
+class WorkerProcess:
+    """One worker subprocess and the updates it has not acknowledged yet."""
+
+    def __init__(self, index: int, command: list[str], env: Mapping[str, str], cwd: str | None = None) -> None:
+        self.index = index
+        self._command = command
+        self._env = dict(env)
+        self._cwd = cwd
+        self._process: asyncio.subprocess.Process | None = None
+        self._reader: asyncio.Task[None] | None = None
+        self._started_at = 0.0
+        self._ready = asyncio.Event()
+        self._pending: dict[int, asyncio.Future[bool | None]] = {}
+        self._lock = asyncio.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.returncode is None
+
+    async def start(self) -> None:
+        if self._reader:
+            await self._reader  # settles the updates lost with the previous process
+        self._started_at = time.monotonic()
+        self._ready.clear()
+        self._process = await asyncio.create_subprocess_exec(
+            *self._command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            env=self._env,
+            cwd=self._cwd,
+            limit=LINE_LIMIT,
+        )
+        self._reader = asyncio.create_task(self._read_acks(self._process), name=f"worker-{self.index}-acks")
+        await self._ready.wait()
+        if self.alive:
+            logger.info("Started worker %s (pid %s)", self.index, self._process.pid)
+
+    async def submit(self, update: Update) -> bool | None:
+        """Send the update and wait until the worker has handled it.
+
+        Returns whether the handler succeeded, or None if the update was never
+        handled because the worker died or is waiting to be restarted.
+        """
+        async with self._lock:
+            if not self.alive:
+                if time.monotonic() - self._started_at < RESTART_INTERVAL:
+                    return None
+                logger.warning("Worker %s is gone, restarting it", self.index)
+                await self.start()
+            future: asyncio.Future[bool | None] = asyncio.get_running_loop().create_future()
+            self._pending[update.update_id] = future
+            self._process.stdin.write(update.model_dump_json(exclude_unset=True).encode() + b"\n")
+            try:
+                await self._process.stdin.drain()
+            except ConnectionError:
+                self._pending.pop(update.update_id, None)
+                return None
+        return await future
+
+    async def close(self, timeout: float) -> None:
+        """Ask the worker to drain and exit; kill it if it takes longer than `timeout`."""
+        if self._process is None:
+            return
+        if self.alive:
+            self._process.stdin.close()
+            try:
+                await asyncio.wait_for(self._process.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Worker %s did not exit in %.0fs, killing it", self.index, timeout)
+                self._process.kill()
+                await self._process.wait()
+        if self._reader:
+            await self._reader
+
+    async def _read_acks(self, process: asyncio.subprocess.Process) -> None:
+        while line := await process.stdout.readline():
+            try:
+                ack = json.loads(line)
+            except ValueError:
+                logger.warning("Worker %s wrote a malformed ack: %r", self.index, line[:200])
+                continue
+            if ack.get("ready"):
+                self._ready.set()
+                continue
+            future = self._pending.pop(ack.get("update_id"), None)
+            if future and not future.done():
+                future.set_result(bool(ack.get("ok")))
+        await process.wait()
+        self._ready.set()
+        if self._pending:
+            logger.error(
+                "Worker %s exited with code %s, %s updates lost", self.index, process.returncode, len(self._pending)
+            )
+        for future in self._pending.values():
+            if not future.done():
+                future.set_result(None)
+        self._pending.clear()
+
+
+class ChatOrderedRunner:
+    """Runs `handle` for every submitted update: concurrently across chats, but one
+    at a time and in submission order within a chat, so FSM transitions never race.
+
+    `guard` (e.g. `ShutdownCoordinator.track`) is entered before an update waits for
+    its chat's turn, so a shutdown drain also covers updates queued behind another.
+    """
+
+    def __init__(self, handle: UpdateHandler, guard: UpdateGuard | None = None) -> None:
+        self._handle = handle
+        self._guard = guard
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._queued: dict[int, int] = {}
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    def submit(self, update: Update) -> None:
+        task = asyncio.create_task(self._run(chat_key(update), update), name=f"update-{update.update_id}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def wait(self) -> None:
+        """Wait for every submitted update to be handled."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run(self, key: int, update: Update) -> None:
+        async with self._guard() if self._guard else nullcontext():
+            await self._run_in_turn(key, update)
+
+    async def _run_in_turn(self, key: int, update: Update) -> None:
+        if not key:
+            await self._handle(update)
+            return
+        # Tasks start in submission order and asyncio.Lock wakes waiters first come, first served.
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._queued[key] = self._queued.get(key, 0) + 1
+        try:
+            async with lock:
+                await self._handle(update)
+        finally:
+            self._queued[key] -= 1
+            if not self._queued[key]:
+                del self._queued[key]
+                del self._locks[key]
+
+
+class ClusterFront:
+    """Routes updates to worker processes by chat id; `on_lost` is called with every
+    update a worker did not get to handle."""
+
+    def __init__(
+        self,
+        workers: int,
+        command: WorkerCommand,
+        env: WorkerEnv,
+        *,
+        cwd: str | None = None,
+        close_timeout: float = 45.0,
+        on_lost: LostHandler | None = None,
+    ) -> None:
+        self._workers = [WorkerProcess(index, command(index), env(index), cwd) for index in range(max(1, workers))]
+        self._close_timeout = close_timeout
+        self._on_lost = on_lost
+
+    @property
+    def workers(self) -> int:
+        return len(self._workers)
+
+    async def start(self) -> None:
+        await asyncio.gather(*(worker.start() for worker in self._workers))
+
+    async def dispatch(self, update: Update) -> bool:
+        handled = await self._workers[shard(update, len(self._workers))].submit(update)
+        if handled is None and self._on_lost:
+            try:
+                await self._on_lost(update)
+            except Exception:
+                logger.exception("Failed to report lost update %s", update.update_id)
+        return bool(handled)
+
+    async def close(self) -> None:
+        await asyncio.gather(*(worker.close(self._close_timeout) for worker in self._workers))
+
+
+async def prepare_database(settings: Settings) -> None:
+    """Bring the schema up to date once, before the workers open the database."""
+    database = Database(settings.database_path, busy_timeout_ms=settings.database_busy_timeout_ms)
+    await database.connect()
+    try:
+        await prepare_schema(database)
+    finally:
+        await database.close()
+
+
+async def notify_lost(bot: Bot, update: Update) -> None:
+    """Ask the user to repeat an action whose update died with its worker."""
+    chat_id = UserContextMiddleware.resolve_event_context(update).chat_id
+    if chat_id:
+        await bot.send_message(chat_id, LOST_TEXT)
+
+
+async def run_front(settings: Settings, workers: int) -> None:
+    check_worker_slots(settings, workers)
+    await prepare_database(settings)
+    bot = Bot(settings.bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    front = ClusterFront(
+        workers,
+        lambda index: worker_command(index, workers),
+        lambda index: worker_env(settings, index, workers),
+        close_timeout=settings.shutdown_drain_seconds + 15,
+        on_lost=partial(notify_lost, bot),
+    )
+    await front.start()
+    poller = asyncio.create_task(_poll(bot, front, settings.shutdown_drain_seconds + 15), name="cluster-polling")
+    with suppress(NotImplementedError):  # no signal handlers on Windows; Ctrl+C cancels the run instead
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, poller.cancel)
+    logger.info("Cluster front started with %s workers", front.workers)
+    try:
+        await poller
+    except asyncio.CancelledError:
+        poller.cancel()
+        with suppress(asyncio.CancelledError):
+            await poller
+    finally:
+        await front.close()
+        await bot.session.close()
+        logger.info("Cluster front stopped")
+
+
+async def _poll(bot: Bot, front: ClusterFront, drain_seconds: float) -> None:
+    offset: int | None = None
+    backoff = Backoff(config=BACKOFF)
+    tasks: dict[int, asyncio.Task[bool]] = {}
+    try:
+        while True:
+            try:
+                updates = await bot.get_updates(
+                    offset=offset, timeout=POLLING_TIMEOUT, request_timeout=POLLING_TIMEOUT + 10
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("getUpdates failed (%s), retrying in %.1fs", exc, backoff.next_delay)
+                await backoff.asleep()
+                continue
+            backoff.reset()
+            for update in updates:
+                offset = update.update_id + 1
+                task = asyncio.create_task(front.dispatch(update))
+                tasks[update.update_id] = task
+                task.add_done_callback(lambda _, update_id=update.update_id: tasks.pop(update_id, None))
+    finally:
+        if tasks:
+            # Let the workers finish what they were handed before confirming it.
+            await asyncio.wait(list(tasks.values()), timeout=drain_seconds)
+        unacked = [update_id for update_id, task in tasks.items() if not task.done()]
+        if unacked:
+            logger.warning("%s updates were not acknowledged; Telegram will deliver them again", len(unacked))
+            offset = min(unacked)
+        if offset is not None:
+            # Confirm everything before the first unacknowledged update so a restart does not receive it again.
+            with suppress(Exception):
+                await bot.get_updates(offset=offset, timeout=0, limit=1)
+
+
+async def run_worker(index: int, workers: int, settings: Settings, session: BaseSession | None = None) -> None:
+    """Serve updates read from stdin until it is closed, then drain and exit.
+
+    Only worker 0 runs the periodic jobs (payments polling, sweeps, recovery).
+    """
+    from .main import create_application
+
+    # Acks get a private copy of stdout; anything else printing to stdout lands in stderr.
+    acks = os.fdopen(os.dup(sys.stdout.fileno()), "wb", buffering=0)
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    app = await create_application(settings)
+    bot = Bot(settings.bot_token, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    app.instrument_bot(bot)
+    await app.start(bot, background=index == 0)
+
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=LINE_LIMIT)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+    async def handle(update: Update) -> None:
+        ok = True
+        try:
+            async with app.shutdown.track():
+                await app.dispatcher.feed_update(bot, update)
+        except Exception:
+            ok = False
+            logger.exception("Update %s failed", update.update_id)
+        acks.write(json.dumps({"update_id": update.update_id, "ok": ok}).encode() + b"\n")
+
+    runner = ChatOrderedRunner(handle, guard=app.shutdown.track)
+    acks.write(b'{"ready": true}\n')
+    logger.info("Worker %s of %s ready", index, workers)
+    try:
+        while line := await reader.readline():
+            runner.submit(Update.model_validate_json(line, context={"bot": bot}))
+    finally:
+        await app.stop(bot)
+        await runner.wait()
+        acks.close()
+
+
+def ignore_stop_signals() -> None:
+    """Ctrl+C and service-manager stops reach the whole process group; workers
+    leave it to the front, which stops them by closing their stdin."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+def _parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the bot as a front process and several workers")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: BOT_WORKERS)")
+    parser.add_argument("--worker", type=int, default=None, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = _parse_args(argv)
+    settings = Settings()
+    log_listener = setup_logging(
+        level=settings.log_level,
+        fmt=settings.log_format,
+        log_file=settings.log_file,
+        logger_levels=settings.log_levels,
+        debug_sample_rate=settings.log_debug_sample_rate,
+    )
+    workers = args.workers or settings.bot_workers
+    try:
+        if args.worker is None:
+            asyncio.run(run_front(settings, workers))
+        else:
+            ignore_stop_signals()
+            asyncio.run(run_worker(args.worker, workers, settings))
+    finally:
+        log_listener.stop()
+
+
+if __name__ == "__main__":
+    main()
+
+
+__all__ = [
+    "ChatOrderedRunner",
+    "ClusterFront",
+    "WorkerProcess",
+    "chat_key",
+    "check_worker_slots",
+    "ignore_stop_signals",
+    "notify_lost",
+    "prepare_database",
+    "run_front",
+    "run_worker",
+    "shard",
+    "worker_command",
+    "worker_env",
+    "worker_slots",
+]
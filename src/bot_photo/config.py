@@ -17,6 +17,34 @@ class Settings(BaseSettings):
     crypto_bot_token: str = Field(..., alias="CRYPTO_BOT_TOKEN")
     crypto_bot_network: str = Field("TEST_NET", alias="CRYPTO_BOT_NETWORK")
     crypto_rub_rate: float = Field(90.0, alias="CRYPTO_RUB_RATE")
+    payments_poll_interval_seconds: float = Field(30.0, alias="PAYMENTS_POLL_INTERVAL_SECONDS")
+    payments_poll_batch_size: int = Field(100, alias="PAYMENTS_POLL_BATCH_SIZE")
+    payments_poll_max_backoff_seconds: float = Field(1800.0, alias="PAYMENTS_POLL_MAX_BACKOFF_SECONDS")
+    crypto_pay_webhook_path: str = Field("", alias="CRYPTO_PAY_WEBHOOK_PATH")
+    crypto_pay_webhook_host: str = Field("127.0.0.1", alias="CRYPTO_PAY_WEBHOOK_HOST")
+    crypto_pay_webhook_port: int = Field(8081, alias="CRYPTO_PAY_WEBHOOK_PORT")
+    token_ledger_audit_seconds: float = Field(3600.0, alias="TOKEN_LEDGER_AUDIT_SECONDS")
+    token_hold_ttl_seconds: float = Field(900.0, alias="TOKEN_HOLD_TTL_SECONDS")
+    token_hold_sweep_seconds: float = Field(60.0, alias="TOKEN_HOLD_SWEEP_SECONDS")
+    generation_limits: str = Field("default=1,admin=3", alias="GENERATION_LIMITS")
+    callback_debounce_seconds: float = Field(1.0, alias="CALLBACK_DEBOUNCE_SECONDS")
+    generation_concurrency: int = Field(4, alias="GENERATION_CONCURRENCY")
+    scheduler_weights: str = Field("admin=4,priority=4,paid=3,new=2,default=1", alias="SCHEDULER_WEIGHTS")
+    priority_lane_classes: str = Field("admin,priority", alias="PRIORITY_LANE_CLASSES")
+    priority_reserved_slots: int = Field(1, alias="PRIORITY_RESERVED_SLOTS")
+    priority_min_tokens: int = Field(250, alias="PRIORITY_MIN_TOKENS")
+    priority_window_days: float = Field(30.0, alias="PRIORITY_WINDOW_DAYS")
+    priority_cache_seconds: float = Field(300.0, alias="PRIORITY_CACHE_SECONDS")
+    priority_wait_slo_seconds: float = Field(5.0, alias="PRIORITY_WAIT_SLO_SECONDS")
+    shared_wait_slo_seconds: float = Field(60.0, alias="SHARED_WAIT_SLO_SECONDS")
+    shutdown_drain_seconds: float = Field(30.0, alias="SHUTDOWN_DRAIN_SECONDS")
+    recovery_stale_seconds: float = Field(900.0, alias="RECOVERY_STALE_SECONDS")
+    recovery_interval_seconds: float = Field(300.0, alias="RECOVERY_INTERVAL_SECONDS")
+    recovery_batch_size: int = Field(50, alias="RECOVERY_BATCH_SIZE")
+    recovery_heartbeat_seconds: float = Field(60.0, alias="RECOVERY_HEARTBEAT_SECONDS")
+    bot_workers: int = Field(1, alias="BOT_WORKERS")
+    fsm_storage: str = Field("memory", alias="FSM_STORAGE")
+    database_busy_timeout_ms: int = Field(5000, alias="DATABASE_BUSY_TIMEOUT_MS")
     nano_banana_api_key: str = Field(..., alias="NANO_BANANA_API_KEY")
     nano_banana_base_url: str = Field("https://api.artemox.com", alias="NANO_BANANA_BASE_URL")
     nano_banana_model: str = Field("gemini-2.5-flash-image-preview", alias="NANO_BANANA_MODEL")
@@ -26,17 +54,46 @@ class Settings(BaseSettings):
     database_path: Path = Field(_default_path("var/app.db"), alias="DATABASE_PATH")
     faces_path: Path = Field(_default_path("storage/faces"), alias="FACES_PATH")
     sessions_path: Path = Field(_default_path("storage/sessions"), alias="SESSIONS_PATH")
+    storage_io_workers: int = Field(4, alias="STORAGE_IO_WORKERS")
+    storage_fsync: str = Field("never", alias="STORAGE_FSYNC")
+    storage_render_workers: int = Field(1, alias="STORAGE_RENDER_WORKERS")
+    face_download_concurrency: int = Field(4, alias="FACE_DOWNLOAD_CONCURRENCY")
+    quota_max_faces: int = Field(20, alias="QUOTA_MAX_FACES")
+    quota_max_face_mb: int = Field(50, alias="QUOTA_MAX_FACE_MB")
+    quota_max_generation_mb: int = Field(500, alias="QUOTA_MAX_GENERATION_MB")
+    storage_backend: str = Field("local", alias="STORAGE_BACKEND")
+    storage_cache_max_mb: int = Field(1024, alias="STORAGE_CACHE_MAX_MB")
+    s3_endpoint_url: str | None = Field(None, alias="S3_ENDPOINT_URL")
+    s3_bucket: str | None = Field(None, alias="S3_BUCKET")
+    s3_access_key: str = Field("", alias="S3_ACCESS_KEY")
+    s3_secret_key: str = Field("", alias="S3_SECRET_KEY")
+    s3_region: str = Field("us-east-1", alias="S3_REGION")
+    s3_part_size_mb: int = Field(8, alias="S3_PART_SIZE_MB")
+    storage_gc_interval_seconds: float = Field(300.0, alias="STORAGE_GC_INTERVAL_SECONDS")
+    storage_gc_grace_hours: float = Field(24.0, alias="STORAGE_GC_GRACE_HOURS")
+    storage_gc_batch_size: int = Field(200, alias="STORAGE_GC_BATCH_SIZE")
+    storage_gc_deletes_per_second: float = Field(20.0, alias="STORAGE_GC_DELETES_PER_SECOND")
+    storage_gc_dry_run: bool = Field(False, alias="STORAGE_GC_DRY_RUN")
     examples_path: Path = Field(_default_path("repo/examples"), alias="EXAMPLES_PATH")
+    examples_reload_seconds: float = Field(5.0, alias="EXAMPLES_RELOAD_SECONDS")
+    styles_path: Path = Field(_default_path("repo/styles.json"), alias="STYLES_PATH")
     hourly_limit: int = Field(0, alias="HOURLY_LIMIT")
     starting_tokens: int = Field(10, alias="STARTING_TOKENS")
     cost_per_session: int = Field(5, alias="COST_PER_SESSION")
     cost_per_prompt: int = Field(1, alias="COST_PER_PROMPT")
     admin_ids: tuple[int, ...] = Field((742200799,), alias="ADMIN_IDS")
+    metrics_host: str = Field("127.0.0.1", alias="METRICS_HOST")
+    metrics_port: int = Field(0, alias="METRICS_PORT")
+    log_level: str = Field("INFO", alias="LOG_LEVEL")
+    log_format: str = Field("json", alias="LOG_FORMAT")
+    log_file: Path | None = Field(None, alias="LOG_FILE")
+    log_levels: str | None = Field(None, alias="LOG_LEVELS")
+    log_debug_sample_rate: float = Field(1.0, alias="LOG_DEBUG_SAMPLE_RATE")
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
     @field_validator(
-        "database_path", "faces_path", "sessions_path", "examples_path", mode="before"
+        "database_path", "faces_path", "sessions_path", "examples_path", "styles_path", mode="before"
     )
     @classmethod
     def expand_path(cls, value: str | Path) -> Path:
@@ -59,6 +116,16 @@ class Settings(BaseSettings):
             return ()
         raise TypeError("Unsupported admin_ids type")
 
+    @field_validator("log_file", mode="before")
+    @classmethod
+    def expand_optional_path(cls, value: str | Path | None) -> Path | None:
+        if value is None or (isinstance(value, str) and not value.strip()):
+            return None
+        path = Path(value).expanduser()
+        if not path.is_absolute():
+            path = ROOT_DIR / path
+        return path.resolve()
+
     @field_validator("nano_banana_fallback_model", mode="before")
     @classmethod
     def parse_optional_model(cls, value: str | None) -> str | None:
@@ -1,3 +1,5 @@
 from .database import Database
+from .fsm_storage import SQLiteStorage
+from .migrations import apply_migrations, prepare_schema
 
-__all__ = ["Database"]
+__all__ = ["Database", "SQLiteStorage", "apply_migrations", "prepare_schema"]
@@ -1,19 +1,43 @@
 from __future__ import annotations
 
 import asyncio
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Any, Iterable
+from typing import TYPE_CHECKING, Any, AsyncIterator, Iterable
 
 import aiosqlite
 
+from ..metrics import current_update_stats
+
+if TYPE_CHECKING:
+    from ..metrics import MetricsRegistry
+
 
 class Database:
-    """Small async wrapper around aiosqlite."""
+    """Small async wrapper around aiosqlite.
 
-    def __init__(self, path: Path) -> None:
+    Every call holds the connection lock, so statements from different tasks never
+    interleave and each call commits its own work. `transaction()` keeps the lock
+    for a whole block; calls made by the task that opened it join the transaction.
+    """
+
+    def __init__(self, path: Path, metrics: MetricsRegistry | None = None, busy_timeout_ms: int = 5000) -> None:
         self._path = path
+        self._busy_timeout_ms = busy_timeout_ms
         self._conn: aiosqlite.Connection | None = None
         self._lock = asyncio.Lock()
+        # Task that currently owns an explicit transaction, if any.
+        self._owner: asyncio.Task[Any] | None = None
+        self._query_duration = (
+            metrics.histogram(
+                "db_query_duration_seconds",
+                "Database calls by operation.",
+                ("operation",),
+            )
+            if metrics
+            else None
+        )
 
     async def connect(self) -> None:
         if self._conn:
@@ -22,6 +46,11 @@ class Database:
         self._conn = await aiosqlite.connect(self._path.as_posix())
         self._conn.row_factory = aiosqlite.Row
         await self._conn.execute("PRAGMA foreign_keys=ON;")
+        # WAL lets readers in other worker processes run alongside a writer; writers
+        # queue on the file lock for up to busy_timeout instead of failing at once.
+        await self._conn.execute(f"PRAGMA busy_timeout={int(self._busy_timeout_ms)};")
+        await self._conn.execute("PRAGMA journal_mode=WAL;")
+        await self._conn.execute("PRAGMA synchronous=NORMAL;")
 
     async def close(self) -> None:
         if self._conn:
@@ -35,30 +64,79 @@ class Database:
         return self._conn
 
     async def run_script(self, script_path: Path) -> None:
+        started = time.perf_counter()
         async with self._lock:
             with script_path.open("r", encoding="utf-8") as file:
                 script = file.read()
             await self.connection.executescript(script)
             await self.connection.commit()
+        self._observe("run_script", started)
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[None]:
+        """Run a block atomically: commit on success, roll back on any error.
 
-    async def execute(self, query: str, params: Iterable[Any] | None = None) -> None:
+        Statements must be issued from the task that opened the transaction;
+        a nested `transaction()` in that task simply joins the outer one.
+        """
+        if self._in_transaction():
+            yield
+            return
+        started = time.perf_counter()
         async with self._lock:
-            await self.connection.execute(query, tuple(params or ()))
-            await self.connection.commit()
+            await self.connection.execute("BEGIN IMMEDIATE")
+            self._owner = asyncio.current_task()
+            try:
+                yield
+            except BaseException:
+                await self.connection.rollback()
+                raise
+            else:
+                await self.connection.commit()
+            finally:
+                self._owner = None
+        self._observe("transaction", started)
+
+    async def execute(self, query: str, params: Iterable[Any] | None = None) -> int:
+        """Run a write statement and commit; returns the number of rows changed."""
+        started = time.perf_counter()
+        async with self._locked():
+            cursor = await self.connection.execute(query, tuple(params or ()))
+            rowcount = cursor.rowcount
+            await cursor.close()
+            await self._commit()
+        self._observe("execute", started)
+        return rowcount
+
+    async def executemany(self, query: str, params: Iterable[Iterable[Any]]) -> None:
+        started = time.perf_counter()
+        async with self._locked():
+            await self.connection.executemany(query, [tuple(row) for row in params])
+            await self._commit()
+        self._observe("executemany", started)
 
     async def fetchone(
         self, query: str, params: Iterable[Any] | None = None
     ) -> dict[str, Any] | None:
-        async with self.connection.execute(query, tuple(params or ())) as cursor:
-            row = await cursor.fetchone()
-            return dict(row) if row else None
+        started = time.perf_counter()
+        async with self._locked():
+            async with self.connection.execute(query, tuple(params or ())) as cursor:
+                row = await cursor.fetchone()
+            # `UPDATE ... RETURNING` goes through here too and must be committed.
+            await self._commit()
+        self._observe("fetchone", started)
+        return dict(row) if row else None
 
     async def fetchall(
         self, query: str, params: Iterable[Any] | None = None
     ) -> list[dict[str, Any]]:
-        async with self.connection.execute(query, tuple(params or ())) as cursor:
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+        started = time.perf_counter()
+        async with self._locked():
+            async with self.connection.execute(query, tuple(params or ())) as cursor:
+                rows = await cursor.fetchall()
+            await self._commit()
+        self._observe("fetchall", started)
+        return [dict(row) for row in rows]
 
     async def fetchval(
         self, query: str, params: Iterable[Any] | None = None
@@ -67,3 +145,27 @@ class Database:
         if row:
             return next(iter(row.values()))
         return None
+
+    def _in_transaction(self) -> bool:
+        return self._owner is not None and self._owner is asyncio.current_task()
+
+    @asynccontextmanager
+    async def _locked(self) -> AsyncIterator[None]:
+        if self._in_transaction():
+            yield
+            return
+        async with self._lock:
+            yield
+
+    async def _commit(self) -> None:
+        if not self._in_transaction() and self.connection.in_transaction:
+            await self.connection.commit()
+
+    def _observe(self, operation: str, started: float) -> None:
+        elapsed = time.perf_counter() - started
+        if self._query_duration:
+            self._query_duration.observe(elapsed, operation=operation)
+        stats = current_update_stats()
+        if stats:
+            stats.db_queries += 1
+            stats.db_seconds += elapsed
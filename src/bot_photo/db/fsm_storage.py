@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from .database import Database
+
+
+class SQLiteStorage(BaseStorage):
+    """aiogram FSM storage in the `fsm_states` table.
+
+    Unlike `MemoryStorage` it survives restarts and is visible to every worker
+    process sharing the database. The database itself is owned (and closed) by
+    the application, not by the storage.
+    """
+
+    def __init__(self, database: Database, key_builder: KeyBuilder | None = None) -> None:
+        self._db = database
+        self._key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._db.execute(
+            """
+            INSERT INTO fsm_states(key, state) VALUES(?, ?)
+            ON CONFLICT(key) DO UPDATE SET state=excluded.state, updated_at=CURRENT_TIMESTAMP
+            """,
+            (self._key_builder.build(key), value),
+        )
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return await self._db.fetchval("SELECT state FROM fsm_states WHERE key=?", (self._key_builder.build(key),))
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self._db.execute(
+            """
+            INSERT INTO fsm_states(key, data) VALUES(?, ?)
+            ON CONFLICT(key) DO UPDATE SET data=excluded.data, updated_at=CURRENT_TIMESTAMP
+            """,
+            (self._key_builder.build(key), json.dumps(dict(data), ensure_ascii=False)),
+        )
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        value = await self._db.fetchval("SELECT data FROM fsm_states WHERE key=?", (self._key_builder.build(key),))
+        return json.loads(value) if value else {}
+
+    async def close(self) -> None:
+        return None
+
+
+__all__ = ["SQLiteStorage"]
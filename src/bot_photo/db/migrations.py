@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import hashlib
+from pathlib import Path
+
+from .database import Database
+
+SCHEMA_PATH = Path(__file__).resolve().parent / "schema.sql"
+
+# Columns added after the first release. `schema.sql` already has them for fresh
+# databases; older ones get them through ALTER TABLE.
+COLUMN_MIGRATIONS: tuple[tuple[str, str, str], ...] = (
+    ("faces", "file_unique_id", "TEXT"),
+    ("payments", "checked_at", "TEXT"),
+    ("payments", "next_check_at", "TEXT"),
+    ("payments", "check_attempts", "INTEGER NOT NULL DEFAULT 0"),
+    ("sessions", "inputs", "TEXT"),
+    ("sessions", "recovered_at", "TEXT"),
+    ("sessions", "heartbeat_at", "TEXT"),
+    ("prompt_generations", "inputs", "TEXT"),
+    ("prompt_generations", "recovered_at", "TEXT"),
+    ("prompt_generations", "heartbeat_at", "TEXT"),
+    ("blobs", "refcount", "INTEGER NOT NULL DEFAULT 0"),
+)
+
+# Indexes on migrated columns cannot live in schema.sql, which runs first.
+INDEX_MIGRATIONS: tuple[str, ...] = (
+    "CREATE INDEX IF NOT EXISTS idx_faces_file_unique_id ON faces(file_unique_id)",
+    "CREATE INDEX IF NOT EXISTS idx_payments_status_next_check ON payments(status, next_check_at)",
+)
+
+# Idempotent data fixes, run after the columns and indexes above exist.
+DATA_MIGRATIONS: tuple[str, ...] = (
+    # Balances from before the token ledger get a single opening entry.
+    """
+    INSERT INTO token_ledger(user_id, delta, balance_after, reason)
+    SELECT telegram_id, tokens, tokens, 'opening_balance' FROM users
+    WHERE tokens != 0 AND NOT EXISTS (SELECT 1 FROM token_ledger WHERE token_ledger.user_id = users.telegram_id)
+    """,
+    # Reference counts from the rows themselves, for databases written before the count triggers.
+    """
+    UPDATE blobs SET refcount =
+        (SELECT COUNT(*) FROM faces WHERE file_path = blobs.path)
+        + (SELECT COUNT(*) FROM sessions WHERE result_path = blobs.path)
+        + (SELECT COUNT(*) FROM prompt_generations WHERE result_path = blobs.path)
+    """,
+)
+
+
+def schema_version(schema_path: Path = SCHEMA_PATH) -> int:
+    """Fingerprint of `schema.sql` and the migrations above, stored in `PRAGMA user_version`."""
+    source = schema_path.read_text(encoding="utf-8").replace("\r\n", "\n")
+    source += repr((COLUMN_MIGRATIONS, INDEX_MIGRATIONS, DATA_MIGRATIONS))
+    digest = hashlib.sha256(source.encode("utf-8")).digest()
+    # user_version is a signed 32-bit integer.
+    return int.from_bytes(digest[:4], "big") & 0x7FFFFFFF
+
+
+async def prepare_schema(database: Database, schema_path: Path = SCHEMA_PATH) -> bool:
+    """Create or upgrade the schema unless the database is already at this version.
+
+    Returns True if the schema script and migrations ran.
+    """
+    version = schema_version(schema_path)
+    if await database.fetchval("PRAGMA user_version") == version:
+        return False
+    await database.run_script(schema_path)
+    await apply_migrations(database)
+    await database.execute(f"PRAGMA user_version = {version}")
+    return True
+
+
+async def apply_migrations(database: Database) -> None:
+    for table, column, ddl in COLUMN_MIGRATIONS:
+        columns = {row["name"] for row in await database.fetchall(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            await database.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+    for statement in INDEX_MIGRATIONS:
+        await database.execute(statement)
+    for statement in DATA_MIGRATIONS:
+        await database.execute(statement)
+
+
+__all__ = ["SCHEMA_PATH", "apply_migrations", "prepare_schema", "schema_version"]
@@ -20,7 +20,8 @@ CREATE TABLE IF NOT EXISTS faces (
     title TEXT,
     file_id TEXT,
     file_path TEXT,
-    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    file_unique_id TEXT
 );
 
 CREATE TABLE IF NOT EXISTS sessions (
@@ -32,6 +33,9 @@ CREATE TABLE IF NOT EXISTS sessions (
     result_path TEXT,
     result_file_id TEXT,
     tokens_spent INTEGER,
+    inputs TEXT,
+    recovered_at TEXT,
+    heartbeat_at TEXT,
     created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
     updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
@@ -45,6 +49,9 @@ CREATE TABLE IF NOT EXISTS prompt_generations (
     result_path TEXT,
     result_file_id TEXT,
     tokens_spent INTEGER,
+    inputs TEXT,
+    recovered_at TEXT,
+    heartbeat_at TEXT,
     created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -65,7 +72,233 @@ CREATE TABLE IF NOT EXISTS payments (
     payload TEXT,
     created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
     paid_at TEXT,
-    credited_at TEXT
+    credited_at TEXT,
+    checked_at TEXT,
+    next_check_at TEXT,
+    check_attempts INTEGER NOT NULL DEFAULT 0
 );
 
 CREATE INDEX IF NOT EXISTS idx_payments_user ON payments(user_id);
+
+CREATE TABLE IF NOT EXISTS blobs (
+    path TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    refcount INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_blobs_hash ON blobs(hash);
+CREATE INDEX IF NOT EXISTS idx_faces_file_path ON faces(file_path);
+CREATE INDEX IF NOT EXISTS idx_sessions_result_path ON sessions(result_path);
+CREATE INDEX IF NOT EXISTS idx_prompt_generations_result_path ON prompt_generations(result_path);
+CREATE INDEX IF NOT EXISTS idx_sessions_status_created ON sessions(status, created_at);
+CREATE INDEX IF NOT EXISTS idx_prompt_generations_status_created ON prompt_generations(status, created_at);
+
+-- Per-user storage usage, kept up to date by the triggers below. Sizes come from
+-- `blobs`, so they count stored originals (renditions are not included).
+CREATE TABLE IF NOT EXISTS user_quotas (
+    user_id INTEGER PRIMARY KEY REFERENCES users(telegram_id) ON DELETE CASCADE,
+    face_count INTEGER NOT NULL DEFAULT 0,
+    face_bytes INTEGER NOT NULL DEFAULT 0,
+    generation_count INTEGER NOT NULL DEFAULT 0,
+    generation_bytes INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_faces_quota_insert AFTER INSERT ON faces
+BEGIN
+    INSERT OR IGNORE INTO user_quotas(user_id) VALUES(NEW.user_id);
+    UPDATE user_quotas
+    SET face_count=face_count + 1,
+        face_bytes=face_bytes + COALESCE((SELECT size FROM blobs WHERE path=NEW.file_path), 0),
+        updated_at=CURRENT_TIMESTAMP
+    WHERE user_id=NEW.user_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_faces_quota_update AFTER UPDATE OF file_path ON faces
+WHEN OLD.file_path IS NOT NEW.file_path
+BEGIN
+    UPDATE user_quotas
+    SET face_bytes=MAX(
+            face_bytes
+            + COALESCE((SELECT size FROM blobs WHERE path=NEW.file_path), 0)
+            - COALESCE((SELECT size FROM blobs WHERE path=OLD.file_path), 0),
+            0
+        ),
+        updated_at=CURRENT_TIMESTAMP
+    WHERE user_id=NEW.user_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_faces_quota_delete AFTER DELETE ON faces
+BEGIN
+    UPDATE user_quotas
+    SET face_count=MAX(face_count - 1, 0),
+        face_bytes=MAX(face_bytes - COALESCE((SELECT size FROM blobs WHERE path=OLD.file_path), 0), 0),
+        updated_at=CURRENT_TIMESTAMP
+    WHERE user_id=OLD.user_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_sessions_quota_update AFTER UPDATE OF result_path ON sessions
+WHEN OLD.result_path IS NOT NEW.result_path
+BEGIN
+    INSERT OR IGNORE INTO user_quotas(user_id) VALUES(NEW.user_id);
+    UPDATE user_quotas
+    SET generation_count=MAX(
+            generation_count + (NEW.result_path IS NOT NULL) - (OLD.result_path IS NOT NULL),
+            0
+        ),
+        generation_bytes=MAX(
+            generation_bytes
+            + COALESCE((SELECT size FROM blobs WHERE path=NEW.result_path), 0)
+            - COALESCE((SELECT size FROM blobs WHERE path=OLD.result_path), 0),
+            0
+        ),
+        updated_at=CURRENT_TIMESTAMP
+    WHERE user_id=NEW.user_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_sessions_quota_delete AFTER DELETE ON sessions
+WHEN OLD.result_path IS NOT NULL
+BEGIN
+    UPDATE user_quotas
+    SET generation_count=MAX(generation_count - 1, 0),
+        generation_bytes=MAX(
+            generation_bytes - COALESCE((SELECT size FROM blobs WHERE path=OLD.result_path), 0),
+            0
+        ),
+        updated_at=CURRENT_TIMESTAMP
+    WHERE user_id=OLD.user_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_prompts_quota_update AFTER UPDATE OF result_path ON prompt_generations
+WHEN OLD.result_path IS NOT NEW.result_path
+BEGIN
+    INSERT OR IGNORE INTO user_quotas(user_id) VALUES(NEW.user_id);
+    UPDATE user_quotas
+    SET generation_count=MAX(
+            generation_count + (NEW.result_path IS NOT NULL) - (OLD.result_path IS NOT NULL),
+            0
+        ),
+        generation_bytes=MAX(
+            generation_bytes
+            + COALESCE((SELECT size FROM blobs WHERE path=NEW.result_path), 0)
+            - COALESCE((SELECT size FROM blobs WHERE path=OLD.result_path), 0),
+            0
+        ),
+        updated_at=CURRENT_TIMESTAMP
+    WHERE user_id=NEW.user_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_prompts_quota_delete AFTER DELETE ON prompt_generations
+WHEN OLD.result_path IS NOT NULL
+BEGIN
+    UPDATE user_quotas
+    SET generation_count=MAX(generation_count - 1, 0),
+        generation_bytes=MAX(
+            generation_bytes - COALESCE((SELECT size FROM blobs WHERE path=OLD.result_path), 0),
+            0
+        ),
+        updated_at=CURRENT_TIMESTAMP
+    WHERE user_id=OLD.user_id;
+END;
+
+-- `blobs.refcount`: how many face, session and prompt rows point at the file. The
+-- triggers below keep it current; storage GC only deletes files whose count is 0.
+CREATE TRIGGER IF NOT EXISTS trg_faces_blob_insert AFTER INSERT ON faces
+WHEN NEW.file_path IS NOT NULL
+BEGIN
+    UPDATE blobs SET refcount=refcount + 1 WHERE path=NEW.file_path;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_faces_blob_update AFTER UPDATE OF file_path ON faces
+WHEN OLD.file_path IS NOT NEW.file_path
+BEGIN
+    UPDATE blobs SET refcount=MAX(refcount - 1, 0) WHERE path=OLD.file_path;
+    UPDATE blobs SET refcount=refcount + 1 WHERE path=NEW.file_path;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_faces_blob_delete AFTER DELETE ON faces
+WHEN OLD.file_path IS NOT NULL
+BEGIN
+    UPDATE blobs SET refcount=MAX(refcount - 1, 0) WHERE path=OLD.file_path;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_sessions_blob_insert AFTER INSERT ON sessions
+WHEN NEW.result_path IS NOT NULL
+BEGIN
+    UPDATE blobs SET refcount=refcount + 1 WHERE path=NEW.result_path;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_sessions_blob_update AFTER UPDATE OF result_path ON sessions
+WHEN OLD.result_path IS NOT NEW.result_path
+BEGIN
+    UPDATE blobs SET refcount=MAX(refcount - 1, 0) WHERE path=OLD.result_path;
+    UPDATE blobs SET refcount=refcount + 1 WHERE path=NEW.result_path;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_sessions_blob_delete AFTER DELETE ON sessions
+WHEN OLD.result_path IS NOT NULL
+BEGIN
+    UPDATE blobs SET refcount=MAX(refcount - 1, 0) WHERE path=OLD.result_path;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_prompts_blob_insert AFTER INSERT ON prompt_generations
+WHEN NEW.result_path IS NOT NULL
+BEGIN
+    UPDATE blobs SET refcount=refcount + 1 WHERE path=NEW.result_path;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_prompts_blob_update AFTER UPDATE OF result_path ON prompt_generations
+WHEN OLD.result_path IS NOT NEW.result_path
+BEGIN
+    UPDATE blobs SET refcount=MAX(refcount - 1, 0) WHERE path=OLD.result_path;
+    UPDATE blobs SET refcount=refcount + 1 WHERE path=NEW.result_path;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_prompts_blob_delete AFTER DELETE ON prompt_generations
+WHEN OLD.result_path IS NOT NULL
+BEGIN
+    UPDATE blobs SET refcount=MAX(refcount - 1, 0) WHERE path=OLD.result_path;
+END;
+
+-- Every change of `users.tokens`, written in the same transaction as the balance
+-- itself; `balance_after` is the materialized balance right after the change.
+CREATE TABLE IF NOT EXISTS token_ledger (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(telegram_id) ON DELETE CASCADE,
+    delta INTEGER NOT NULL,
+    balance_after INTEGER NOT NULL,
+    reason TEXT NOT NULL,
+    ref TEXT,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_token_ledger_user ON token_ledger(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_token_ledger_ref ON token_ledger(ref);
+
+-- Tokens reserved for a generation in progress. Held tokens stay in `users.tokens`
+-- but are not available; committing a hold writes the ledger entry.
+CREATE TABLE IF NOT EXISTS token_holds (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(telegram_id) ON DELETE CASCADE,
+    amount INTEGER NOT NULL,
+    reason TEXT NOT NULL,
+    ref TEXT,
+    status TEXT NOT NULL DEFAULT 'held',
+    expires_at TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    settled_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_token_holds_user_status ON token_holds(user_id, status);
+CREATE INDEX IF NOT EXISTS idx_token_holds_status_expires ON token_holds(status, expires_at);
+
+-- aiogram FSM state and data per storage key, shared by all worker processes.
+CREATE TABLE IF NOT EXISTS fsm_states (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL DEFAULT '{}',
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1 @@
+"""Local stand-ins and tooling for offline benchmarking of the bot."""
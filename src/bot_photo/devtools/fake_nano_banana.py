@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import math
+import random
+import struct
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from aiohttp import web
+
+# Small solid-colour PNG used as the base of synthetic results. Padding is added as a
+# private ancillary chunk, so the payload stays a valid image of the requested size.
+_BASE_IMAGE_SIDE = 64
+
+
+@dataclass(slots=True)
+class FakeNanoBananaConfig:
+    latency: str = "lognormal"
+    latency_ms: float = 800.0
+    latency_jitter_ms: float = 400.0
+    guardrail_rate: float = 0.0
+    model_error_rate: float = 0.0
+    server_error_rate: float = 0.0
+    blocked_models: tuple[str, ...] = ()
+    image_bytes: int = 1_500_000
+    image_bytes_jitter: int = 0
+    image_path: Path | None = None
+    seed: int | None = None
+
+
+@dataclass(slots=True)
+class FakeNanoBananaStats:
+    requests: int = 0
+    ok: int = 0
+    guardrail_errors: int = 0
+    model_errors: int = 0
+    server_errors: int = 0
+    bytes_sent: int = 0
+    by_model: dict[str, int] = field(default_factory=dict)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "ok": self.ok,
+            "guardrail_errors": self.guardrail_errors,
+            "model_errors": self.model_errors,
+            "server_errors": self.server_errors,
+            "bytes_sent": self.bytes_sent,
+            "by_model": dict(self.by_model),
+        }
+
+
+class FakeNanoBananaServer:
+    """aiohttp application imitating `/models/{model}:generateContent`.
+
+    Point `NANO_BANANA_BASE_URL` at it to exercise `NanoBananaClient` and the
+    generation handlers without the real upstream.
+    """
+
+    def __init__(self, config: FakeNanoBananaConfig | None = None) -> None:
+        self.config = config or FakeNanoBananaConfig()
+        self.stats = FakeNanoBananaStats()
+        self._random = random.Random(self.config.seed)
+        self._fixed_image = self.config.image_path.read_bytes() if self.config.image_path else None
+        self._image_cache: dict[int, str] = {}
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        for prefix in ("", "/v1beta"):
+            app.router.add_post(f"{prefix}/models/{{model}}:generateContent", self._generate)
+        app.router.add_get("/_stats", self._stats)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8089) -> web.AppRunner:
+        runner = web.AppRunner(self.create_app())
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+    async def _stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats.as_dict())
+
+    async def _generate(self, request: web.Request) -> web.Response:
+        model = request.match_info["model"]
+        payload = await request.json()
+        self.stats.requests += 1
+        self.stats.by_model[model] = self.stats.by_model.get(model, 0) + 1
+        await asyncio.sleep(self._latency_seconds())
+
+        if model in self.config.blocked_models or self._roll(self.config.model_error_rate):
+            self.stats.model_errors += 1
+            return web.json_response(
+                {
+                    "error": {
+                        "code": 404,
+                        "message": f"models/{model} is not found for API version v1beta",
+                        "status": "NOT_FOUND",
+                    }
+                },
+                status=404,
+            )
+        if self._has_inline_data(payload) and self._roll(self.config.guardrail_rate):
+            self.stats.guardrail_errors += 1
+            return web.json_response(
+                {
+                    "error": {
+                        "code": 400,
+                        "message": f"Request blocked by guardrail for model {model}",
+                        "status": "FAILED_PRECONDITION",
+                    }
+                },
+                status=400,
+            )
+        if self._roll(self.config.server_error_rate):
+            self.stats.server_errors += 1
+            return web.json_response(
+                {"error": {"code": 503, "message": "The service is currently unavailable."}},
+                status=503,
+            )
+
+        mime_type, data = self._image_payload()
+        body = {
+            "candidates": [
+                {
+                    "content": {
+                        "role": "model",
+                        "parts": [{"inlineData": {"mimeType": mime_type, "data": data}}],
+                    },
+                    "finishReason": "STOP",
+                }
+            ],
+            "modelVersion": model,
+        }
+        response = web.json_response(body)
+        self.stats.ok += 1
+        self.stats.bytes_sent += len(response.body)
+        return response
+
+    def _latency_seconds(self) -> float:
+        mean = max(self.config.latency_ms, 0.0)
+        jitter = max(self.config.latency_jitter_ms, 0.0)
+        if self.config.latency == "fixed" or mean == 0:
+            value = mean
+        elif self.config.latency == "uniform":
+            value = self._random.uniform(max(mean - jitter, 0.0), mean + jitter)
+        elif self.config.latency == "lognormal":
+            # Parametrised by the desired mean/stddev of the resulting distribution.
+            sigma2 = math.log1p(jitter**2 / mean**2)
+            mu = math.log(mean) - sigma2 / 2
+            value = self._random.lognormvariate(mu, sigma2**0.5)
+        else:
+            raise ValueError(f"Unknown latency distribution: {self.config.latency}")
+        return value / 1000
+
+    def _roll(self, rate: float) -> bool:
+        return rate > 0 and self._random.random() < rate
+
+    @staticmethod
+    def _has_inline_data(payload: dict[str, Any]) -> bool:
+        for content in payload.get("contents") or []:
+            for part in content.get("parts") or []:
+                if "inline_data" in part or "inlineData" in part:
+                    return True
+        return False
+
+    def _image_payload(self) -> tuple[str, str]:
+        if self._fixed_image is not None:
+            mime = "image/png" if self._fixed_image.startswith(b"\x89PNG") else "image/jpeg"
+            return mime, self._encoded(len(self._fixed_image), lambda _: self._fixed_image)
+        size = self.config.image_bytes
+        if self.config.image_bytes_jitter:
+            size += self._random.randint(-self.config.image_bytes_jitter, self.config.image_bytes_jitter)
+        # Bucket sizes to 64 KiB so repeated requests reuse the encoded payload.
+        bucket = max(size, 0) // 65536 * 65536
+        return "image/png", self._encoded(bucket, synthetic_png)
+
+    def _encoded(self, key: int, factory: Any) -> str:
+        cached = self._image_cache.get(key)
+        if cached is None:
+            cached = base64.b64encode(factory(key)).decode("ascii")
+            self._image_cache[key] = cached
+        return cached
+
+
+def synthetic_png(size: int, side: int = _BASE_IMAGE_SIDE) -> bytes:
+    """Return a valid PNG padded to roughly `size` bytes."""
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        crc = zlib.crc32(kind + data) & 0xFFFFFFFF
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", crc)
+
+    row = b"\x00" + bytes((200, 170, 60)) * side
+    header = struct.pack(">IIBBBBB", side, side, 8, 2, 0, 0, 0)
+    image = b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(row * side))
+    padding = size - len(image) - 12 - 12
+    if padding > 0:
+        image += chunk(b"fiLl", bytes(padding))
+    return image + chunk(b"IEND", b"")
+
+
+def _parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Local Nano Banana stand-in for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", choices=("fixed", "uniform", "lognormal"), default="lognormal")
+    parser.add_argument("--latency-ms", type=float, default=800.0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=400.0)
+    parser.add_argument("--guardrail-rate", type=float, default=0.0)
+    parser.add_argument("--model-error-rate", type=float, default=0.0)
+    parser.add_argument("--server-error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--blocked-model",
+        action="append",
+        default=[],
+        help="Model name that always answers with a model error (repeatable)",
+    )
+    parser.add_argument("--image-bytes", type=int, default=1_500_000)
+    parser.add_argument("--image-bytes-jitter", type=int, default=0)
+    parser.add_argument("--image-path", type=Path, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args(argv)
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    server = FakeNanoBananaServer(
+        FakeNanoBananaConfig(
+            latency=args.latency,
+            latency_ms=args.latency_ms,
+            latency_jitter_ms=args.latency_jitter_ms,
+            guardrail_rate=args.guardrail_rate,
+            model_error_rate=args.model_error_rate,
+            server_error_rate=args.server_error_rate,
+            blocked_models=tuple(args.blocked_model),
+            image_bytes=args.image_bytes,
+            image_bytes_jitter=args.image_bytes_jitter,
+            image_path=args.image_path,
+            seed=args.seed,
+        )
+    )
+    runner = await server.start(args.host, args.port)
+    print(f"Fake Nano Banana listening on http://{args.host}:{args.port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_serve(_parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+__all__ = ["FakeNanoBananaConfig", "FakeNanoBananaServer", "FakeNanoBananaStats", "synthetic_png"]
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import itertools
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any
+from xml.sax.saxutils import escape
+
+from aiohttp import web
+
+_MAX_KEYS = 1000
+
+
+@dataclass(slots=True)
+class FakeS3Stats:
+    requests: int = 0
+    puts: int = 0
+    gets: int = 0
+    deletes: int = 0
+    multipart_uploads: int = 0
+    parts: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    by_operation: dict[str, int] = field(default_factory=dict)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "puts": self.puts,
+            "gets": self.gets,
+            "deletes": self.deletes,
+            "multipart_uploads": self.multipart_uploads,
+            "parts": self.parts,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "by_operation": dict(self.by_operation),
+        }
+
+
+@dataclass(slots=True)
+class _Object:
+    data: bytes
+    etag: str
+    modified: float
+
+
+class FakeS3Server:
+    """In-memory, path-style S3 stand-in (MinIO-like) for offline tests.
+
+    Supports PUT/GET/HEAD/DELETE object, ListObjectsV2 and multipart uploads.
+    Requests must carry a SigV4 `Authorization` header but signatures are not
+    verified. `GET /_stats` returns counters as JSON.
+    """
+
+    def __init__(self, latency_ms: float = 0.0) -> None:
+        self.latency_ms = latency_ms
+        self.stats = FakeS3Stats()
+        self.buckets: dict[str, dict[str, _Object]] = {}
+        self._uploads: dict[str, tuple[str, str, dict[int, bytes]]] = {}
+        self._upload_ids = itertools.count(1)
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=1024**3)
+        app.router.add_get("/_stats", self._handle_stats)
+        app.router.add_route("*", "/{bucket}", self._handle_bucket)
+        app.router.add_route("*", "/{bucket}/{key:.+}", self._handle_object)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> web.AppRunner:
+        runner = web.AppRunner(self.create_app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+    async def _handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats.as_dict())
+
+    async def _handle_bucket(self, request: web.Request) -> web.StreamResponse:
+        denied = await self._begin(request, "ListObjectsV2")
+        if denied:
+            return denied
+        if request.method == "PUT":
+            self.buckets.setdefault(request.match_info["bucket"], {})
+            return web.Response()
+        if request.method != "GET":
+            return _error(405, "MethodNotAllowed", request.method)
+        objects = self.buckets.get(request.match_info["bucket"], {})
+        prefix = request.query.get("prefix", "")
+        start_after = request.query.get("continuation-token", "")
+        max_keys = min(int(request.query.get("max-keys", _MAX_KEYS)), _MAX_KEYS)
+        keys = sorted(key for key in objects if key.startswith(prefix) and key > start_after)
+        page, truncated = keys[:max_keys], len(keys) > max_keys
+        contents = "".join(
+            f"<Contents><Key>{escape(key)}</Key>"
+            f"<LastModified>{_isoformat(objects[key].modified)}</LastModified>"
+            f"<ETag>{objects[key].etag}</ETag><Size>{len(objects[key].data)}</Size></Contents>"
+            for key in page
+        )
+        token = f"<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>" if truncated else ""
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            f"<Prefix>{escape(prefix)}</Prefix><KeyCount>{len(page)}</KeyCount>"
+            f"<IsTruncated>{'true' if truncated else 'false'}</IsTruncated>{token}{contents}"
+            "</ListBucketResult>"
+        )
+        return web.Response(body=body.encode(), content_type="application/xml")
+
+    async def _handle_object(self, request: web.Request) -> web.StreamResponse:
+        bucket = self.buckets.setdefault(request.match_info["bucket"], {})
+        key = request.match_info["key"]
+        query = request.query
+        if request.method == "POST" and "uploads" in query:
+            return await self._create_upload(request, bucket, key)
+        if request.method == "PUT" and "uploadId" in query:
+            return await self._upload_part(request)
+        if request.method == "POST" and "uploadId" in query:
+            return await self._complete_upload(request, bucket, key)
+        if request.method == "DELETE" and "uploadId" in query:
+            denied = await self._begin(request, "AbortMultipartUpload")
+            if denied:
+                return denied
+            self._uploads.pop(query["uploadId"], None)
+            return web.Response(status=204)
+        if request.method == "PUT":
+            denied = await self._begin(request, "PutObject")
+            if denied:
+                return denied
+            data = await request.read()
+            bucket[key] = _Object(data, _etag(data), time.time())
+            self.stats.puts += 1
+            self.stats.bytes_in += len(data)
+            return web.Response(headers={"ETag": bucket[key].etag})
+        if request.method in ("GET", "HEAD"):
+            denied = await self._begin(request, "GetObject" if request.method == "GET" else "HeadObject")
+            if denied:
+                return denied
+            stored = bucket.get(key)
+            if stored is None:
+                return _error(404, "NoSuchKey", key, head=request.method == "HEAD")
+            headers = {"ETag": stored.etag, "Last-Modified": _isoformat(stored.modified)}
+            if request.method == "HEAD":
+                return web.Response(headers={**headers, "Content-Length": str(len(stored.data))})
+            self.stats.gets += 1
+            self.stats.bytes_out += len(stored.data)
+            return web.Response(body=stored.data, headers=headers, content_type="application/octet-stream")
+        if request.method == "DELETE":
+            denied = await self._begin(request, "DeleteObject")
+            if denied:
+                return denied
+            if bucket.pop(key, None) is not None:
+                self.stats.deletes += 1
+            return web.Response(status=204)
+        return _error(405, "MethodNotAllowed", request.method)
+
+    async def _create_upload(self, request: web.Request, bucket: dict[str, _Object], key: str) -> web.Response:
+        denied = await self._begin(request, "CreateMultipartUpload")
+        if denied:
+            return denied
+        upload_id = f"upload-{next(self._upload_ids)}"
+        self._uploads[upload_id] = (request.match_info["bucket"], key, {})
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?><InitiateMultipartUploadResult>'
+            f"<Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+        )
+        return web.Response(body=body.encode(), content_type="application/xml")
+
+    async def _upload_part(self, request: web.Request) -> web.Response:
+        denied = await self._begin(request, "UploadPart")
+        if denied:
+            return denied
+        upload = self._uploads.get(request.query["uploadId"])
+        if upload is None:
+            return _error(404, "NoSuchUpload", request.query["uploadId"])
+        data = await request.read()
+        upload[2][int(request.query["partNumber"])] = data
+        self.stats.parts += 1
+        self.stats.bytes_in += len(data)
+        return web.Response(headers={"ETag": _etag(data)})
+
+    async def _complete_upload(self, request: web.Request, bucket: dict[str, _Object], key: str) -> web.Response:
+        denied = await self._begin(request, "CompleteMultipartUpload")
+        if denied:
+            return denied
+        upload = self._uploads.pop(request.query["uploadId"], None)
+        if upload is None:
+            return _error(404, "NoSuchUpload", request.query["uploadId"])
+        numbers = [int(element.text or 0) for element in ET.fromstring(await request.read()).iter("PartNumber")]
+        if not numbers or any(number not in upload[2] for number in numbers):
+            return _error(400, "InvalidPart", key)
+        data = b"".join(upload[2][number] for number in numbers)
+        bucket[key] = _Object(data, f'"{hashlib.md5(data).hexdigest()}-{len(numbers)}"', time.time())
+        self.stats.multipart_uploads += 1
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?><CompleteMultipartUploadResult>'
+            f"<Key>{escape(key)}</Key><ETag>{bucket[key].etag}</ETag></CompleteMultipartUploadResult>"
+        )
+        return web.Response(body=body.encode(), content_type="application/xml")
+
+    async def _begin(self, request: web.Request, operation: str) -> web.Response | None:
+        self.stats.requests += 1
+        self.stats.by_operation[operation] = self.stats.by_operation.get(operation, 0) + 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        if not request.headers.get("Authorization", "").startswith("AWS4-HMAC-SHA256 "):
+            return _error(403, "AccessDenied", "missing SigV4 signature", head=request.method == "HEAD")
+        return None
+
+
+def _etag(data: bytes) -> str:
+    return f'"{hashlib.md5(data).hexdigest()}"'
+
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def _error(status: int, code: str, message: str, head: bool = False) -> web.Response:
+    if head:
+        return web.Response(status=status)
+    body = f"<Error><Code>{code}</Code><Message>{escape(message)}</Message></Error>"
+    return web.Response(status=status, body=body.encode(), content_type="application/xml")
+
+
+def _parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="In-memory S3 stand-in for offline testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9009)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    return parser.parse_args(argv)
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    runner = await FakeS3Server(latency_ms=args.latency_ms).start(args.host, args.port)
+    print(f"Fake S3 listening on http://{args.host}:{args.port} (any bucket, any credentials)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_serve(_parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+__all__ = ["FakeS3Server", "FakeS3Stats"]
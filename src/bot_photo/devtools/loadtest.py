@@ -0,0 +1,588 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncGenerator
+
+from aiogram import Bot, methods
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.base import BaseSession
+from aiogram.enums import ParseMode
+from aiogram.methods.base import TelegramMethod
+from aiogram.types import CallbackQuery, Chat, File, InputFile, Message, PhotoSize, Update, User
+
+from ..cluster import ClusterFront, ignore_stop_signals, prepare_database, run_worker, worker_env
+from ..config import ROOT_DIR, Settings
+from ..main import create_application
+from ..metrics import Histogram, UpdateStats, begin_update, end_update
+from ..services import ExamplesService, StyleRegistry
+from ..services.scheduler import PRIORITY_CLASSES
+from ..utils import get_payments_repo, get_style_registry
+from .fake_nano_banana import FakeNanoBananaConfig, FakeNanoBananaServer, synthetic_png
+from .fake_s3 import FakeS3Server
+
+logger = logging.getLogger(__name__)
+
+@dataclass(slots=True)
+class LoadTestReport:
+    users: int
+    updates: int
+    errors: int
+    wall_seconds: float
+    update_latency: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    handler_latency: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    db_queries: dict[str, list[int]] = field(default_factory=lambda: defaultdict(list))
+    api_calls: dict[str, list[int]] = field(default_factory=lambda: defaultdict(list))
+    error_types: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    queue_wait: dict[str, dict[str, float]] = field(default_factory=dict)
+    bot_calls: int = 0
+    memory_start: int = 0
+    memory_end: int = 0
+    memory_peak: int = 0
+    max_rss_kb: int = 0
+
+    @property
+    def updates_per_second(self) -> float:
+        return self.updates / self.wall_seconds if self.wall_seconds else 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "users": self.users,
+            "updates": self.updates,
+            "errors": self.errors,
+            "wall_seconds": round(self.wall_seconds, 3),
+            "updates_per_second": round(self.updates_per_second, 2),
+            "bot_calls": self.bot_calls,
+            "error_types": dict(self.error_types),
+            "handlers": {
+                name: {
+                    **_percentiles(values),
+                    "db_queries_avg": _mean(self.db_queries.get(name, [])),
+                    "bot_api_calls_avg": _mean(self.api_calls.get(name, [])),
+                }
+                for name, values in sorted(self.handler_latency.items())
+            },
+            "steps": {name: _percentiles(values) for name, values in sorted(self.update_latency.items())},
+            "queue_wait": self.queue_wait,
+            "memory": {
+                "start_bytes": self.memory_start,
+                "end_bytes": self.memory_end,
+                "growth_bytes": self.memory_end - self.memory_start,
+                "peak_bytes": self.memory_peak,
+                "max_rss_kb": self.max_rss_kb,
+            },
+        }
+
+    def format(self) -> str:
+        lines = [
+            f"users={self.users} updates={self.updates} errors={self.errors} "
+            f"wall={self.wall_seconds:.2f}s throughput={self.updates_per_second:.1f} updates/s "
+            f"bot_calls={self.bot_calls}",
+            "",
+            f"{'handler':<44} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'db/upd':>7} {'api/upd':>7}",
+        ]
+        for name, values in sorted(self.handler_latency.items()):
+            stats = _percentiles(values)
+            lines.append(
+                f"{name:<44} {stats['count']:>7} {stats['p50']:>9.1f} {stats['p95']:>9.1f} "
+                f"{stats['p99']:>9.1f} {_mean(self.db_queries.get(name, [])):>7.1f} "
+                f"{_mean(self.api_calls.get(name, [])):>7.1f}"
+            )
+        growth = (self.memory_end - self.memory_start) / 1024
+        if self.queue_wait:
+            lines += ["", f"{'queue wait by class':<44} {'count':>7} {'mean ms':>9} {'p95 <= ms':>9}"]
+            for name, stats in self.queue_wait.items():
+                lines.append(f"{name:<44} {stats['count']:>7} {stats['mean']:>9.1f} {stats['p95']:>9.1f}")
+        lines.append("")
+        for name, count in sorted(self.error_types.items(), key=lambda item: -item[1]):
+            lines.append(f"error {name}: {count}")
+        lines += [
+            f"memory: growth={growth:.1f} KiB peak={self.memory_peak / 1024:.1f} KiB "
+            f"max_rss={self.max_rss_kb / 1024:.1f} MiB",
+        ]
+        return "\n".join(lines)
+
+
+class FakeBotSession(BaseSession):
+    """Bot API session that answers every method locally.
+
+    Uploads are drained from disk so file sends still cost the read, and
+    downloads stream a synthetic image.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, read_uploads: bool = True, download_bytes: int = 200_000) -> None:
+        super().__init__()
+        self._latency = latency_ms / 1000
+        self._read_uploads = read_uploads
+        self._download = synthetic_png(download_bytes)
+        self._message_ids = itertools.count(1_000_000)
+        self.calls: dict[str, int] = defaultdict(int)
+
+    async def close(self) -> None:
+        return None
+
+    async def make_request(
+        self,
+        bot: Bot,
+        method: TelegramMethod[Any],
+        timeout: int | None = None,
+    ) -> Any:
+        name = type(method).__name__
+        self.calls[name] += 1
+        if self._read_uploads:
+            await self._drain_uploads(bot, method)
+        if self._latency:
+            await asyncio.sleep(self._latency)
+
+        if isinstance(method, methods.GetMe):
+            return User(id=bot.id, is_bot=True, first_name="LoadTest", username="loadtest_bot").as_(bot)
+        if isinstance(method, methods.GetFile):
+            return File(
+                file_id=method.file_id,
+                file_unique_id=f"u{method.file_id}",
+                file_size=len(self._download),
+                file_path=f"photos/{method.file_id}.jpg",
+            ).as_(bot)
+        if isinstance(
+            method,
+            (methods.SendMessage, methods.SendPhoto, methods.SendDocument, methods.EditMessageText),
+        ):
+            chat_id = int(getattr(method, "chat_id", None) or 0)
+            return Message(
+                message_id=next(self._message_ids),
+                date=datetime.now(timezone.utc),
+                chat=Chat(id=chat_id, type="private"),
+                text=getattr(method, "text", None),
+            ).as_(bot)
+        return True
+
+    async def stream_content(
+        self,
+        url: str,
+        headers: dict[str, Any] | None = None,
+        timeout: int = 30,
+        chunk_size: int = 65536,
+        raise_for_status: bool = True,
+    ) -> AsyncGenerator[bytes, None]:
+        for offset in range(0, len(self._download), chunk_size):
+            yield self._download[offset : offset + chunk_size]
+
+    async def _drain_uploads(self, bot: Bot, method: TelegramMethod[Any]) -> None:
+        for value in method.model_dump(warnings=False).values():
+            if isinstance(value, InputFile):
+                try:
+                    async for _ in value.read(bot):
+                        pass
+                except FileNotFoundError:
+                    pass
+
+
+class VirtualUser:
+    """Scripted Telegram client walking one user's flows through the dispatcher."""
+
+    def __init__(self, harness: "LoadTestHarness", user_id: int, rng: random.Random) -> None:
+        self._harness = harness
+        self._rng = rng
+        self.user = User(id=user_id, is_bot=False, first_name=f"User{user_id}", username=f"user{user_id}")
+        self.chat = Chat(id=user_id, type="private")
+        self._photos = itertools.count(1)
+
+    async def run(self, flows: int) -> None:
+        await self.onboarding()
+        if self.user.id in self._harness.priority_users:
+            await self._harness.grant_priority(self.user.id)
+        scenarios = [
+            (self.photosession, 3),
+            (self.prompt_generation, 3),
+            (self.history, 2),
+            (self.payment, 1),
+        ]
+        for _ in range(flows):
+            flow = self._rng.choices([s for s, _ in scenarios], weights=[w for _, w in scenarios])[0]
+            await flow()
+
+    async def onboarding(self) -> None:
+        await self.send_text("start", "/start")
+        await self.press("agreement", "agreement:accept")
+
+    async def photosession(self) -> None:
+        await self.press("new_session", "menu:new_session")
+        await self.press("style", f"style:{self._rng.choice(self._harness.styles)}")
+        await self.send_photo("face_photo")
+        await self.send_text("face_name", "-")
+        if self._rng.random() < 0.5:
+            await self.press("generate_default", "prompt:default")
+        else:
+            await self.send_text("generate_prompt", "golden hour portrait, linen shirt")
+
+    async def prompt_generation(self) -> None:
+        await self.press("prompt_home", "menu:prompt")
+        await self.press("prompt_face", "prompt:face:skip")
+        await self.send_text("prompt_text", "surreal city made of glass at dawn")
+
+    async def history(self) -> None:
+        await self.press("history", "menu:history")
+        await self.press("share", "session:share")
+
+    async def payment(self) -> None:
+        await self.press("profile", "menu:profile")
+        await self.press("topup", "profile:topup")
+        await self.press("packages", "payment:crypto")
+        await self.press("package", "payment:pkg:ego")
+        await self.press("sbp", "payment:sbp")
+
+    async def send_text(self, step: str, text: str) -> None:
+        await self._harness.feed(step, message=self._message(text=text))
+
+    async def send_photo(self, step: str) -> None:
+        file_id = f"face-{self.user.id}-{next(self._photos)}"
+        photo = [PhotoSize(file_id=file_id, file_unique_id=f"u{file_id}", width=1024, height=1024)]
+        await self._harness.feed(step, message=self._message(photo=photo))
+
+    async def press(self, step: str, data: str) -> None:
+        callback = CallbackQuery(
+            id=f"{self.user.id}-{time.perf_counter_ns()}",
+            from_user=self.user,
+            chat_instance=str(self.chat.id),
+            data=data,
+            message=self._message(text="menu", from_bot=True),
+        )
+        await self._harness.feed(step, callback_query=callback)
+
+    def _message(self, text: str | None = None, photo: list[PhotoSize] | None = None, from_bot: bool = False) -> Message:
+        return Message(
+            message_id=self._harness.next_message_id(),
+            date=datetime.now(timezone.utc),
+            chat=self.chat,
+            from_user=None if from_bot else self.user,
+            text=text,
+            photo=photo,
+        )
+
+
+class LoadTestHarness:
+    """Replays synthetic updates through the real dispatcher, routers and middleware.
+
+    With `workers` set, updates go through a cluster front to that many worker
+    processes instead; only end-to-end update latencies are reported then.
+    """
+
+    def __init__(
+        self,
+        *,
+        users: int,
+        flows: int,
+        concurrency: int,
+        workdir: Path,
+        fake_config: FakeNanoBananaConfig,
+        bot_latency_ms: float,
+        seed: int | None,
+        trace_memory: bool = False,
+        storage_backend: str = "local",
+        workers: int = 0,
+        priority_share: float = 0.0,
+    ) -> None:
+        self._users = users
+        self._flows = flows
+        self._concurrency = concurrency
+        self._workdir = workdir
+        self._fake_config = fake_config
+        self._bot_latency_ms = bot_latency_ms
+        self._rng = random.Random(seed)
+        self._trace_memory = trace_memory
+        self._storage_backend = storage_backend
+        self._workers = workers
+        user_ids = [100_000 + index for index in range(users)]
+        # Users who bought a priority package; only honoured in single-process runs.
+        self.priority_users = set(self._rng.sample(user_ids, round(users * priority_share)))
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._report = LoadTestReport(users=users, updates=0, errors=0, wall_seconds=0.0)
+        self.styles: list[str] = ["cinematic"]
+        self._bot: Bot | None = None
+        self._dispatcher: Any = None
+        self._front: ClusterFront | None = None
+
+    def next_message_id(self) -> int:
+        return next(self._message_ids)
+
+    async def run(self) -> LoadTestReport:
+        fake = FakeNanoBananaServer(self._fake_config)
+        runner = await fake.start("127.0.0.1", 0)
+        host, port = runner.addresses[0][:2]
+        storage_settings: dict[str, Any] = {}
+        s3_runner = None
+        if self._storage_backend == "s3":
+            s3_runner = await FakeS3Server().start("127.0.0.1", 0)
+            s3_host, s3_port = s3_runner.addresses[0][:2]
+            storage_settings = {
+                "STORAGE_BACKEND": "s3",
+                "S3_ENDPOINT_URL": f"http://{s3_host}:{s3_port}",
+                "S3_BUCKET": "loadtest",
+            }
+        values = {
+            "TELEGRAM_BOT_TOKEN": "123456:LOADTEST",
+            "CRYPTO_BOT_TOKEN": "1:LOADTEST",
+            "NANO_BANANA_API_KEY": "loadtest",
+            "NANO_BANANA_BASE_URL": f"http://{host}:{port}",
+            "DATABASE_PATH": (self._workdir / "app.db").as_posix(),
+            "FACES_PATH": (self._workdir / "faces").as_posix(),
+            "SESSIONS_PATH": (self._workdir / "sessions").as_posix(),
+            "EXAMPLES_PATH": (ROOT_DIR / "repo" / "examples").as_posix(),
+            "STARTING_TOKENS": "1000000",
+            "ADMIN_IDS": "",
+            **storage_settings,
+        }
+        settings = Settings(_env_file=None, **values)
+        if self._workers:
+            try:
+                return await self._run_cluster(settings, values)
+            finally:
+                await runner.cleanup()
+                if s3_runner:
+                    await s3_runner.cleanup()
+        app = await create_application(settings)
+        self._dispatcher = app.dispatcher
+        session = FakeBotSession(latency_ms=self._bot_latency_ms)
+        self._bot = Bot(
+            settings.bot_token,
+            session=session,
+            default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+        )
+        app.instrument_bot(self._bot)
+        self.styles = [key for key, _ in get_style_registry(None).choices()]
+
+        if self._trace_memory:
+            tracemalloc.start()
+        self._report.memory_start = self._memory()[0]
+        semaphore = asyncio.Semaphore(self._concurrency)
+
+        async def _run_user(user_id: int) -> None:
+            async with semaphore:
+                await VirtualUser(self, user_id, random.Random(self._rng.random())).run(self._flows)
+
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(*(_run_user(100_000 + index) for index in range(self._users)))
+        finally:
+            self._report.wall_seconds = time.perf_counter() - started
+            self._report.memory_end, self._report.memory_peak = self._memory()
+            if self._trace_memory:
+                tracemalloc.stop()
+            self._report.max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self._report.bot_calls = sum(session.calls.values())
+            self._report.queue_wait = _queue_wait(app.metrics.get("generation_queue_wait_seconds"))
+            await app.close()
+            await self._bot.session.close()
+            await runner.cleanup()
+            if s3_runner:
+                await s3_runner.cleanup()
+        return self._report
+
+    async def _run_cluster(self, settings: Settings, values: dict[str, str]) -> LoadTestReport:
+        await prepare_database(settings)
+        examples = ExamplesService(settings.examples_path)
+        examples.load()
+        styles = StyleRegistry(settings.styles_path, examples)
+        styles.load()
+        self.styles = [key for key, _ in styles.choices()]
+        command = [sys.executable, "-m", "src.bot_photo.devtools.loadtest", "--workers", str(self._workers)]
+        command += ["--bot-latency-ms", str(self._bot_latency_ms)]
+        # Collections read from the environment are parsed as JSON.
+        env = {**os.environ, **values, "ADMIN_IDS": "[]"}
+        self._front = ClusterFront(
+            self._workers,
+            lambda index: [*command, "--worker", str(index)],
+            lambda index: worker_env(settings, index, self._workers, base=env),
+        )
+        await self._front.start()
+        semaphore = asyncio.Semaphore(self._concurrency)
+
+        async def _run_user(user_id: int) -> None:
+            async with semaphore:
+                await VirtualUser(self, user_id, random.Random(self._rng.random())).run(self._flows)
+
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(*(_run_user(100_000 + index) for index in range(self._users)))
+        finally:
+            self._report.wall_seconds = time.perf_counter() - started
+            await self._front.close()
+            self._report.max_rss_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        return self._report
+
+    async def grant_priority(self, user_id: int) -> None:
+        """Record a credited purchase of the smallest priority package."""
+        if self._front:
+            return
+        payments = get_payments_repo(None)
+        await payments.save_invoice(invoice_id=user_id, user_id=user_id, amount_usdt=22.0, tokens=250, status="paid")
+        await payments.claim_credit(user_id)
+
+    async def feed(self, step: str, **payload: Any) -> None:
+        if self._front:
+            await self._feed_cluster(step, Update(update_id=next(self._update_ids), **payload))
+            return
+        assert self._bot is not None
+        # Mount nested objects to the bot up front, as polling does, so the
+        # dispatcher does not pay the JSON round-trip inside the timed section.
+        update = Update.model_validate(
+            Update(update_id=next(self._update_ids), **payload).model_dump(),
+            context={"bot": self._bot},
+        )
+        # The metrics middlewares fill in these stats for the update.
+        stats = UpdateStats()
+        token = begin_update(stats)
+        started = time.perf_counter()
+        try:
+            await self._dispatcher.feed_update(self._bot, update)
+        except Exception as exc:
+            self._report.errors += 1
+            self._report.error_types[f"{type(exc).__name__}: {exc}"[:120]] += 1
+            logger.debug("Update %s (%s) failed", update.update_id, step, exc_info=True)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            end_update(token)
+            self._report.updates += 1
+            self._report.update_latency[step].append(elapsed)
+            if stats.handler:
+                key = f"{stats.router}.{stats.handler}"
+                self._report.handler_latency[key].append(stats.handler_seconds * 1000)
+            else:
+                key = f"unhandled:{step}"
+                self._report.handler_latency[key].append(elapsed)
+            self._report.db_queries[key].append(stats.db_queries)
+            self._report.api_calls[key].append(stats.bot_calls)
+
+    async def _feed_cluster(self, step: str, update: Update) -> None:
+        started = time.perf_counter()
+        ok = await self._front.dispatch(update)
+        elapsed = (time.perf_counter() - started) * 1000
+        self._report.updates += 1
+        self._report.update_latency[step].append(elapsed)
+        self._report.handler_latency[f"worker:{step}"].append(elapsed)
+        if not ok:
+            self._report.errors += 1
+            self._report.error_types["worker reported a failure"] += 1
+
+    def _memory(self) -> tuple[int, int]:
+        """Current and peak memory: Python allocations with tracemalloc, RSS otherwise."""
+        if self._trace_memory:
+            return tracemalloc.get_traced_memory()
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        try:
+            pages = int(Path("/proc/self/statm").read_text().split()[1])
+            return pages * resource.getpagesize(), peak
+        except (OSError, IndexError, ValueError):
+            return peak, peak
+
+
+def _percentiles(values: list[float]) -> dict[str, Any]:
+    if not values:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0}
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return {"count": 1, "p50": ordered[0], "p95": ordered[0], "p99": ordered[0]}
+    cuts = statistics.quantiles(ordered, n=100, method="inclusive")
+    return {"count": len(ordered), "p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+def _queue_wait(histogram: Any) -> dict[str, dict[str, float]]:
+    if not isinstance(histogram, Histogram):
+        return {}
+    return {
+        name: {
+            "count": histogram.count(priority=name),
+            "mean": histogram.mean(priority=name) * 1000,
+            "p95": histogram.quantile(0.95, priority=name) * 1000,
+        }
+        for name in PRIORITY_CLASSES
+        if histogram.count(priority=name)
+    }
+
+
+def _mean(values: list[int]) -> float:
+    return sum(values) / len(values) if values else 0.0
+
+
+def _parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay synthetic Telegram updates through the bot")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--flows", type=int, default=3, help="Flows per user after onboarding")
+    parser.add_argument("--concurrency", type=int, default=100, help="Users active at once")
+    parser.add_argument("--model-latency-ms", type=float, default=300.0)
+    parser.add_argument("--model-latency-jitter-ms", type=float, default=150.0)
+    parser.add_argument("--model-error-rate", type=float, default=0.0)
+    parser.add_argument("--guardrail-rate", type=float, default=0.0)
+    parser.add_argument("--image-bytes", type=int, default=1_500_000)
+    parser.add_argument("--bot-latency-ms", type=float, default=0.0)
+    parser.add_argument("--workdir", type=Path, default=None, help="Keep the SQLite file and storage here")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--storage", choices=("local", "s3"), default="local", help="Storage backend (s3 uses a fake)")
+    parser.add_argument("--tracemalloc", action="store_true", help="Track Python allocations (slow)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--workers", type=int, default=0, help="Run the bot as a cluster of this many worker processes")
+    parser.add_argument("--worker", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument(
+        "--priority-share", type=float, default=0.0, help="Share of users with a priority package purchase"
+    )
+    return parser.parse_args(argv)
+
+
+async def _main(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory(prefix="bot-photo-loadtest-") as tmp:
+        harness = LoadTestHarness(
+            users=args.users,
+            flows=args.flows,
+            concurrency=args.concurrency,
+            workdir=args.workdir or Path(tmp),
+            fake_config=FakeNanoBananaConfig(
+                latency_ms=args.model_latency_ms,
+                latency_jitter_ms=args.model_latency_jitter_ms,
+                model_error_rate=args.model_error_rate,
+                guardrail_rate=args.guardrail_rate,
+                image_bytes=args.image_bytes,
+                seed=args.seed,
+            ),
+            bot_latency_ms=args.bot_latency_ms,
+            seed=args.seed,
+            trace_memory=args.tracemalloc,
+            storage_backend=args.storage,
+            workers=args.workers,
+            priority_share=args.priority_share,
+        )
+        report = await harness.run()
+    print(json.dumps(report.as_dict(), indent=2, ensure_ascii=False) if args.json else report.format())
+
+
+def _worker_main(args: argparse.Namespace) -> None:
+    """Cluster worker of the load test: the real worker loop with a local Bot API session."""
+    ignore_stop_signals()
+    settings = Settings(_env_file=None)
+    asyncio.run(run_worker(args.worker, args.workers, settings, session=FakeBotSession(latency_ms=args.bot_latency_ms)))
+
+
+if __name__ == "__main__":
+    _args = _parse_args()
+    if _args.worker is None:
+        asyncio.run(_main(_args))
+    else:
+        _worker_main(_args)
+
+
+__all__ = ["FakeBotSession", "LoadTestHarness", "LoadTestReport", "VirtualUser"]
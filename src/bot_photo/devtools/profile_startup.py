@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+
+from ..config import ROOT_DIR
+
+DEFAULT_MODULE = "src.bot_photo.main"
+
+
+@dataclass(slots=True)
+class ImportRecord:
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+def profile_imports(module: str = DEFAULT_MODULE) -> list[ImportRecord]:
+    """Import `module` in a fresh interpreter under `-X importtime` and parse the report."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=ROOT_DIR,
+        check=False,
+    )
+    records = parse_importtime(result.stderr)
+    if result.returncode != 0:
+        tail = "\n".join(line for line in result.stderr.splitlines() if not line.startswith("import time:"))
+        raise RuntimeError(f"Importing {module} failed:\n{tail}")
+    return records
+
+
+def parse_importtime(output: str) -> list[ImportRecord]:
+    records: list[ImportRecord] = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # the header line
+        records.append(ImportRecord(module=fields[2].strip(), self_us=int(fields[0]), cumulative_us=int(fields[1])))
+    return records
+
+
+def by_package(records: list[ImportRecord]) -> dict[str, int]:
+    """Self time per top-level package (`src.bot_photo` counts as one)."""
+    totals: dict[str, int] = defaultdict(int)
+    for record in records:
+        parts = record.module.split(".")
+        package = ".".join(parts[:2]) if parts[0] == "src" else parts[0]
+        totals[package] += record.self_us
+    return dict(totals)
+
+
+async def profile_application(workdir: Path) -> tuple[float, float, float]:
+    """Time `create_application` on a fresh database, then schema preparation on the migrated one.
+
+    Routers can only be attached once per process, so the second pass times just
+    `prepare_schema`, the step that differs between a first boot and a restart.
+    """
+    from ..config import Settings
+    from ..db import Database, prepare_schema
+    from ..main import create_application
+
+    settings = Settings(
+        _env_file=None,
+        TELEGRAM_BOT_TOKEN="123456:PROFILE",
+        CRYPTO_BOT_TOKEN="1:PROFILE",
+        NANO_BANANA_API_KEY="profile",
+        DATABASE_PATH=workdir / "app.db",
+        FACES_PATH=workdir / "faces",
+        SESSIONS_PATH=workdir / "sessions",
+        EXAMPLES_PATH=ROOT_DIR / "repo" / "examples",
+    )
+    started = time.perf_counter()
+    app = await create_application(settings)
+    created = time.perf_counter() - started
+    await app.close()
+
+    timings: list[float] = []
+    for _ in range(2):
+        database = Database(settings.database_path)
+        await database.connect()
+        if timings:
+            # Force the full schema script and migrations, as on an upgrade.
+            await database.execute("PRAGMA user_version = 0")
+        started = time.perf_counter()
+        await prepare_schema(database)
+        timings.append(time.perf_counter() - started)
+        await database.close()
+    return created, timings[0], timings[1]
+
+
+def _print_imports(records: list[ImportRecord], top: int) -> None:
+    root = max(records, key=lambda record: record.cumulative_us)
+    print(f"import {root.module}: {root.cumulative_us / 1000:.1f} ms, {len(records)} modules")
+    print()
+    print(f"{'package':<40} {'self ms':>10}")
+    for package, self_us in sorted(by_package(records).items(), key=lambda item: -item[1])[:top]:
+        print(f"{package:<40} {self_us / 1000:>10.1f}")
+    print()
+    print(f"{'module':<60} {'self ms':>10} {'cumul ms':>10}")
+    for record in sorted(records, key=lambda record: -record.self_us)[:top]:
+        print(f"{record.module:<60} {record.self_us / 1000:>10.1f} {record.cumulative_us / 1000:>10.1f}")
+
+
+def _parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Report where the bot spends its cold start")
+    parser.add_argument("--module", default=DEFAULT_MODULE, help="Module to import in a fresh interpreter")
+    parser.add_argument("--top", type=int, default=20, help="Rows per table")
+    parser.add_argument("--no-app", action="store_true", help="Skip timing create_application")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = _parse_args(argv)
+    _print_imports(profile_imports(args.module), args.top)
+    if args.no_app:
+        return
+    with tempfile.TemporaryDirectory(prefix="bot-photo-startup-") as tmp:
+        created, current, migrated = asyncio.run(profile_application(Path(tmp)))
+    print()
+    print(f"create_application (new database): {created * 1000:.1f} ms")
+    print(f"prepare_schema: {current * 1000:.1f} ms when up to date, {migrated * 1000:.1f} ms when migrating")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,7 @@ from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 
 from ..keyboards import admin_cancel_keyboard, admin_main_keyboard, admin_manage_user_keyboard
-from ..models import AdminState, User
+from ..models import AdminState, LedgerReason, User
 from ..utils import get_database, get_settings, get_token_service, get_users_repo
 
 router = Router(name="admin")
@@ -63,7 +63,9 @@ async def admin_examples_hint(callback: types.CallbackQuery, user: User) -> None
     if not user.is_admin:
         await callback.answer("Нет доступа", show_alert=True)
         return
-    await callback.message.answer("Загрузи файлы в repo/examples и обнови manifest.json.")
+    await callback.message.answer(
+        "Загрузи файлы в repo/examples и обнови manifest.json — бот подхватит изменения без перезапуска."
+    )
     await callback.answer()
 
 
@@ -127,7 +129,14 @@ async def admin_give_tokens_amount(message: types.Message, state: FSMContext, us
             return
         
         token_service = get_token_service(message.bot)
-        await token_service.add(target_user_id, amount)
+        try:
+            await token_service.add(
+                target_user_id, amount, LedgerReason.ADMIN_GRANT, f"admin:{user.telegram_id}"
+            )
+        except LookupError:
+            await message.answer(f"Пользователь <code>{target_user_id}</code> не найден.")
+            await state.clear()
+            return
         
         await message.answer(f"Начислено {amount} токенов пользователю <code>{target_user_id}</code>.")
         await state.clear()
@@ -246,6 +255,31 @@ async def command_unban(message: types.Message, user: User) -> None:
 # endregion
 
 
+# region Token ledger
+@router.message(Command("ledger"))
+async def command_ledger(message: types.Message, user: User) -> None:
+    if not user.is_admin:
+        await message.answer("Недоступно")
+        return
+    parts = message.text.split()
+    if len(parts) != 2 or not parts[1].lstrip("-").isdigit():
+        await message.answer("Использование: /ledger <code>&lt;user_id&gt;</code>")
+        return
+    target = int(parts[1])
+    token_service = get_token_service(message.bot)
+    entries = await token_service.history(target, limit=20)
+    if not entries:
+        await message.answer(f"У пользователя <code>{target}</code> нет операций с токенами.")
+        return
+    lines = [f"🧾 Операции <code>{target}</code> (последние {len(entries)}):"]
+    for entry in entries:
+        when = entry.created_at.strftime("%d.%m %H:%M") if entry.created_at else "-"
+        ref = f" <code>{entry.ref}</code>" if entry.ref else ""
+        lines.append(f"{when} {entry.delta:+d} → {entry.balance_after} · {entry.reason}{ref}")
+    await message.answer("\n".join(lines))
+# endregion
+
+
 # region Cancel
 @router.callback_query(F.data == "admin:cancel", AdminState()) # Listen to all AdminStates
 async def admin_cancel(callback: types.CallbackQuery, state: FSMContext, user: User) -> None:
@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 from aiogram import Router, types
-from aiogram.types import FSInputFile
 
 from ..keyboards import main_menu_keyboard
 from ..utils import get_examples_service, get_settings, get_users_repo
@@ -26,10 +25,9 @@ async def show_examples(callback: types.CallbackQuery) -> None:
     await callback.answer("Показываю стили…", show_alert=False)
     shown_any = False
     for example in examples:
-        if not example.file_path.exists():
+        if not example.available:
             continue
         shown_any = True
-        input_file = FSInputFile(example.file_path)
         caption = f"{example.title}\n{example.caption}\n\nНажми «Давай так же!»"
         keyboard = types.InlineKeyboardMarkup(
             inline_keyboard=[
@@ -40,11 +38,13 @@ async def show_examples(callback: types.CallbackQuery) -> None:
                 ]
             ]
         )
-        await callback.message.answer_photo(
-            input_file,
+        sent = await callback.message.answer_photo(
+            examples_service.photo(example),
             caption=caption,
             reply_markup=keyboard,
         )
+        if sent.photo:
+            examples_service.remember_file_id(example, sent.photo[-1].file_id)
     await get_users_repo(bot).set_demo_viewed(callback.from_user.id)
     if not shown_any:
         await callback.message.answer(
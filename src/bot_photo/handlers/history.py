@@ -4,8 +4,8 @@ from aiogram import F, Router, types
 from aiogram.types import FSInputFile, InlineKeyboardButton, InlineKeyboardMarkup
 
 from ..keyboards import main_menu_keyboard
-from ..utils import get_prompt_repo, get_sessions_repo, get_settings
-from .sessions import STYLE_LABELS
+from ..storage import PREVIEW
+from ..utils import get_file_storage, get_prompt_repo, get_sessions_repo, get_settings, get_style_registry
 
 router = Router(name="history")
 
@@ -27,9 +27,11 @@ async def show_history(callback: types.CallbackQuery) -> None:
         return
     await callback.answer()
     if sessions:
+        storage = get_file_storage(callback.message.bot)
+        styles = get_style_registry(callback.message.bot)
         await callback.message.answer("Недавние фотосессии:")
         for session in sessions:
-            style_label = STYLE_LABELS.get(session.style, session.style)
+            style_label = styles.label(session.style)
             caption = f"{style_label} — {session.status}"
             keyboard = InlineKeyboardMarkup(
                 inline_keyboard=[
@@ -41,7 +43,15 @@ async def show_history(callback: types.CallbackQuery) -> None:
                     ]
                 ]
             )
-            await callback.message.answer(caption, reply_markup=keyboard)
+            # Small preview in the listing; the full image is sent on "Открыть фото". A preview
+            # still rendering is not waited for: the original goes out and the cache fills behind.
+            preview = (
+                await storage.rendition(session.result_path, PREVIEW.name, wait=False) if session.result_path else None
+            )
+            if preview:
+                await callback.message.answer_photo(FSInputFile(preview), caption=caption, reply_markup=keyboard)
+            else:
+                await callback.message.answer(caption, reply_markup=keyboard)
     if prompts:
         lines = ["Недавние prompt-запросы:"]
         for record in prompts:
@@ -60,9 +70,13 @@ async def open_history_session(callback: types.CallbackQuery) -> None:
     if not session.result_path:
         await callback.answer("Для этой съёмки нет результата.", show_alert=True)
         return
-    style_label = STYLE_LABELS.get(session.style, session.style)
+    result = await get_file_storage(callback.message.bot).materialize(session.result_path)
+    if not result:
+        await callback.answer("Файл этой съёмки больше недоступен.", show_alert=True)
+        return
+    style_label = get_style_registry(callback.message.bot).label(session.style)
     await callback.message.answer_photo(
-        FSInputFile(session.result_path),
+        FSInputFile(result),
         caption=f"{style_label} — готово",
     )
     await callback.answer()
@@ -5,9 +5,15 @@ from dataclasses import dataclass
 
 from aiogram import Router, types
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from aiocryptopay.exceptions import CryptoPayAPIError
 
-from ..utils import get_crypto_pay_service, get_payments_repo, get_token_service, get_settings
+from ..services.invoice_poller import invoice_status
+from ..utils import (
+    get_crypto_pay_service,
+    get_invoice_poller,
+    get_payments_repo,
+    get_settings,
+    get_token_service,
+)
 
 router = Router(name="payment")
 
@@ -160,6 +166,8 @@ async def payment_crypto_create(callback: types.CallbackQuery) -> None:
     crypto_amount = round(pkg.price_rub / settings.crypto_rub_rate, 2)
     crypto_service = get_crypto_pay_service(callback.message.bot)
     payments_repo = get_payments_repo(callback.message.bot)
+    # Loaded on first use, like the Crypto Pay client itself.
+    from aiocryptopay.exceptions import CryptoPayAPIError
 
     try:
         payload = f"user:{callback.from_user.id}|tokens:{pkg.tokens}|pkg:{pkg.code}"
@@ -212,14 +220,20 @@ async def payment_check(callback: types.CallbackQuery) -> None:
     crypto_service = get_crypto_pay_service(callback.message.bot)
     payments_repo = get_payments_repo(callback.message.bot)
     token_service = get_token_service(callback.message.bot)
+    poller = get_invoice_poller(callback.message.bot)
 
     try:
+        payment = await payments_repo.get(invoice_id)
+        if payment and payment.status == "credited":
+            # Already settled (possibly by the background poller): no API call needed.
+            await _show_credited(callback, await token_service.balance(callback.from_user.id))
+            return
+
         invoice = await crypto_service.get_invoice(invoice_id)
         if not invoice:
             await callback.answer("Счёт не найден.", show_alert=True)
             return
 
-        payment = await payments_repo.get(invoice_id)
         tokens = payment.tokens if payment else None
         if tokens is None:
             tokens = _tokens_from_payload(invoice.payload)
@@ -238,34 +252,38 @@ async def payment_check(callback: types.CallbackQuery) -> None:
             paid_at=invoice.paid_at,
         )
 
-        status = str(invoice.status).lower()
-        if status == "paid":
-            already_credited = payment.status == "credited" if payment else False
-            if not already_credited:
-                new_balance = await token_service.add(callback.from_user.id, tokens)
-                updated = await payments_repo.mark_credited(invoice_id)
-                credited_tokens = updated.tokens if updated else tokens
-                text = (
-                    "<b>Оплата прошла ✅</b>\n\n"
-                    f"Зачислено: {credited_tokens} токенов\n"
-                    f"Баланс: {new_balance} токенов"
-                )
-            else:
-                balance = await token_service.balance(callback.from_user.id)
-                text = (
-                    "<b>Оплата уже зачислена</b>\n\n"
-                    f"Баланс: {balance} токенов"
-                )
-
-            keyboard = InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [InlineKeyboardButton(text="⬅️ В профиль", callback_data="menu:profile")],
-                    [InlineKeyboardButton(text="🏠 В меню", callback_data="menu:home")],
-                ]
+        if invoice_status(invoice) == "paid":
+            result = await poller.credit(invoice_id, invoice.paid_at)
+            if result is None:
+                await _show_credited(callback, await token_service.balance(callback.from_user.id))
+                return
+            _, new_balance = result
+            text = (
+                "<b>Оплата прошла ✅</b>\n\n"
+                f"Зачислено: {tokens} токенов\n"
+                f"Баланс: {new_balance} токенов"
             )
-            await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+            await callback.message.edit_text(text, reply_markup=_paid_keyboard(), parse_mode="HTML")
             await callback.answer()
         else:
             await callback.answer(f"Статус счёта: {invoice.status}", show_alert=True)
     except Exception as exc:
         await callback.answer(f"Ошибка при проверке оплаты: {exc}", show_alert=True)
+
+
+def _paid_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="⬅️ В профиль", callback_data="menu:profile")],
+            [InlineKeyboardButton(text="🏠 В меню", callback_data="menu:home")],
+        ]
+    )
+
+
+async def _show_credited(callback: types.CallbackQuery, balance: int) -> None:
+    text = (
+        "<b>Оплата уже зачислена</b>\n\n"
+        f"Баланс: {balance} токенов"
+    )
+    await callback.message.edit_text(text, reply_markup=_paid_keyboard(), parse_mode="HTML")
+    await callback.answer()
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from aiogram import Router, types
 
-from ..utils import get_faces_repo, get_settings, get_users_repo
+from ..utils import get_faces_repo, get_quota_service, get_settings, get_users_repo
 
 router = Router(name="profile")
 
@@ -10,7 +10,6 @@ router = Router(name="profile")
 @router.callback_query(lambda c: c.data == "menu:profile")
 async def open_profile(callback: types.CallbackQuery) -> None:
     users_repo = get_users_repo(callback.message.bot)
-    faces_repo = get_faces_repo(callback.message.bot)
     user = await users_repo.get_by_id(callback.from_user.id)
     if not user:
         settings = get_settings(callback.message.bot)
@@ -22,7 +21,9 @@ async def open_profile(callback: types.CallbackQuery) -> None:
             starting_tokens=settings.starting_tokens,
             hourly_limit=settings.hourly_limit,
         )
-    faces = await faces_repo.list_faces(callback.from_user.id)
+    quotas = get_quota_service(callback.message.bot)
+    usage = await quotas.usage(callback.from_user.id)
+    face_limit = quotas.max_faces if quotas.max_faces > 0 else "∞"
     tokens = user.tokens if user else 0
     registered = user.last_seen_at.strftime("%d.%m.%Y") if user and user.last_seen_at else "-"
     text = (
@@ -31,7 +32,8 @@ async def open_profile(callback: types.CallbackQuery) -> None:
         f"🙋 Имя: {callback.from_user.full_name or callback.from_user.username or '-'}\n"
         f"💎 Баланс: {tokens} токенов\n"
         f"📅 Зарегистрирован: {registered}\n"
-        f"🖼️ Лиц сохранено: {len(faces)} / 10\n"
+        f"🖼️ Лиц сохранено: {usage.face_count} / {face_limit}\n"
+        f"💾 Занято: {_format_megabytes(usage.total_bytes)}\n"
         "ℹ️ Тариф: 5 токенов = 1 фото."
     )
     keyboard = types.InlineKeyboardMarkup(
@@ -45,6 +47,10 @@ async def open_profile(callback: types.CallbackQuery) -> None:
     await callback.answer()
 
 
+def _format_megabytes(size: int) -> str:
+    return f"{size / (1024 * 1024):.1f} МБ"
+
+
 @router.callback_query(lambda c: c.data == "profile:topup")
 async def profile_topup(callback: types.CallbackQuery) -> None:
     await callback.message.edit_text(
@@ -1,8 +1,8 @@
 from __future__ import annotations
 
-import base64
+import asyncio
 import logging
-from pathlib import Path
+from contextlib import suppress
 from typing import Any
 
 from aiogram import F, Router, types
@@ -10,13 +10,25 @@ from aiogram.fsm.context import FSMContext
 from aiogram.types import FSInputFile
 
 from ..keyboards import main_menu_keyboard, prompt_templates_keyboard, sessions_keyboard
-from ..models import PromptState
-from ..services.nano_banana import NanoBananaAPIError
+from ..models import LedgerReason, PromptState
+from ..services import InsufficientTokensError
+from ..services.inflight import BUSY_TEXT, user_tier
+from ..services.nano_banana import NanoBananaAPIError, extract_image
+from ..services.scheduler import position_updater
+from ..services.shutdown import INTERRUPTED_TEXT
+from ..storage import TELEGRAM
 from ..utils import (
+    get_database,
+    get_face_materializer,
     get_file_storage,
     get_faces_repo,
     get_generation_client,
+    get_generation_heartbeat,
+    get_generation_scheduler,
+    get_inflight_registry,
+    get_priority_classifier,
     get_prompt_repo,
+    get_quota_service,
     get_settings,
     get_token_service,
     get_users_repo,
@@ -89,50 +101,78 @@ async def _start_prompt_generation(
             await message.answer("Аккаунт заблокирован.")
             return
 
-        cost = settings.cost_per_prompt
-        balance_before = await tokens.balance(user.telegram_id)
-        if balance_before < cost:
-            await message.answer(
-                f"Недостаточно токенов: нужно {cost}, у тебя {balance_before}. Открой профиль и пополни баланс."
-            )
+        lease = get_inflight_registry(message.bot).try_acquire(user.telegram_id, user_tier(user))
+        if lease is None:
+            await message.answer(BUSY_TEXT)
             return
-
-        balance_left = await tokens.spend(user.telegram_id, cost)
-        await message.answer(f"Списано {cost} токенов. Остаток: {balance_left}.")
-        record = await prompt_repo.create(
-            user_id=user.telegram_id,
-            prompt=prompt,
-            template=template,
-            status="processing",
-            tokens_spent=cost,
-        )
-        status_line = "⏳ Генерируем по prompt..."
-        if face_id:
-            status_line = f"{status_line}\nРеференс лицо: #{face_id}"
-        status_message = await message.answer(status_line)
-        try:
-            nano = get_generation_client(message.bot)
-            face_urls: list[str] | None = None
+        async with lease:
+            cost = settings.cost_per_prompt
+            # Reserved now, charged only after the result is delivered.
+            try:
+                async with get_database(message.bot).transaction():
+                    record = await prompt_repo.create(
+                        user_id=user.telegram_id,
+                        prompt=prompt,
+                        template=template,
+                        status="processing",
+                        tokens_spent=cost,
+                        inputs={"face_id": face_id},
+                    )
+                    hold = await tokens.hold(user.telegram_id, cost, LedgerReason.PROMPT, f"prompt:{record.id}")
+            except InsufficientTokensError:
+                balance = await tokens.balance(user.telegram_id)
+                await message.answer(
+                    f"Недостаточно токенов: нужно {cost}, у тебя {balance}. Открой профиль и пополни баланс."
+                )
+                return
+            status_line = "⏳ Генерируем по prompt..."
             if face_id:
-                face_urls = [await _ensure_face_file_by_id(message, face_id)]
-            result = await nano.generate_prompt(prompt=prompt, template=template, face_urls=face_urls)
-            bytes_image = _extract_image(result)
-            storage = get_file_storage(message.bot)
-            path_saved = await storage.save_generation(bytes_image)
-            await prompt_repo.update_status(record.id, status="ready", result_path=path_saved.as_posix())
-            await status_message.delete()
-            await message.answer_photo(
-                FSInputFile(path_saved),
-                caption="Готово!",
-                reply_markup=sessions_keyboard(),
-            )
-        except Exception as exc:  # pragma: no cover
-            logging.exception("Failed to generate prompt")
-            await tokens.add(user.telegram_id, cost)
-            await prompt_repo.update_status(record.id, status="failed")
-            await status_message.edit_text(f"Не вышло сгенерировать: {exc}")
-        finally:
-            await state.clear()
+                status_line = f"{status_line}\nРеференс лицо: #{face_id}"
+            status_message = await message.answer(status_line)
+            priority = await get_priority_classifier(message.bot).classify(user)
+            try:
+                nano = get_generation_client(message.bot)
+                face_urls: list[str] | None = None
+                if face_id:
+                    face_urls = [await _ensure_face_file_by_id(message, face_id)]
+                async with (
+                    get_generation_heartbeat(message.bot).track("prompt", record.id),
+                    get_generation_scheduler(message.bot).slot(
+                        user.telegram_id, priority, on_position=position_updater(status_message, status_line)
+                    ),
+                ):
+                    await tokens.extend(hold)
+                    result = await nano.generate_prompt(prompt=prompt, template=template, face_urls=face_urls)
+                bytes_image = extract_image(result)
+                storage = get_file_storage(message.bot)
+                path_saved = await storage.save_generation(bytes_image)
+                await status_message.delete()
+                await message.answer_photo(
+                    # Rendering happens in the background; the fresh result goes out as soon as it is saved.
+                    FSInputFile(await storage.rendition(path_saved, TELEGRAM.name, wait=False) or path_saved),
+                    caption="Готово!",
+                    reply_markup=sessions_keyboard(),
+                )
+            except asyncio.CancelledError:
+                # Shutdown gave up waiting: refund instead of leaving the record in processing.
+                await tokens.release(hold)
+                await prompt_repo.update_status(record.id, status="failed")
+                with suppress(Exception):
+                    await status_message.edit_text(INTERRUPTED_TEXT)
+                raise
+            except Exception as exc:  # pragma: no cover
+                logging.exception("Failed to generate prompt")
+                await tokens.release(hold)
+                await prompt_repo.update_status(record.id, status="failed")
+                await status_message.edit_text(f"Не вышло сгенерировать: {exc}")
+            else:
+                # Marking the record ready and charging happen together, once the result is delivered.
+                async with get_database(message.bot).transaction():
+                    await prompt_repo.update_status(record.id, status="ready", result_path=path_saved.as_posix())
+                    await tokens.commit(hold)
+                await get_quota_service(message.bot).enforce_generations(user.telegram_id)
+            finally:
+                await state.clear()
     except Exception as e:
         logging.exception("Error in _start_prompt_generation: %s", e)
         await message.answer("Произошла непредвиденная ошибка при обработке запроса.")
@@ -161,52 +201,12 @@ async def _ensure_face_file_by_id(message: types.Message, face_id: int) -> str:
     face = await faces_repo.get_by_id(face_id, message.from_user.id)
     if not face:
         raise RuntimeError("Лицо не найдено.")
-    if face.file_path:
-        path = Path(face.file_path)
-        if path.exists():
-            return path.as_posix()
-    if not face.file_id:
-        raise RuntimeError("Нет файла лица.")
-    storage = get_file_storage(message.bot)
-    new_path = await storage.save_face(message.bot, message.from_user.id, face.file_id)
-    await faces_repo.update_file_path(face.id, message.from_user.id, new_path.as_posix())
-    return new_path.as_posix()
-
-
-def _extract_image(response: dict[str, Any]) -> bytes:
-    data = _extract_inline_image(response)
-    if data:
-        return data
-    images = response.get("images") or response.get("data")
-    if images:
-        raw = images[0]
-        if isinstance(raw, dict):
-            raw = raw.get("b64_json") or raw.get("content")
-        if isinstance(raw, str):
-            return base64.b64decode(raw)
-    raise RuntimeError("Ответ модели пустой")
-
-
-def _extract_inline_image(response: dict[str, Any]) -> bytes | None:
-    candidates = response.get("candidates") or []
-    for candidate in candidates:
-        content = candidate.get("content") or {}
-        parts = content.get("parts") or []
-        data = _decode_inline_parts(parts)
-        if data:
-            return data
-    contents = response.get("contents") or []
-    for content in contents:
-        parts = content.get("parts") or []
-        data = _decode_inline_parts(parts)
-        if data:
-            return data
-    return None
-
-
-def _decode_inline_parts(parts: list[dict[str, Any]]) -> bytes | None:
-    for part in parts:
-        inline_data = part.get("inline_data") or part.get("inlineData")
-        if isinstance(inline_data, dict) and inline_data.get("data"):
-            return base64.b64decode(inline_data["data"])
-    return None
+    path = await get_face_materializer(message.bot).ensure(
+        message.bot,
+        message.from_user.id,
+        face_id=face.id,
+        file_path=face.file_path,
+        file_id=face.file_id,
+        file_unique_id=face.file_unique_id,
+    )
+    return path.as_posix()
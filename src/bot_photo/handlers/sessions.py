@@ -1,8 +1,8 @@
 from __future__ import annotations
 
-import base64
+import asyncio
 import logging
-from pathlib import Path
+from contextlib import suppress
 from typing import Any
 
 from aiogram import F, Router, types
@@ -10,70 +10,37 @@ from aiogram.fsm.context import FSMContext
 from aiogram.types import FSInputFile, InlineKeyboardButton, InlineKeyboardMarkup
 
 from ..keyboards import faces_keyboard, main_menu_keyboard, orientation_keyboard, sessions_keyboard, styles_keyboard
-from ..models import PhotoSessionState
+from ..models import LedgerReason, PhotoSessionState, User
+from ..services import InsufficientTokensError
+from ..services.inflight import BUSY_TEXT, user_tier
+from ..services.nano_banana import extract_image
+from ..services.scheduler import position_updater
+from ..services.shutdown import INTERRUPTED_TEXT
+from ..storage import TELEGRAM
 from ..utils import (
+    get_database,
     get_examples_service,
+    get_face_materializer,
     get_faces_repo,
     get_file_storage,
     get_generation_client,
+    get_generation_heartbeat,
+    get_generation_scheduler,
+    get_inflight_registry,
+    get_priority_classifier,
+    get_quota_service,
     get_sessions_repo,
     get_settings,
+    get_style_registry,
     get_token_service,
     get_users_repo,
 )
 
-SESSION_STYLES: list[tuple[str, str]] = [
-    ("haute_couture_runway", "Подиум haute couture"),
-    ("red_carpet_premiere", "Красная дорожка премьеры"),
-    ("eiffel_tower_evening", "Париж, Эйфелева башня вечером"),
-    ("santorini_sunrise", "Санторини на рассвете"),
-    ("dubai_rooftop", "Дубай, вид с крыши"),
-    ("tokyo_neon_street", "Токио, неоновая улица"),
-    ("new_york_rooftop", "Нью-Йорк, крыши небоскрёбов"),
-    ("milan_fashion_week", "Милан, Fashion Week"),
-    ("paris_sidewalk_cafe", "Парижское уличное кафе"),
-    ("london_rain_editorial", "Лондон, дождливый editorial"),
-    ("yacht_deck_sunset", "Яхта на закате"),
-    ("private_jet_cabin", "Салон частного джета"),
-    ("luxury_hotel_suite", "Люкс в отеле"),
-    ("art_gallery_minimal", "Минималистичная галерея"),
-    ("royal_ballroom", "Королевский бал"),
-    ("mediterranean_villa", "Вилла на Средиземном море"),
-    ("alpine_ski_chalet", "Альпийское шале"),
-    ("desert_supercar", "Суперкар в пустыне"),
-    ("vineyard_golden_hour", "Виноградник на закате"),
-    ("maldives_beach", "Мальдивы, пляж"),
-    ("moscow_red_square", "Москва, Красная площадь"),
-    ("st_petersburg_roofs", "Питер, крыши"),
-    ("sochi_yacht_marina", "Сочи, яхтенная марина"),
-    ("baikal_ice", "Байкал, лёд"),
-    ("cozy_coffee_shop", "Уютная кофейня"),
-    ("city_business_meeting", "Офис, деловая встреча"),
-    ("airport_traveler", "Аэропорт, путешественник"),
-    ("university_library", "Университетская библиотека"),
-    ("music_festival", "Музыкальный фестиваль"),
-    ("nightclub_neon", "Ночной клуб, неон"),
-    ("streetwear_alley", "Стритстайл во дворе"),
-    ("old_town_walk", "Прогулка по старому городу"),
-    ("winter_christmas_market", "Зимняя ярмарка"),
-    ("beach_party", "Вечеринка на пляже"),
-    ("mountain_hike", "Поход в горах"),
-    ("wedding_guest", "Гость на свадьбе"),
-    ("fitness_gym", "Спортивный зал"),
-    ("medical_lab_coat", "Врач/лаборант в халате"),
-    ("chef_kitchen", "Шеф-повар на кухне"),
-    ("halloween_costume", "Хэллоуин-костюм"),
-    ("medieval_knight", "Средневековые доспехи"),
-    ("cosplay_anime", "Косплей аниме"),
-]
-STYLE_LABELS = dict(SESSION_STYLES)
 MAX_FACES = 10
 
 router = Router(name="sessions")
 
 
-
-
 def _face_progress_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
         inline_keyboard=[
@@ -123,29 +90,31 @@ async def start_session(callback: types.CallbackQuery, state: FSMContext) -> Non
             "Шаг 3: опиши кадр или жми «Сгенерировать без описания»."
         )
     )
-    await callback.message.answer("Выбери стиль:", reply_markup=styles_keyboard(SESSION_STYLES))
+    styles = get_style_registry(callback.message.bot)
+    await callback.message.answer("Выбери стиль:", reply_markup=styles_keyboard(styles.choices()))
     await callback.answer()
 
 
 @router.callback_query(lambda c: c.data and c.data.startswith("style:"))
 async def on_style_chosen(callback: types.CallbackQuery, state: FSMContext) -> None:
     style = callback.data.split(":", 1)[1]
-    await state.update_data(style=style, orientation="vertical", faces=[], pending_face_ids=[])
+    styles = get_style_registry(callback.message.bot)
+    await state.update_data(
+        style=style, orientation=styles.default_orientation(style), faces=[], pending_face_ids=[]
+    )
     await state.set_state(PhotoSessionState.waiting_face)
 
     await callback.message.delete()
     await callback.message.answer(
-        f"Стиль «{style}» выбран. Пришли 1–10 фото лиц или выбери сохранённые.",
+        f"Стиль «{styles.label(style)}» выбран. Пришли 1–10 фото лиц или выбери сохранённые.",
         reply_markup=faces_keyboard(),
     )
 
-    examples = get_examples_service(callback.message.bot)
-    preview = examples.get_by_style(style)
-    if preview and preview.file_path.exists():
-        await callback.message.answer_photo(
-            FSInputFile(preview.file_path),
-            caption=f"Пример стиля «{preview.title}». Добавь своё лицо и жми «Готово».",
-        )
+    await _send_style_preview(
+        callback.message,
+        style,
+        "Пример стиля «{title}». Добавь своё лицо и жми «Готово».",
+    )
     await callback.answer()
 
 
@@ -160,17 +129,15 @@ async def on_orientation_chosen(callback: types.CallbackQuery, state: FSMContext
     
     await callback.message.delete()
     await callback.message.answer(
-        f"Стиль «{style}» и ориентация «{orientation}» выбраны.\nПришлите 1–3 фото лица или выберите сохранённые.",
+        f"Стиль «{get_style_registry(callback.message.bot).label(style)}» и ориентация «{orientation}» выбраны.\nПришлите 1–3 фото лица или выберите сохранённые.",
         reply_markup=faces_keyboard(),
     )
     
-    examples = get_examples_service(callback.message.bot)
-    preview = examples.get_by_style(style)
-    if preview and preview.file_path.exists():
-        await callback.message.answer_photo(
-            FSInputFile(preview.file_path),
-            caption=f"Так выглядит стиль «{preview.title}». Добавьте своё лицо и жмите «✅ Готово».",
-        )
+    await _send_style_preview(
+        callback.message,
+        style,
+        "Так выглядит стиль «{title}». Добавьте своё лицо и жмите «✅ Готово».",
+    )
     await callback.answer()
 
 
@@ -208,8 +175,7 @@ async def show_faces(callback: types.CallbackQuery, state: FSMContext) -> None:
 async def use_saved_face(callback: types.CallbackQuery, state: FSMContext) -> None:
     face_id = int(callback.data.split(":")[2])
     faces_repo = get_faces_repo(callback.message.bot)
-    faces = await faces_repo.list_faces(callback.from_user.id)
-    selected = next((face for face in faces if face.id == face_id), None)
+    selected = await faces_repo.get_by_id(face_id, callback.from_user.id)
     if not selected:
         await callback.answer("Такого лица нет.", show_alert=True)
         return
@@ -223,6 +189,7 @@ async def use_saved_face(callback: types.CallbackQuery, state: FSMContext) -> No
             "face_id": selected.id,
             "file_path": selected.file_path,
             "file_id": selected.file_id,
+            "file_unique_id": selected.file_unique_id,
         }
     )
     await state.update_data(faces=faces_state)
@@ -275,21 +242,30 @@ async def handle_face_photo(message: types.Message, state: FSMContext) -> None:
         await message.answer(f"Фото достаточно (макс. {MAX_FACES}). Нажми «✅ Готово».", reply_markup=_face_progress_keyboard())
         return
 
+    if not await get_quota_service(message.bot).can_add_face(message.from_user.id):
+        await message.answer(
+            "Библиотека лиц заполнена. Удали ненужные лица в списке сохранённых или выбери одно из них.",
+            reply_markup=_face_progress_keyboard(),
+        )
+        return
+
     photo = message.photo[-1]
-    storage = get_file_storage(message.bot)
-    file_path = await storage.save_face(message.bot, message.from_user.id, photo.file_id)
+    materializer = get_face_materializer(message.bot)
+    file_path = await materializer.fetch(message.bot, message.from_user.id, photo.file_id, photo.file_unique_id)
     faces_repo = get_faces_repo(message.bot)
     new_face = await faces_repo.add_face(
         user_id=message.from_user.id,
         title=None,
         file_id=photo.file_id,
         file_path=file_path.as_posix(),
+        file_unique_id=photo.file_unique_id,
     )
     faces_state.append(
         {
             "face_id": new_face.id,
             "file_path": file_path.as_posix(),
             "file_id": photo.file_id,
+            "file_unique_id": photo.file_unique_id,
         }
     )
     pending_face_ids: list[int] = data.get("pending_face_ids", [])
@@ -326,6 +302,8 @@ async def handle_face_name(message: types.Message, state: FSMContext) -> None:
     if not pending_face_ids:
         await message.answer("Все лица обработаны. Добавь описание или жми «✨ Сгенерировать без описания».", reply_markup=_prompt_controls_keyboard())
         await state.set_state(PhotoSessionState.waiting_prompt)
+
+
 @router.callback_query(PhotoSessionState.waiting_prompt, lambda c: c.data == "prompt:default")
 async def handle_prompt_default(callback: types.CallbackQuery, state: FSMContext) -> None:
     data = await state.get_data()
@@ -367,11 +345,6 @@ async def _start_generation(
     prompt: str | None,
     actor: types.User,
 ) -> None:
-    settings = get_settings(message.bot)
-    token_service = get_token_service(message.bot)
-    users_repo = get_users_repo(message.bot)
-    sessions_repo = get_sessions_repo(message.bot)
-    examples_service = get_examples_service(message.bot)
     user = await _get_or_create_user(message.bot, actor)
     if not user:
         await message.answer("Не удалось получить профиль. Нажми /start.")
@@ -381,132 +354,136 @@ async def _start_generation(
         await message.answer("Аккаунт заблокирован. Напиши в поддержку.")
         return
 
+    lease = get_inflight_registry(message.bot).try_acquire(user.telegram_id, user_tier(user))
+    if lease is None:
+        await message.answer(BUSY_TEXT)
+        return
+    async with lease:
+        await _run_generation(message, state, user, style, orientation, faces, prompt)
+
+
+async def _run_generation(
+    message: types.Message,
+    state: FSMContext,
+    user: User,
+    style: str,
+    orientation: str,
+    faces: list[dict[str, Any]],
+    prompt: str | None,
+) -> None:
+    settings = get_settings(message.bot)
+    token_service = get_token_service(message.bot)
+    sessions_repo = get_sessions_repo(message.bot)
     cost = settings.cost_per_session
-    balance_before = await token_service.balance(user.telegram_id)
-    logging.debug("Tokens before spend user=%s balance=%s cost=%s", user.telegram_id, balance_before, cost)
-    if balance_before < cost:
+    # The cost is only reserved here; it is charged once the result is delivered.
+    try:
+        async with get_database(message.bot).transaction():
+            session = await sessions_repo.create_session(
+                user_id=user.telegram_id,
+                style=style,
+                prompt=prompt,
+                status="processing",
+                tokens_spent=cost,
+                inputs={"orientation": orientation, "faces": faces},
+            )
+            hold = await token_service.hold(user.telegram_id, cost, LedgerReason.SESSION, f"session:{session.id}")
+    except InsufficientTokensError:
+        balance = await token_service.balance(user.telegram_id)
         await message.answer(
-            f"Недостаточно токенов: нужно {cost}, у тебя {balance_before}. Открой профиль и пополни баланс."
+            f"Недостаточно токенов: нужно {cost}, у тебя {balance}. Открой профиль и пополни баланс."
         )
         return
-
-    balance_left = await token_service.spend(user.telegram_id, cost)
-    logging.debug("Tokens after spend user=%s balance=%s", user.telegram_id, balance_left)
-    await message.answer(f"Списано {cost} токенов. Остаток: {balance_left}.")
-    session = await sessions_repo.create_session(
-        user_id=user.telegram_id,
-        style=style,
-        prompt=prompt,
-        status="processing",
-        tokens_spent=cost,
-    )
+    logging.debug("Tokens held user=%s hold=%s cost=%s", user.telegram_id, hold.id, cost)
     await state.set_state(PhotoSessionState.processing)
 
-    status_message = await message.answer("⏳ Генерируем, подожди...")
+    status_text = "⏳ Генерируем, подожди..."
+    status_message = await message.answer(status_text)
+    priority = await get_priority_classifier(message.bot).classify(user)
     image_bytes: bytes | None = None
     error_text: str | None = None
     session_status = "ready"
     nano = get_generation_client(message.bot)
     try:
-        face_paths = [await _ensure_face_file(message, face) for face in faces]
-        result = await nano.generate_photosession(
-            style=style,
-            prompt=prompt,
-            orientation=orientation,
-            face_urls=face_paths,
+        prepared = await get_face_materializer(message.bot).prepare(
+            message.bot, user.telegram_id, faces, on_ready=nano.preload_face
         )
-        image_bytes = _extract_first_image(result)
-    except Exception as exc:  # pragma: no cover
-        fallback = examples_service.get_by_style(style)
-        if fallback and fallback.file_path.exists():
-            image_bytes = fallback.file_path.read_bytes()
-            error_text = (
-                "Основная генерация недоступна, показан эталон из примеров. "
-                "Токены возвращены."
+        face_paths = [path.as_posix() for path in prepared]
+        async with (
+            get_generation_heartbeat(message.bot).track("session", session.id),
+            get_generation_scheduler(message.bot).slot(
+                user.telegram_id, priority, on_position=position_updater(status_message, status_text)
+            ),
+        ):
+            await token_service.extend(hold)
+            result = await nano.generate_photosession(
+                get_style_registry(message.bot).prompt(style, orientation, prompt),
+                face_urls=face_paths,
             )
-            session_status = "fallback"
-            await token_service.add(user.telegram_id, cost)
-        else:
-            await token_service.add(user.telegram_id, cost)
+        image_bytes = extract_image(result)
+    except asyncio.CancelledError:
+        # Shutdown gave up waiting: refund instead of leaving the session in processing.
+        await token_service.release(hold)
+        await sessions_repo.update_status(session.id, status="failed")
+        with suppress(Exception):
+            await status_message.edit_text(INTERRUPTED_TEXT)
+        raise
+    except Exception as exc:  # pragma: no cover
+        await token_service.release(hold)
+        fallback = get_style_registry(message.bot).example(style)
+        if fallback:
+            try:
+                image_bytes = await get_file_storage(message.bot).read_bytes(fallback.file_path)
+            except Exception:
+                logging.exception("Failed to read the fallback example %s", fallback.file_path)
+        if image_bytes is None:
             await sessions_repo.update_status(session.id, status="failed")
             await status_message.edit_text(f"Не вышло сгенерировать: {exc}")
             await state.clear()
             return
+        error_text = (
+            "Основная генерация недоступна, показан эталон из примеров. "
+            "Токены не списаны."
+        )
+        session_status = "fallback"
 
     storage = get_file_storage(message.bot)
-    image_path = await storage.save_generation(image_bytes)
-    await sessions_repo.update_status(
-        session_id=session.id,
-        status=session_status,
-        result_path=image_path.as_posix(),
-    )
-    await status_message.delete()
-    await message.answer_photo(
-        FSInputFile(image_path),
-        caption="Готово! Вот твоя съёмка. Хочешь ещё? Запусти новую сцену.",
-        reply_markup=sessions_keyboard(),
-    )
+    try:
+        image_path = await storage.save_generation(image_bytes)
+        await status_message.delete()
+        await message.answer_photo(
+            FSInputFile(await storage.rendition(image_path, TELEGRAM.name, wait=False) or image_path),
+            caption="Готово! Вот твоя съёмка. Хочешь ещё? Запусти новую сцену.",
+            reply_markup=sessions_keyboard(),
+        )
+    except (Exception, asyncio.CancelledError):
+        await token_service.release(hold)
+        await sessions_repo.update_status(session.id, status="failed")
+        raise
+    # Marking the session done and charging happen together, once the result is delivered.
+    async with get_database(message.bot).transaction():
+        await sessions_repo.update_status(
+            session_id=session.id,
+            status=session_status,
+            result_path=image_path.as_posix(),
+        )
+        if session_status == "ready":
+            balance_left = await token_service.commit(hold)
+            logging.debug("Tokens charged user=%s balance=%s", user.telegram_id, balance_left)
+    await get_quota_service(message.bot).enforce_generations(user.telegram_id)
     if error_text:
         await message.answer(error_text)
     await state.clear()
 
-async def _ensure_face_file(message: types.Message, face: dict[str, Any]) -> str:
-    path_value = face.get("file_path")
-    if path_value:
-        candidate = Path(path_value)
-        if candidate.exists():
-            return candidate.as_posix()
-    file_id = face.get("file_id")
-    if not file_id:
-        raise RuntimeError("Не удалось получить файл лица.")
-    storage = get_file_storage(message.bot)
-    new_path = await storage.save_face(message.bot, message.from_user.id, file_id)
-    faces_repo = get_faces_repo(message.bot)
-    if face.get("face_id"):
-        await faces_repo.update_file_path(face["face_id"], message.from_user.id, new_path.as_posix())
-    face["file_path"] = new_path.as_posix()
-    return new_path.as_posix()
-
-
-def _extract_first_image(response: dict[str, Any]) -> bytes:
-    data = _extract_inline_image(response)
-    if data:
-        return data
-    images = response.get("images") or response.get("data")
-    if images:
-        raw = images[0]
-        if isinstance(raw, dict):
-            raw = raw.get("b64_json") or raw.get("content")
-        if isinstance(raw, str):
-            return base64.b64decode(raw)
-        if isinstance(raw, bytes):
-            return raw
-    raise RuntimeError("Nano banana вернул пустой результат")
-
-
-def _extract_inline_image(response: dict[str, Any]) -> bytes | None:
-    candidates = response.get("candidates") or []
-    for candidate in candidates:
-        content = candidate.get("content") or {}
-        parts = content.get("parts") or []
-        data = _decode_inline_parts(parts)
-        if data:
-            return data
-    contents = response.get("contents") or []
-    for content in contents:
-        parts = content.get("parts") or []
-        data = _decode_inline_parts(parts)
-        if data:
-            return data
-    return None
-
-
-def _decode_inline_parts(parts: list[dict[str, Any]]) -> bytes | None:
-    for part in parts:
-        inline_data = part.get("inline_data") or part.get("inlineData")
-        if isinstance(inline_data, dict) and inline_data.get("data"):
-            return base64.b64decode(inline_data["data"])
-    return None
+
+async def _send_style_preview(message: types.Message, style: str | None, caption: str) -> None:
+    styles = get_style_registry(message.bot)
+    preview = styles.example(style)
+    if not style or not preview:
+        return
+    examples = get_examples_service(message.bot)
+    sent = await message.answer_photo(examples.photo(preview), caption=caption.format(title=styles.label(style)))
+    if sent.photo:
+        examples.remember_file_id(preview, sent.photo[-1].file_id)
 
 
 @router.callback_query(lambda c: c.data == "session:share")
@@ -520,9 +497,13 @@ async def share_last_session(callback: types.CallbackQuery) -> None:
     if not session.result_path:
         await callback.answer("У последней съёмки нет файла.", show_alert=True)
         return
-    style_label = STYLE_LABELS.get(session.style, session.style)
+    style_label = get_style_registry(callback.message.bot).label(session.style)
+    photo = await get_file_storage(callback.message.bot).rendition(session.result_path, TELEGRAM.name)
+    if photo is None:
+        await callback.answer("Файл последней съёмки больше недоступен.", show_alert=True)
+        return
     await callback.message.answer_photo(
-        FSInputFile(session.result_path),
+        FSInputFile(photo),
         caption=f"{style_label}\nПерешли это фото другу или сохрани себе.",
         reply_markup=sessions_keyboard(),
     )
@@ -100,15 +100,16 @@ async def _send_welcome_message(message: types.Message, examples_service) -> Non
         "Вот лишь несколько примеров того, что мы можем создать вместе:"
     )
     
-    examples = list(examples_service.list_examples())[:3]
+    examples = [example for example in examples_service.list_examples() if example.available][:3]
     
     # Используем первое изображение с Gemini_Generated_Image... или любой доступный
     if examples:
         special_example = next((e for e in examples if "Gemini_Generated" in e.file_path.name), examples[0])
         
-        photo = FSInputFile(special_example.file_path)
         try:
-            await message.answer_photo(photo, caption=welcome_text)
+            sent = await message.answer_photo(examples_service.photo(special_example), caption=welcome_text)
+            if sent.photo:
+                examples_service.remember_file_id(special_example, sent.photo[-1].file_id)
         except Exception:
             # Если Telegram даёт таймаут или не принимает файл, покажем текст без фото
             await message.answer(welcome_text + "\n\n(Пример не отправился, попробуй позже.)")
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import json
+import logging
+import queue
+import random
+import sys
+from contextvars import ContextVar, Token
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+from typing import Any
+
+from .metrics import current_update_stats
+
+# Loggers that are far too chatty at DEBUG for the hot path (aiosqlite logs every
+# cursor operation). Overridable through LOG_LEVELS.
+DEFAULT_LOGGER_LEVELS: dict[str, str] = {
+    "aiosqlite": "WARNING",
+    "aiohttp.access": "WARNING",
+    "aiogram.event": "INFO",
+}
+
+_log_context: ContextVar[dict[str, Any] | None] = ContextVar("bot_photo_log_context", default=None)
+
+
+def bind_log_context(**values: Any) -> Token[dict[str, Any] | None]:
+    current = _log_context.get() or {}
+    return _log_context.set({**current, **values})
+
+
+def reset_log_context(token: Token[dict[str, Any] | None]) -> None:
+    _log_context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Stamps records with update_id/user_id/handler while still on the emitting thread."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _log_context.get() or {}
+        record.update_id = context.get("update_id")
+        record.user_id = context.get("user_id")
+        stats = current_update_stats()
+        record.handler = stats.handler if stats else context.get("handler")
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Keeps only a fraction of DEBUG records; other levels always pass."""
+
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self._rate = max(0.0, min(rate, 1.0))
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self._rate >= 1.0:
+            return True
+        return random.random() < self._rate
+
+
+class _QueueHandler(QueueHandler):
+    _exc_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only resolve the message and traceback here; the final formatting runs on
+        # the listener thread. Args/exc_info are dropped so the record is safe to hand over.
+        copy = logging.makeLogRecord(record.__dict__)
+        copy.message = record.getMessage()
+        copy.msg = copy.message
+        copy.args = None
+        if record.exc_info and not copy.exc_text:
+            copy.exc_text = self._exc_formatter.formatException(record.exc_info)
+        copy.exc_info = None
+        return copy
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload: dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("update_id", "user_id", "handler"):
+            value = getattr(record, key, None)
+            if value is not None:
+                payload[key] = value
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self) -> None:
+        super().__init__("%(asctime)s - %(levelname)s - %(name)s - %(message)s%(context)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        parts = [
+            f"{key}={getattr(record, key)}"
+            for key in ("update_id", "user_id", "handler")
+            if getattr(record, key, None) is not None
+        ]
+        record.context = f" [{' '.join(parts)}]" if parts else ""
+        return super().format(record)
+
+
+def parse_logger_levels(value: str | None) -> dict[str, str]:
+    levels = dict(DEFAULT_LOGGER_LEVELS)
+    if not value:
+        return levels
+    for item in value.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(
+    level: str = "INFO",
+    fmt: str = "json",
+    log_file: Path | None = None,
+    logger_levels: str | None = None,
+    debug_sample_rate: float = 1.0,
+) -> QueueListener:
+    """Route all logging through a queue drained by a background thread.
+
+    Returns the started listener; call `stop()` on shutdown to flush it.
+    """
+    formatter: logging.Formatter = JsonFormatter() if fmt == "json" else TextFormatter()
+    handlers: list[logging.Handler] = []
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(formatter)
+    handlers.append(stream)
+    if log_file:
+        log_file.parent.mkdir(parents=True, exist_ok=True)
+        file_handler = logging.FileHandler(log_file, encoding="utf-8")
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(DebugSamplingFilter(debug_sample_rate))
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+    for name, logger_level in parse_logger_levels(logger_levels).items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+__all__ = [
+    "ContextFilter",
+    "DEFAULT_LOGGER_LEVELS",
+    "DebugSamplingFilter",
+    "JsonFormatter",
+    "TextFormatter",
+    "bind_log_context",
+    "parse_logger_levels",
+    "reset_log_context",
+    "setup_logging",
+]
@@ -2,42 +2,142 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from pathlib import Path
+import time
+from dataclasses import dataclass, field
 
 from aiogram import Bot, Dispatcher
+from aiohttp import web
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.fsm.storage.memory import MemoryStorage
 
 from .config import Settings
-from .db import Database
+from .db import Database, SQLiteStorage, prepare_schema
 from .handlers import routers
-from .middlewares import UserRegistrationMiddleware
+from .logging_setup import setup_logging
+from .metrics import MetricsRegistry
+from .middlewares import (
+    BotApiMetricsMiddleware,
+    CallbackDebounceMiddleware,
+    HandlerMetricsMiddleware,
+    LoggingContextMiddleware,
+    ShutdownMiddleware,
+    UpdateMetricsMiddleware,
+    UserRegistrationMiddleware,
+)
+from .repositories.blobs import BlobRepository
 from .repositories.faces import FaceRepository
+from .repositories.ledger import LedgerRepository
 from .repositories.prompts import PromptRepository
+from .repositories.quotas import QuotaRepository
 from .repositories.sessions import SessionRepository
 from .repositories.usage import UsageRepository
 from .repositories.users import UserRepository
 from .repositories.payments import PaymentRepository
-from .services import ExamplesService, NanoBananaClient, RateLimitService, TokenService, CryptoPayService
-from .storage import FileStorage
+from .services import (
+    CryptoPayService,
+    ExamplesService,
+    FaceMaterializer,
+    NanoBananaClient,
+    QuotaService,
+    RateLimitService,
+    StyleRegistry,
+    TokenService,
+)
+from .services.http_server import HttpServer
+from .services.crypto_webhook import CryptoPayWebhook
+from .services.invoice_poller import InvoicePoller
+from .services.hold_sweeper import HoldSweeper
+from .services.inflight import InflightRegistry, parse_limits
+from .services.scheduler import GenerationScheduler, PriorityClassifier, parse_weights
+from .services.shutdown import ShutdownCoordinator
+from .services.ledger_audit import LedgerAuditor
+from .services.recovery import GenerationRecovery
+from .services.heartbeat import GenerationHeartbeat
+from .services.storage_gc import StorageGarbageCollector
+from .storage import FileStorage, create_file_storage
 from .utils import init_context
+
+logger = logging.getLogger(__name__)
 
 
-async def main() -> None:
-    logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
-    settings = Settings()
-    bot = Bot(
-        settings.bot_token,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
-    )
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
+@dataclass(slots=True)
+class Application:
+    settings: Settings
+    database: Database
+    dispatcher: Dispatcher
+    nano_client: NanoBananaClient
+    crypto_pay_service: CryptoPayService
+    metrics: MetricsRegistry
+    file_storage: FileStorage
+    storage_gc: StorageGarbageCollector
+    examples_service: ExamplesService
+    invoice_poller: InvoicePoller
+    ledger_auditor: LedgerAuditor
+    hold_sweeper: HoldSweeper
+    recovery: GenerationRecovery
+    heartbeat: GenerationHeartbeat
+    shutdown: ShutdownCoordinator
+    http_servers: list[HttpServer] = field(default_factory=list)
 
-    database = Database(settings.database_path)
-    await database.connect()
-    schema_path = Path(__file__).resolve().parent / "db" / "schema.sql"
-    await database.run_script(schema_path)
+    def instrument_bot(self, bot: Bot) -> None:
+        bot.session.middleware(BotApiMetricsMiddleware(self.metrics))
+
+    async def start(self, bot: Bot, background: bool = True) -> None:
+        """Start the HTTP endpoint and catalog reloads; `background` also starts the
+        periodic jobs, which only one process of a cluster should run."""
+        for server in self.http_servers:
+            await server.start()
+        self.examples_service.start()
+        self.heartbeat.start()
+        if not background:
+            return
+        self.storage_gc.start()
+        self.invoice_poller.start(bot)
+        self.ledger_auditor.start()
+        self.hold_sweeper.start()
+        self.recovery.start(bot)
+
+    async def stop(self, bot: Bot) -> None:
+        """Drain in-flight updates while the bot session is still open, then tear everything down."""
+        await self.shutdown.drain()
+        await bot.session.close()
+        await self.close()
+
+    async def close(self) -> None:
+        await self.recovery.close()
+        await self.heartbeat.close()
+        await self.hold_sweeper.close()
+        await self.ledger_auditor.close()
+        await self.invoice_poller.close()
+        await self.examples_service.close()
+        await self.storage_gc.close()
+        for server in self.http_servers:
+            await server.close()
+        await self.crypto_pay_service.close()
+        await self.nano_client.close()
+        await self.database.close()
+        await self.file_storage.close()
+
+
+async def create_application(settings: Settings, storage: BaseStorage | None = None) -> Application:
+    """Wire the database, repositories, services and routers into a dispatcher."""
+    started = time.perf_counter()
+    metrics = MetricsRegistry()
+
+    database = Database(
+        settings.database_path, metrics=metrics, busy_timeout_ms=settings.database_busy_timeout_ms
+    )
+    examples_service = ExamplesService(settings.examples_path, reload_interval=settings.examples_reload_seconds)
+    # The examples catalog (file stats, image probes) is built off the loop while the database opens.
+    _, schema_changed = await asyncio.gather(
+        asyncio.to_thread(examples_service.load),
+        _open_database(database),
+    )
+    if storage is None and settings.fsm_storage == "sqlite":
+        storage = SQLiteStorage(database)
+    dp = Dispatcher(storage=storage or MemoryStorage())
 
     users_repo = UserRepository(database)
     faces_repo = FaceRepository(database)
@@ -45,22 +145,99 @@ async def main() -> None:
     prompts_repo = PromptRepository(database)
     usage_repo = UsageRepository(database)
     payments_repo = PaymentRepository(database)
+    blobs_repo = BlobRepository(database)
+    quotas_repo = QuotaRepository(database)
+    ledger_repo = LedgerRepository(database)
+    if await quotas_repo.is_empty():
+        await quotas_repo.rebuild()
 
-    file_storage = FileStorage(settings.faces_path, settings.sessions_path)
-    examples_service = ExamplesService(settings.examples_path)
-    examples_service.load()
-    token_service = TokenService(users_repo)
+    file_storage = create_file_storage(settings, blobs=blobs_repo)
+    storage_gc = StorageGarbageCollector(
+        file_storage,
+        blobs_repo,
+        grace_seconds=settings.storage_gc_grace_hours * 3600,
+        batch_size=settings.storage_gc_batch_size,
+        deletes_per_second=settings.storage_gc_deletes_per_second,
+        interval_seconds=settings.storage_gc_interval_seconds,
+        dry_run=settings.storage_gc_dry_run,
+    )
+    face_materializer = FaceMaterializer(
+        file_storage, faces_repo, max_concurrency=settings.face_download_concurrency
+    )
+    quota_service = QuotaService(
+        quotas_repo,
+        max_faces=settings.quota_max_faces,
+        max_face_bytes=settings.quota_max_face_mb * 1024 * 1024,
+        max_generation_bytes=settings.quota_max_generation_mb * 1024 * 1024,
+    )
+    style_registry = StyleRegistry(settings.styles_path, examples_service)
+    style_registry.load()
+    token_service = TokenService(users_repo, ledger_repo, hold_ttl_seconds=settings.token_hold_ttl_seconds)
+    hold_sweeper = HoldSweeper(token_service, interval_seconds=settings.token_hold_sweep_seconds)
+    ledger_auditor = LedgerAuditor(
+        token_service,
+        interval_seconds=settings.token_ledger_audit_seconds,
+        metrics=metrics,
+    )
     limit_service = RateLimitService(usage_repo, settings.hourly_limit)
     nano_client = NanoBananaClient(
         api_key=settings.nano_banana_api_key,
         base_url=settings.nano_banana_base_url,
         model=settings.nano_banana_model,
         fallback_model=settings.nano_banana_fallback_model,
+        metrics=metrics,
     )
     crypto_pay_service = CryptoPayService(
         token=settings.crypto_bot_token,
         network=settings.crypto_bot_network,
     )
+    priority_classifier = PriorityClassifier(
+        payments_repo,
+        quotas_repo,
+        priority_min_tokens=settings.priority_min_tokens,
+        priority_window_days=settings.priority_window_days,
+        cache_seconds=settings.priority_cache_seconds,
+    )
+    invoice_poller = InvoicePoller(
+        database,
+        crypto_pay_service,
+        payments_repo,
+        token_service,
+        interval_seconds=settings.payments_poll_interval_seconds,
+        batch_size=settings.payments_poll_batch_size,
+        max_backoff_seconds=settings.payments_poll_max_backoff_seconds,
+        priorities=priority_classifier,
+    )
+    scheduler = GenerationScheduler(
+        settings.generation_concurrency,
+        parse_weights(settings.scheduler_weights),
+        reserved=settings.priority_reserved_slots,
+        lane_classes=[name.strip() for name in settings.priority_lane_classes.split(",") if name.strip()],
+        lane_slo_seconds=settings.priority_wait_slo_seconds,
+        shared_slo_seconds=settings.shared_wait_slo_seconds,
+        metrics=metrics,
+    )
+    shutdown = ShutdownCoordinator(settings.shutdown_drain_seconds, metrics=metrics)
+    heartbeat = GenerationHeartbeat(sessions_repo, prompts_repo, settings.recovery_heartbeat_seconds)
+    recovery = GenerationRecovery(
+        database,
+        sessions_repo,
+        prompts_repo,
+        faces_repo,
+        token_service,
+        nano=nano_client,
+        materializer=face_materializer,
+        styles=style_registry,
+        storage=file_storage,
+        scheduler=scheduler,
+        quotas=quota_service,
+        shutdown=shutdown,
+        heartbeat=heartbeat,
+        stale_seconds=settings.recovery_stale_seconds,
+        interval_seconds=settings.recovery_interval_seconds,
+        batch_size=settings.recovery_batch_size,
+        metrics=metrics,
+    )
 
     init_context(
         settings=settings,
@@ -72,28 +249,120 @@ async def main() -> None:
             "prompts": prompts_repo,
             "usage": usage_repo,
             "payments": payments_repo,
+            "blobs": blobs_repo,
+            "quotas": quotas_repo,
+            "ledger": ledger_repo,
         },
         services={
             "tokens": token_service,
             "limits": limit_service,
             "nano": nano_client,
             "examples": examples_service,
+            "styles": style_registry,
+            "faces": face_materializer,
+            "quotas": quota_service,
             "crypto_pay": crypto_pay_service,
+            "invoices": invoice_poller,
+            "inflight": InflightRegistry(parse_limits(settings.generation_limits)),
+            "scheduler": scheduler,
+            "heartbeat": heartbeat,
+            "priorities": priority_classifier,
         },
         file_storage=file_storage,
     )
 
+    dp.update.outer_middleware(ShutdownMiddleware(shutdown))
+    dp.update.outer_middleware(UpdateMetricsMiddleware(metrics))
+    dp.update.outer_middleware(LoggingContextMiddleware())
     dp.update.outer_middleware(UserRegistrationMiddleware(settings, users_repo))
+    dp.callback_query.outer_middleware(CallbackDebounceMiddleware(settings.callback_debounce_seconds, metrics))
+    dp.message.middleware(HandlerMetricsMiddleware(metrics))
+    dp.callback_query.middleware(HandlerMetricsMiddleware(metrics))
 
     for router in routers:
         dp.include_router(router)
 
+    # Metrics and the webhook each get a listener; they share one only when configured on the same address.
+    http_servers: dict[tuple[str, int], HttpServer] = {}
+    if settings.metrics_port:
+        address = (settings.metrics_host, settings.metrics_port)
+        http_servers[address] = HttpServer(*address)
+        http_servers[address].add_get("/metrics", _metrics_endpoint(metrics))
+    if settings.crypto_pay_webhook_path:
+        address = (settings.crypto_pay_webhook_host, settings.crypto_pay_webhook_port)
+        if address not in http_servers:
+            http_servers[address] = HttpServer(*address)
+        webhook = CryptoPayWebhook(settings.crypto_bot_token, invoice_poller)
+        http_servers[address].add_post(settings.crypto_pay_webhook_path, webhook.handle)
+
+    elapsed = time.perf_counter() - started
+    metrics.gauge("app_startup_seconds", "Time spent wiring the application at startup.").set(elapsed)
+    logger.info(
+        "Application ready in %.3fs (schema %s)", elapsed, "migrated" if schema_changed else "up to date"
+    )
+    return Application(
+        settings=settings,
+        database=database,
+        dispatcher=dp,
+        nano_client=nano_client,
+        crypto_pay_service=crypto_pay_service,
+        metrics=metrics,
+        file_storage=file_storage,
+        storage_gc=storage_gc,
+        examples_service=examples_service,
+        invoice_poller=invoice_poller,
+        ledger_auditor=ledger_auditor,
+        hold_sweeper=hold_sweeper,
+        recovery=recovery,
+        heartbeat=heartbeat,
+        shutdown=shutdown,
+        http_servers=list(http_servers.values()),
+    )
+
+
+async def _open_database(database: Database) -> bool:
+    await database.connect()
+    return await prepare_schema(database)
+
+
+def _metrics_endpoint(metrics: MetricsRegistry):
+    async def handler(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+    return handler
+
+
+async def main() -> None:
+    settings = Settings()
+    log_listener = setup_logging(
+        level=settings.log_level,
+        fmt=settings.log_format,
+        log_file=settings.log_file,
+        logger_levels=settings.log_levels,
+        debug_sample_rate=settings.log_debug_sample_rate,
+    )
+    if settings.bot_workers > 1:
+        from .cluster import run_front
+
+        try:
+            await run_front(settings, settings.bot_workers)
+        finally:
+            log_listener.stop()
+        return
+    bot = Bot(
+        settings.bot_token,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    )
+    app = await create_application(settings)
+    app.instrument_bot(bot)
+    await app.start(bot)
+
     try:
-        await dp.start_polling(bot)
+        # The session stays open after polling stops so drained handlers can still deliver.
+        await app.dispatcher.start_polling(bot, close_bot_session=False)
     finally:
-        await crypto_pay_service.close()
-        await nano_client.close()
-        await database.close()
+        await app.stop(bot)
+        log_listener.stop()
 
 
 if __name__ == "__main__":
@@ -1,3 +1,15 @@
+from .debounce import CallbackDebounceMiddleware
+from .logging_context import LoggingContextMiddleware
+from .metrics import BotApiMetricsMiddleware, HandlerMetricsMiddleware, UpdateMetricsMiddleware
+from .shutdown import ShutdownMiddleware
 from .user_registration import UserRegistrationMiddleware
 
-__all__ = ["UserRegistrationMiddleware"]
+__all__ = [
+    "BotApiMetricsMiddleware",
+    "CallbackDebounceMiddleware",
+    "HandlerMetricsMiddleware",
+    "LoggingContextMiddleware",
+    "ShutdownMiddleware",
+    "UpdateMetricsMiddleware",
+    "UserRegistrationMiddleware",
+]
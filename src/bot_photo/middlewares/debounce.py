@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Hashable
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, TelegramObject
+
+if TYPE_CHECKING:
+    from ..metrics import MetricsRegistry
+
+# A redelivered callback query keeps its id; remember ids long enough to catch that.
+CALLBACK_ID_TTL = 60.0
+
+
+class CallbackDebounceMiddleware(BaseMiddleware):
+    """Drops repeated callback presses before they reach a handler.
+
+    A callback query whose id was already handled is dropped, and so is a press of
+    the same button (user, message, data) within `window_seconds` of the previous
+    one, so a nervous double tap on "generate" starts one generation. Dropped
+    queries are answered so the client stops its spinner.
+    """
+
+    def __init__(self, window_seconds: float = 1.0, metrics: MetricsRegistry | None = None) -> None:
+        super().__init__()
+        self._window = window_seconds
+        self._ids: OrderedDict[str, float] = OrderedDict()
+        self._presses: OrderedDict[Hashable, float] = OrderedDict()
+        self._dropped = (
+            metrics.counter("callback_debounced_total", "Callback queries dropped as duplicates.", ("kind",))
+            if metrics
+            else None
+        )
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, CallbackQuery):
+            return await handler(event, data)
+        now = time.monotonic()
+        _expire(self._ids, now - CALLBACK_ID_TTL)
+        _expire(self._presses, now - self._window)
+        press = (event.from_user.id, event.message.message_id if event.message else None, event.data)
+        kind = "id" if event.id in self._ids else "press" if press in self._presses else None
+        if kind:
+            if self._dropped:
+                self._dropped.inc(kind=kind)
+            await event.answer()
+            return None
+        self._ids[event.id] = now
+        if self._window > 0:
+            self._presses[press] = now
+        return await handler(event, data)
+
+
+def _expire(seen: OrderedDict[Any, float], cutoff: float) -> None:
+    while seen:
+        key, stamp = next(iter(seen.items()))
+        if stamp > cutoff:
+            return
+        seen.popitem(last=False)
+
+
+__all__ = ["CallbackDebounceMiddleware"]
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update, User
+
+from ..logging_setup import bind_log_context, reset_log_context
+
+
+class LoggingContextMiddleware(BaseMiddleware):
+    """Outer middleware binding update_id/user_id to every log record of the update."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user: User | None = data.get("event_from_user")
+        token = bind_log_context(
+            update_id=event.update_id if isinstance(event, Update) else None,
+            user_id=user.id if user else None,
+        )
+        try:
+            return await handler(event, data)
+        finally:
+            reset_log_context(token)
+
+
+__all__ = ["LoggingContextMiddleware"]
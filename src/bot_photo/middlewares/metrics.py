@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject, Update
+
+from ..metrics import COUNT_BUCKETS, MetricsRegistry, UpdateStats, begin_update, current_update_stats, end_update
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer middleware: times every update and publishes its per-update counters."""
+
+    def __init__(self, metrics: MetricsRegistry) -> None:
+        super().__init__()
+        self._duration = metrics.histogram(
+            "bot_update_duration_seconds",
+            "Time spent processing an update, by router and handler.",
+            ("event_type", "router", "handler"),
+        )
+        self._db_queries = metrics.histogram(
+            "bot_update_db_queries",
+            "Database calls made while processing an update.",
+            ("router", "handler"),
+            buckets=COUNT_BUCKETS,
+        )
+        self._db_time = metrics.histogram(
+            "bot_update_db_seconds",
+            "Time spent in database calls while processing an update.",
+            ("router", "handler"),
+        )
+        self._errors = metrics.counter(
+            "bot_update_errors_total",
+            "Updates whose processing raised an exception.",
+            ("router", "handler"),
+        )
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        # Reuse stats prepared by a caller (e.g. the load-test harness) if present.
+        stats = current_update_stats()
+        token = None
+        if stats is None:
+            stats = UpdateStats()
+            token = begin_update(stats)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self._errors.inc(router=stats.router or "-", handler=stats.handler or "unhandled")
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            router = stats.router or "-"
+            name = stats.handler or "unhandled"
+            event_type = event.event_type if isinstance(event, Update) else type(event).__name__
+            self._duration.observe(elapsed, event_type=event_type, router=router, handler=name)
+            self._db_queries.observe(stats.db_queries, router=router, handler=name)
+            self._db_time.observe(stats.db_seconds, router=router, handler=name)
+            if token is not None:
+                end_update(token)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware: resolves the router/handler name and times the handler itself."""
+
+    def __init__(self, metrics: MetricsRegistry) -> None:
+        super().__init__()
+        self._duration = metrics.histogram(
+            "bot_handler_duration_seconds",
+            "Time spent inside the matched handler.",
+            ("router", "handler"),
+        )
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        callback = getattr(handler_object, "callback", None)
+        name = getattr(callback, "__name__", "unknown")
+        router = getattr(data.get("event_router"), "name", "-")
+        stats = current_update_stats()
+        if stats:
+            stats.handler = name
+            stats.router = router
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = time.perf_counter() - started
+            if stats:
+                stats.handler_seconds = elapsed
+            self._duration.observe(elapsed, router=router, handler=name)
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    """Session middleware timing outbound Bot API calls."""
+
+    def __init__(self, metrics: MetricsRegistry) -> None:
+        self._duration = metrics.histogram(
+            "bot_api_request_duration_seconds",
+            "Outbound Telegram Bot API calls.",
+            ("method", "outcome"),
+        )
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self._duration.observe(elapsed, method=type(method).__name__, outcome=outcome)
+            stats = current_update_stats()
+            if stats:
+                stats.bot_calls += 1
+                stats.bot_seconds += elapsed
+
+
+__all__ = ["BotApiMetricsMiddleware", "HandlerMetricsMiddleware", "UpdateMetricsMiddleware"]
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from ..services.shutdown import RESTARTING_TEXT, ShutdownCoordinator
+
+logger = logging.getLogger(__name__)
+
+
+class ShutdownMiddleware(BaseMiddleware):
+    """Outermost update middleware: tracks every update for the shutdown drain and
+    turns updates away once the drain has started."""
+
+    def __init__(self, coordinator: ShutdownCoordinator) -> None:
+        super().__init__()
+        self._coordinator = coordinator
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if self._coordinator.draining:
+            logger.info("Dropped update %s during shutdown", getattr(event, "update_id", None))
+            if isinstance(event, Update) and event.callback_query:
+                await event.callback_query.answer(RESTARTING_TEXT, show_alert=True)
+            return None
+        async with self._coordinator.track():
+            return await handler(event, data)
+
+
+__all__ = ["ShutdownMiddleware"]
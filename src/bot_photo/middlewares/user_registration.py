@@ -39,6 +39,7 @@ class UserRegistrationMiddleware(BaseMiddleware):
         return await handler(event, data)
 
     def _is_agreement_flow(self, event: TelegramObject) -> bool:
+        event = self._unwrap(event)
         if isinstance(event, types.Message):
             return bool(event.text and event.text.startswith("/start"))
         if isinstance(event, types.CallbackQuery):
@@ -46,7 +47,15 @@ class UserRegistrationMiddleware(BaseMiddleware):
         return False
 
     async def _send_agreement_hint(self, event: TelegramObject) -> None:
+        event = self._unwrap(event)
         if isinstance(event, types.Message):
             await event.answer("Нужно принять соглашение. Нажми /start, чтобы продолжить.")
         elif isinstance(event, types.CallbackQuery):
             await event.answer("Нужно принять соглашение. Нажми /start.", show_alert=True)
+
+    @staticmethod
+    def _unwrap(event: TelegramObject) -> TelegramObject:
+        # Registered on `dp.update`, so the payload arrives wrapped in an Update.
+        if isinstance(event, types.Update):
+            return event.event
+        return event
@@ -1,12 +1,19 @@
+from .blob import Blob
 from .face import Face
+from .ledger import LedgerDrift, LedgerEntry, LedgerReason, TokenHold
 from .prompt_generation import PromptGeneration
 from .session import Session
 from .payment import Payment
+from .quota import UserQuota
 from .states import AdminState, AgreementState, PhotoSessionState, PromptState
 from .user import User
 
 __all__ = [
+    "Blob",
     "Face",
+    "LedgerDrift",
+    "LedgerEntry",
+    "LedgerReason",
     "PromptGeneration",
     "Session",
     "Payment",
@@ -14,5 +21,7 @@ __all__ = [
     "AgreementState",
     "PhotoSessionState",
     "PromptState",
+    "TokenHold",
     "User",
+    "UserQuota",
 ]
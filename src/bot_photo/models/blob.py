@@ -0,0 +1,14 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+
+
+@dataclass(slots=True)
+class Blob:
+    path: str
+    hash: str
+    size: int
+    refcount: int
+    created_at: datetime
+    updated_at: datetime
@@ -12,3 +12,4 @@ class Face:
     file_id: str | None
     file_path: str | None
     created_at: datetime
+    file_unique_id: str | None = None
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+
+
+class LedgerReason:
+    """Values of `token_ledger.reason`."""
+
+    OPENING_BALANCE = "opening_balance"
+    STARTING_GRANT = "starting_grant"
+    SESSION = "session"
+    PROMPT = "prompt"
+    REFUND = "refund"
+    PAYMENT = "payment"
+    ADMIN_GRANT = "admin_grant"
+
+
+@dataclass(slots=True)
+class LedgerEntry:
+    id: int
+    user_id: int
+    delta: int
+    balance_after: int
+    reason: str
+    ref: str | None = None
+    created_at: datetime | None = None
+
+
+@dataclass(slots=True)
+class TokenHold:
+    id: int
+    user_id: int
+    amount: int
+    reason: str
+    ref: str | None = None
+    status: str = "held"
+    expires_at: datetime | None = None
+    created_at: datetime | None = None
+    settled_at: datetime | None = None
+
+
+@dataclass(slots=True)
+class LedgerDrift:
+    """A user whose materialized balance disagrees with the sum of their ledger."""
+
+    user_id: int
+    balance: int
+    ledger_balance: int
@@ -16,6 +16,9 @@ class Payment:
     created_at: datetime | None = None
     paid_at: datetime | None = None
     credited_at: datetime | None = None
+    checked_at: datetime | None = None
+    next_check_at: datetime | None = None
+    check_attempts: int = 0
 
 
 __all__ = ["Payment"]
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from datetime import datetime
+from typing import Any
 
 
 @dataclass(slots=True)
@@ -15,3 +16,6 @@ class PromptGeneration:
     result_file_id: str | None
     tokens_spent: int | None
     created_at: datetime
+    # What is needed to run the generation again (face_id); see GenerationRecovery.
+    inputs: dict[str, Any] | None = None
+    recovered_at: datetime | None = None
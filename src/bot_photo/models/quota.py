@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+
+
+@dataclass(slots=True)
+class UserQuota:
+    user_id: int
+    face_count: int = 0
+    face_bytes: int = 0
+    generation_count: int = 0
+    generation_bytes: int = 0
+    updated_at: datetime | None = None
+
+    @property
+    def total_bytes(self) -> int:
+        return self.face_bytes + self.generation_bytes
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from datetime import datetime
+from typing import Any
 
 
 @dataclass(slots=True)
@@ -16,3 +17,6 @@ class Session:
     tokens_spent: int | None
     created_at: datetime
     updated_at: datetime
+    # What is needed to run the generation again (orientation, faces); see GenerationRecovery.
+    inputs: dict[str, Any] | None = None
+    recovered_at: datetime | None = None
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any
+
+from ..models import Blob
+from .base import BaseRepository
+
+# Rows pointing at a file with no `blobs` entry (stored before it existed) have no count to read.
+UNTRACKED = "NOT EXISTS (SELECT 1 FROM blobs WHERE blobs.path = {column})"
+
+
+class BlobRepository(BaseRepository):
+    """Size, reference count and last store time of content-addressed files kept by `FileStorage`.
+
+    `refcount` is the number of face, session and prompt rows pointing at the file;
+    triggers in `schema.sql` keep it current as rows are inserted, repointed and
+    deleted. Files stored before `blobs` existed have no row here and are judged by
+    the rows that point at them instead.
+    """
+
+    async def record(self, path: str, content_hash: str, size: int) -> None:
+        """Register a stored file; storing the same content again refreshes `updated_at`.
+
+        A new entry starts from the rows already pointing at `path`, which only
+        happens for files stored before `blobs` existed.
+        """
+        await self.db.execute(
+            """
+            INSERT INTO blobs(path, hash, size, refcount) VALUES(
+                ?, ?, ?,
+                (SELECT COUNT(*) FROM faces WHERE file_path = ?)
+                + (SELECT COUNT(*) FROM sessions WHERE result_path = ?)
+                + (SELECT COUNT(*) FROM prompt_generations WHERE result_path = ?)
+            )
+            ON CONFLICT(path) DO UPDATE SET updated_at=CURRENT_TIMESTAMP
+            """,
+            (path, content_hash, size, path, path, path),
+        )
+
+    async def get(self, path: str) -> Blob | None:
+        row = await self.db.fetchone("SELECT * FROM blobs WHERE path=?", (path,))
+        return self._row_to_blob(row) if row else None
+
+    async def delete(self, path: str) -> None:
+        await self.db.execute("DELETE FROM blobs WHERE path=?", (path,))
+
+    async def referenced_paths(self, paths: list[str]) -> set[str]:
+        """Return the subset of `paths` still referenced: by `refcount`, or by rows when untracked."""
+        if not paths:
+            return set()
+        placeholders = ", ".join("?" for _ in paths)
+        rows = await self.db.fetchall(
+            f"""
+            SELECT path FROM blobs WHERE path IN ({placeholders}) AND refcount > 0
+            UNION SELECT file_path FROM faces WHERE file_path IN ({placeholders})
+                AND {UNTRACKED.format(column="file_path")}
+            UNION SELECT result_path FROM sessions WHERE result_path IN ({placeholders})
+                AND {UNTRACKED.format(column="result_path")}
+            UNION SELECT result_path FROM prompt_generations WHERE result_path IN ({placeholders})
+                AND {UNTRACKED.format(column="result_path")}
+            """,
+            (*paths, *paths, *paths, *paths),
+        )
+        return {row["path"] for row in rows}
+
+    async def still_needed(self, path: str, grace_seconds: float) -> bool:
+        """Whether `path` is referenced or was stored within the last `grace_seconds`.
+
+        Checked right before a GC delete, after the batch's reference set was taken.
+        """
+        row = await self.db.fetchone(
+            "SELECT refcount > 0 OR updated_at > datetime('now', ?) AS needed FROM blobs WHERE path=?",
+            (f"-{int(grace_seconds)} seconds", path),
+        )
+        if row:
+            return bool(row["needed"])
+        return bool(await self.referenced_paths([path]))
+
+    async def total_size(self) -> int:
+        value = await self.db.fetchval("SELECT COALESCE(SUM(size), 0) FROM blobs")
+        return int(value or 0)
+
+    def _row_to_blob(self, row: dict[str, Any]) -> Blob:
+        return Blob(
+            path=row["path"],
+            hash=row["hash"],
+            size=row["size"],
+            refcount=row.get("refcount") or 0,
+            created_at=self._parse_datetime(row.get("created_at")),
+            updated_at=self._parse_datetime(row.get("updated_at")),
+        )
+
+    @staticmethod
+    def _parse_datetime(value: str | None) -> datetime:
+        return datetime.fromisoformat(value) if value else datetime.utcnow()
+
+
+__all__ = ["BlobRepository"]
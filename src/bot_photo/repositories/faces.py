@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Any
+from typing import Any, Iterable
 
 from ..models import Face
 from .base import BaseRepository
@@ -9,30 +9,37 @@ from .base import BaseRepository
 
 class FaceRepository(BaseRepository):
     async def add_face(
-        self, user_id: int, title: str | None, file_id: str | None, file_path: str | None
+        self,
+        user_id: int,
+        title: str | None,
+        file_id: str | None,
+        file_path: str | None,
+        file_unique_id: str | None = None,
     ) -> Face:
-        await self.db.execute(
-            "INSERT INTO faces(user_id, title, file_id, file_path) VALUES(?, ?, ?, ?)",
-            (user_id, title, file_id, file_path),
-        )
         row = await self.db.fetchone(
-            "SELECT * FROM faces WHERE rowid=last_insert_rowid()"
+            "INSERT INTO faces(user_id, title, file_id, file_path, file_unique_id) VALUES(?, ?, ?, ?, ?) RETURNING *",
+            (user_id, title, file_id, file_path, file_unique_id),
         )
         if not row:
             raise RuntimeError("Failed to insert face")
         return self._row_to_face(row)
 
-    async def list_faces(self, user_id: int, limit: int = 10) -> list[Face]:
+    async def list_faces(self, user_id: int, limit: int | None = None) -> list[Face]:
+        """Newest first; all of the user's faces unless `limit` is given."""
         rows = await self.db.fetchall(
-            "SELECT * FROM faces WHERE user_id=? ORDER BY created_at DESC LIMIT ?",
-            (user_id, limit),
+            "SELECT * FROM faces WHERE user_id=? ORDER BY created_at DESC, id DESC LIMIT ?",
+            (user_id, -1 if limit is None else limit),
         )
         return [self._row_to_face(row) for row in rows]
 
-    async def delete_face(self, face_id: int, user_id: int) -> None:
+    async def delete_face(self, face_id: int, user_id: int) -> Face | None:
+        face = await self.get_by_id(face_id, user_id)
+        if not face:
+            return None
         await self.db.execute(
             "DELETE FROM faces WHERE id=? AND user_id=?", (face_id, user_id)
         )
+        return face
 
     async def update_title(self, face_id: int, user_id: int, title: str | None) -> None:
         await self.db.execute(
@@ -44,6 +51,24 @@ class FaceRepository(BaseRepository):
             "UPDATE faces SET file_path=? WHERE id=? AND user_id=?", (file_path, face_id, user_id)
         )
 
+    async def update_file_paths(self, user_id: int, paths: Iterable[tuple[int, str]]) -> None:
+        """Set `file_path` for several faces in one statement; `paths` is (face_id, path) pairs."""
+        await self.db.executemany(
+            "UPDATE faces SET file_path=? WHERE id=? AND user_id=?",
+            [(file_path, face_id, user_id) for face_id, file_path in paths],
+        )
+
+    async def find_path_by_unique_id(self, file_unique_id: str) -> str | None:
+        """Most recent stored file for a photo Telegram has already given us."""
+        return await self.db.fetchval(
+            """
+            SELECT file_path FROM faces
+            WHERE file_unique_id=? AND file_path IS NOT NULL
+            ORDER BY id DESC LIMIT 1
+            """,
+            (file_unique_id,),
+        )
+
     async def get_by_id(self, face_id: int, user_id: int) -> Face | None:
         row = await self.db.fetchone("SELECT * FROM faces WHERE id=? AND user_id=?", (face_id, user_id))
         return self._row_to_face(row) if row else None
@@ -56,6 +81,7 @@ class FaceRepository(BaseRepository):
             file_id=row.get("file_id"),
             file_path=row.get("file_path"),
             created_at=self._parse_datetime(row.get("created_at")),
+            file_unique_id=row.get("file_unique_id"),
         )
 
     @staticmethod
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any
+
+from ..models import LedgerDrift, LedgerEntry, TokenHold
+from .base import BaseRepository
+
+# Tokens of `users` row reserved by active holds.
+HELD_TOTAL = (
+    "COALESCE((SELECT SUM(amount) FROM token_holds "
+    "WHERE token_holds.user_id = users.telegram_id AND status='held'), 0)"
+)
+
+INSERT_ENTRY = """
+    INSERT INTO token_ledger(user_id, delta, balance_after, reason, ref)
+    VALUES(?, ?, ?, ?, ?)
+"""
+
+
+class LedgerRepository(BaseRepository):
+    """Append-only token ledger; the only writer of `users.tokens`.
+
+    Also keeps token holds: reservations that lower the available balance
+    (`tokens` minus active holds) without touching `users.tokens` until committed.
+    """
+
+    async def apply(self, user_id: int, delta: int, reason: str, ref: str | None = None) -> int | None:
+        """Change a balance and record why, atomically.
+
+        Returns the new balance, or None if the user does not exist or the change
+        would take the available balance below zero (nothing is written then).
+        """
+        async with self.db.transaction():
+            row = await self.db.fetchone(
+                f"""
+                UPDATE users
+                SET tokens = tokens + ?,
+                    last_seen_at = CURRENT_TIMESTAMP
+                WHERE telegram_id=? AND tokens - {HELD_TOTAL} + ? >= 0
+                RETURNING tokens
+                """,
+                (delta, user_id, delta),
+            )
+            if not row:
+                return None
+            await self.db.execute(INSERT_ENTRY, (user_id, delta, row["tokens"], reason, ref))
+            return row["tokens"]
+
+    async def available(self, user_id: int) -> int:
+        value = await self.db.fetchval(f"SELECT tokens - {HELD_TOTAL} FROM users WHERE telegram_id=?", (user_id,))
+        return value or 0
+
+    async def place_hold(
+        self, user_id: int, amount: int, reason: str, ref: str | None, ttl_seconds: float
+    ) -> TokenHold | None:
+        """Reserve `amount` tokens until committed, released or expired; None if not available."""
+        row = await self.db.fetchone(
+            f"""
+            INSERT INTO token_holds(user_id, amount, reason, ref, expires_at)
+            SELECT telegram_id, ?, ?, ?, datetime('now', ?) FROM users
+            WHERE telegram_id=? AND tokens - {HELD_TOTAL} >= ?
+            RETURNING *
+            """,
+            (amount, reason, ref, f"+{int(ttl_seconds)} seconds", user_id, amount),
+        )
+        return self._row_to_hold(row) if row else None
+
+    async def extend_hold(self, hold_id: int, ttl_seconds: float) -> bool:
+        """Push an active hold's expiry to `ttl_seconds` from now; False if it is no longer active."""
+        changed = await self.db.execute(
+            "UPDATE token_holds SET expires_at=datetime('now', ?) WHERE id=? AND status='held'",
+            (f"+{int(ttl_seconds)} seconds", hold_id),
+        )
+        return bool(changed)
+
+    async def commit_hold(self, hold_id: int) -> int | None:
+        """Turn a hold into a ledger spend; returns the new balance, or None if it was committed or released.
+
+        A hold that lapsed while its generation was still running is charged as well,
+        up to what the user has available now since its tokens were no longer reserved.
+        """
+        async with self.db.transaction():
+            row = await self.db.fetchone(
+                "SELECT * FROM token_holds WHERE id=? AND status IN ('held', 'expired')", (hold_id,)
+            )
+            if not row:
+                return None
+            await self.db.execute(
+                "UPDATE token_holds SET status='committed', settled_at=CURRENT_TIMESTAMP WHERE id=?", (hold_id,)
+            )
+            amount = row["amount"]
+            if row["status"] == "expired":
+                amount = min(amount, max(await self.available(row["user_id"]), 0))
+            balance = await self.apply(row["user_id"], -amount, row["reason"], row["ref"])
+            if balance is None:
+                raise RuntimeError(f"Token hold {hold_id} exceeds the balance of user {row['user_id']}")
+            return balance
+
+    async def release_hold(self, hold_id: int) -> bool:
+        changed = await self.db.execute(
+            "UPDATE token_holds SET status='released', settled_at=CURRENT_TIMESTAMP WHERE id=? AND status='held'",
+            (hold_id,),
+        )
+        return bool(changed)
+
+    async def release_expired(self) -> int:
+        return await self.db.execute(
+            """
+            UPDATE token_holds SET status='expired', settled_at=CURRENT_TIMESTAMP
+            WHERE status='held' AND expires_at <= datetime('now')
+            """
+        )
+
+    async def find_hold(self, ref: str) -> TokenHold | None:
+        """The most recent hold placed for `ref`."""
+        row = await self.db.fetchone("SELECT * FROM token_holds WHERE ref=? ORDER BY id DESC LIMIT 1", (ref,))
+        return self._row_to_hold(row) if row else None
+
+    async def history(self, user_id: int, limit: int = 20, before_id: int | None = None) -> list[LedgerEntry]:
+        """Newest first; pass the last seen `id` as `before_id` for the next page."""
+        rows = await self.db.fetchall(
+            """
+            SELECT * FROM token_ledger
+            WHERE user_id=? AND id < ?
+            ORDER BY id DESC
+            LIMIT ?
+            """,
+            (user_id, before_id if before_id is not None else 2**63 - 1, limit),
+        )
+        return [self._row_to_entry(row) for row in rows]
+
+    async def find_by_ref(self, ref: str) -> list[LedgerEntry]:
+        rows = await self.db.fetchall("SELECT * FROM token_ledger WHERE ref=? ORDER BY id", (ref,))
+        return [self._row_to_entry(row) for row in rows]
+
+    async def find_drift(self, limit: int = 100) -> list[LedgerDrift]:
+        """Users whose `users.tokens` differs from the sum of their ledger entries."""
+        rows = await self.db.fetchall(
+            """
+            SELECT u.telegram_id AS user_id, u.tokens AS balance, COALESCE(l.total, 0) AS ledger_balance
+            FROM users u
+            LEFT JOIN (SELECT user_id, SUM(delta) AS total FROM token_ledger GROUP BY user_id) l
+                ON l.user_id = u.telegram_id
+            WHERE u.tokens != COALESCE(l.total, 0)
+            LIMIT ?
+            """,
+            (limit,),
+        )
+        return [LedgerDrift(row["user_id"], row["balance"], row["ledger_balance"]) for row in rows]
+
+    def _row_to_hold(self, row: dict[str, Any]) -> TokenHold:
+        return TokenHold(
+            id=row["id"],
+            user_id=row["user_id"],
+            amount=row["amount"],
+            reason=row["reason"],
+            ref=row.get("ref"),
+            status=row["status"],
+            expires_at=self._parse_datetime(row.get("expires_at")),
+            created_at=self._parse_datetime(row.get("created_at")),
+            settled_at=self._parse_datetime(row.get("settled_at")),
+        )
+
+    def _row_to_entry(self, row: dict[str, Any]) -> LedgerEntry:
+        return LedgerEntry(
+            id=row["id"],
+            user_id=row["user_id"],
+            delta=row["delta"],
+            balance_after=row["balance_after"],
+            reason=row["reason"],
+            ref=row.get("ref"),
+            created_at=self._parse_datetime(row.get("created_at")),
+        )
+
+    @staticmethod
+    def _parse_datetime(value: str | None) -> datetime | None:
+        if not value:
+            return None
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
+
+
+__all__ = ["HELD_TOTAL", "INSERT_ENTRY", "LedgerRepository"]
@@ -1,12 +1,16 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Any
+from typing import Any, Iterable
 
 from .base import BaseRepository
 from ..models import Payment
 
 
+# Invoices that still need a look at Crypto Pay: not yet paid, or paid but not credited.
+PENDING_STATUSES = ("active", "paid")
+
+
 class PaymentRepository(BaseRepository):
     async def save_invoice(
         self,
@@ -26,7 +30,7 @@ class PaymentRepository(BaseRepository):
             INSERT INTO payments(invoice_id, user_id, amount_usdt, tokens, status, invoice_url, payload, paid_at)
             VALUES(?, ?, ?, ?, ?, ?, ?, ?)
             ON CONFLICT(invoice_id) DO UPDATE SET
-                status=excluded.status,
+                status=CASE WHEN payments.status='credited' THEN payments.status ELSE excluded.status END,
                 invoice_url=COALESCE(excluded.invoice_url, payments.invoice_url),
                 payload=COALESCE(excluded.payload, payments.payload),
                 paid_at=COALESCE(excluded.paid_at, payments.paid_at)
@@ -38,18 +42,88 @@ class PaymentRepository(BaseRepository):
             raise RuntimeError("Failed to persist payment")
         return payment
 
-    async def mark_credited(self, invoice_id: int) -> Payment | None:
-        await self.db.execute(
+    async def claim_credit(self, invoice_id: int, paid_at: datetime | str | None = None) -> Payment | None:
+        """Mark a payment credited; returns it only to the one caller that flipped the status."""
+        paid_at_str = paid_at.isoformat() if isinstance(paid_at, datetime) else paid_at
+        row = await self.db.fetchone(
             """
             UPDATE payments
             SET status='credited',
-                paid_at=COALESCE(paid_at, CURRENT_TIMESTAMP),
+                paid_at=COALESCE(paid_at, ?, CURRENT_TIMESTAMP),
                 credited_at=CURRENT_TIMESTAMP
-            WHERE invoice_id=?
+            WHERE invoice_id=? AND status!='credited'
+            RETURNING *
+            """,
+            (paid_at_str, invoice_id),
+        )
+        return self._row_to_payment(row) if row else None
+
+    async def update_status(self, invoice_id: int, status: str, paid_at: datetime | None = None) -> None:
+        paid_at_str = paid_at.isoformat() if isinstance(paid_at, datetime) else paid_at
+        await self.db.execute(
+            """
+            UPDATE payments
+            SET status=?, paid_at=COALESCE(?, paid_at), checked_at=CURRENT_TIMESTAMP
+            WHERE invoice_id=? AND status!='credited'
+            """,
+            (status, paid_at_str, invoice_id),
+        )
+
+    async def due_for_check(self, limit: int) -> list[Payment]:
+        placeholders = ", ".join("?" for _ in PENDING_STATUSES)
+        rows = await self.db.fetchall(
+            f"""
+            SELECT * FROM payments
+            WHERE status IN ({placeholders})
+              AND (next_check_at IS NULL OR next_check_at <= datetime('now'))
+            ORDER BY COALESCE(next_check_at, created_at)
+            LIMIT ?
+            """,
+            (*PENDING_STATUSES, limit),
+        )
+        return [self._row_to_payment(row) for row in rows]
+
+    async def postpone_checks(self, invoice_ids: Iterable[int], base_seconds: float, max_seconds: float) -> None:
+        """Schedule the next check of each invoice with exponential backoff on its attempts."""
+        ids = list(invoice_ids)
+        if not ids:
+            return
+        placeholders = ", ".join("?" for _ in ids)
+        await self.db.execute(
+            f"""
+            UPDATE payments
+            SET check_attempts=check_attempts + 1,
+                checked_at=CURRENT_TIMESTAMP,
+                next_check_at=datetime(
+                    'now', '+' || CAST(MIN(? * (1 << MIN(check_attempts, 16)), ?) AS INTEGER) || ' seconds'
+                )
+            WHERE invoice_id IN ({placeholders})
+            """,
+            (base_seconds, max_seconds, *ids),
+        )
+
+    async def has_credited(self, user_id: int) -> bool:
+        row = await self.db.fetchval(
+            "SELECT 1 FROM payments WHERE user_id=? AND status='credited' LIMIT 1", (user_id,)
+        )
+        return row is not None
+
+    async def purchase_summary(self, user_id: int, *, min_tokens: int, within_days: float) -> tuple[int, bool]:
+        """Number of credited payments, and whether one of at least `min_tokens` was credited recently."""
+        row = await self.db.fetchone(
+            """
+            SELECT
+                COUNT(*) AS credited,
+                COALESCE(MAX(
+                    tokens >= ?
+                    AND datetime(COALESCE(credited_at, paid_at, created_at)) >= datetime('now', ?)
+                ), 0) AS recent_large
+            FROM payments
+            WHERE user_id=? AND status='credited'
             """,
-            (invoice_id,),
+            (min_tokens, f"-{within_days} days", user_id),
         )
-        return await self.get(invoice_id)
+        return int(row["credited"]), bool(row["recent_large"])
 
     async def get(self, invoice_id: int) -> Payment | None:
         row = await self.db.fetchone("SELECT * FROM payments WHERE invoice_id=?", (invoice_id,))
@@ -67,6 +141,9 @@ class PaymentRepository(BaseRepository):
             created_at=self._parse_datetime(row.get("created_at")),
             paid_at=self._parse_datetime(row.get("paid_at")),
             credited_at=self._parse_datetime(row.get("credited_at")),
+            checked_at=self._parse_datetime(row.get("checked_at")),
+            next_check_at=self._parse_datetime(row.get("next_check_at")),
+            check_attempts=row.get("check_attempts") or 0,
         )
 
     @staticmethod
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import json
 from datetime import datetime
 from typing import Any
 
@@ -15,16 +16,15 @@ class PromptRepository(BaseRepository):
         template: str | None,
         status: str,
         tokens_spent: int,
+        inputs: dict[str, Any] | None = None,
     ) -> PromptGeneration:
-        await self.db.execute(
+        row = await self.db.fetchone(
             """
-            INSERT INTO prompt_generations(user_id, prompt, template, status, tokens_spent)
-            VALUES(?, ?, ?, ?, ?)
+            INSERT INTO prompt_generations(user_id, prompt, template, status, tokens_spent, inputs)
+            VALUES(?, ?, ?, ?, ?, ?)
+            RETURNING *
             """,
-            (user_id, prompt, template, status, tokens_spent),
-        )
-        row = await self.db.fetchone(
-            "SELECT * FROM prompt_generations WHERE rowid=last_insert_rowid()"
+            (user_id, prompt, template, status, tokens_spent, json.dumps(inputs) if inputs is not None else None),
         )
         if not row:
             raise RuntimeError("Prompt record failed")
@@ -59,6 +59,35 @@ class PromptRepository(BaseRepository):
         )
         return [self._row_to_prompt(row) for row in rows]
 
+    async def stale_processing(self, older_than_seconds: float, limit: int) -> list[PromptGeneration]:
+        """Rows left in `processing` for longer than `older_than_seconds` (since the last heartbeat, resume or creation)."""
+        rows = await self.db.fetchall(
+            """
+            SELECT * FROM prompt_generations
+            WHERE status='processing' AND COALESCE(heartbeat_at, recovered_at, created_at) <= datetime('now', ?)
+            ORDER BY id
+            LIMIT ?
+            """,
+            (f"-{int(older_than_seconds)} seconds", limit),
+        )
+        return [self._row_to_prompt(row) for row in rows]
+
+    async def mark_resumed(self, record_id: int) -> bool:
+        changed = await self.db.execute(
+            "UPDATE prompt_generations SET recovered_at=CURRENT_TIMESTAMP, heartbeat_at=CURRENT_TIMESTAMP "
+            "WHERE id=? AND status='processing'",
+            (record_id,),
+        )
+        return bool(changed)
+
+    async def touch_heartbeat(self, ids: list[int]) -> int:
+        """Mark processing rows as still being worked on."""
+        placeholders = ", ".join("?" for _ in ids)
+        return await self.db.execute(
+            f"UPDATE prompt_generations SET heartbeat_at=CURRENT_TIMESTAMP WHERE status='processing' AND id IN ({placeholders})",
+            tuple(ids),
+        )
+
     def _row_to_prompt(self, row: dict[str, Any]) -> PromptGeneration:
         return PromptGeneration(
             id=row["id"],
@@ -70,6 +99,8 @@ class PromptRepository(BaseRepository):
             result_file_id=row.get("result_file_id"),
             tokens_spent=row.get("tokens_spent"),
             created_at=self._parse_datetime(row.get("created_at")),
+            inputs=json.loads(row["inputs"]) if row.get("inputs") else None,
+            recovered_at=self._parse_datetime(row["recovered_at"]) if row.get("recovered_at") else None,
         )
 
     @staticmethod
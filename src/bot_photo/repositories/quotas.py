@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any
+
+from ..models import UserQuota
+from .base import BaseRepository
+
+# Tables whose result_path counts towards a user's generation bytes.
+GENERATION_TABLES = ("sessions", "prompt_generations")
+
+
+class QuotaRepository(BaseRepository):
+    """Read side of `user_quotas`; the counters themselves are kept by triggers in schema.sql."""
+
+    async def get(self, user_id: int) -> UserQuota:
+        row = await self.db.fetchone("SELECT * FROM user_quotas WHERE user_id=?", (user_id,))
+        return self._row_to_quota(row) if row else UserQuota(user_id=user_id)
+
+    async def is_empty(self) -> bool:
+        return await self.db.fetchval("SELECT 1 FROM user_quotas LIMIT 1") is None
+
+    async def rebuild(self) -> None:
+        """Recount every user from scratch (backfill for databases created before quotas)."""
+        await self.db.execute(
+            """
+            INSERT OR REPLACE INTO user_quotas(
+                user_id, face_count, face_bytes, generation_count, generation_bytes, updated_at
+            )
+            SELECT
+                u.telegram_id,
+                (SELECT COUNT(*) FROM faces f WHERE f.user_id=u.telegram_id),
+                (SELECT COALESCE(SUM(b.size), 0) FROM faces f
+                    JOIN blobs b ON b.path=f.file_path WHERE f.user_id=u.telegram_id),
+                (SELECT COUNT(*) FROM sessions s
+                    WHERE s.user_id=u.telegram_id AND s.result_path IS NOT NULL)
+                + (SELECT COUNT(*) FROM prompt_generations p
+                    WHERE p.user_id=u.telegram_id AND p.result_path IS NOT NULL),
+                (SELECT COALESCE(SUM(b.size), 0) FROM sessions s
+                    JOIN blobs b ON b.path=s.result_path WHERE s.user_id=u.telegram_id)
+                + (SELECT COALESCE(SUM(b.size), 0) FROM prompt_generations p
+                    JOIN blobs b ON b.path=p.result_path WHERE p.user_id=u.telegram_id),
+                CURRENT_TIMESTAMP
+            FROM users u
+            """
+        )
+
+    async def oldest_generations(self, user_id: int, limit: int) -> list[tuple[str, int, str, int]]:
+        """Stored results of a user, oldest first, as (table, row id, path, size)."""
+        rows = await self.db.fetchall(
+            """
+            SELECT 'sessions' AS source, s.id AS row_id, s.result_path AS path,
+                   COALESCE(b.size, 0) AS size, s.created_at AS created_at
+            FROM sessions s LEFT JOIN blobs b ON b.path=s.result_path
+            WHERE s.user_id=? AND s.result_path IS NOT NULL
+            UNION ALL
+            SELECT 'prompt_generations', p.id, p.result_path, COALESCE(b.size, 0), p.created_at
+            FROM prompt_generations p LEFT JOIN blobs b ON b.path=p.result_path
+            WHERE p.user_id=? AND p.result_path IS NOT NULL
+            ORDER BY created_at ASC, row_id ASC
+            LIMIT ?
+            """,
+            (user_id, user_id, limit),
+        )
+        return [(row["source"], row["row_id"], row["path"], row["size"]) for row in rows]
+
+    async def detach_generation(self, source: str, row_id: int) -> None:
+        """Forget the stored result of one generation; the row itself stays in history."""
+        if source not in GENERATION_TABLES:
+            raise ValueError(f"Unknown generation table: {source}")
+        await self.db.execute(f"UPDATE {source} SET result_path=NULL WHERE id=?", (row_id,))
+
+    def _row_to_quota(self, row: dict[str, Any]) -> UserQuota:
+        return UserQuota(
+            user_id=row["user_id"],
+            face_count=row["face_count"],
+            face_bytes=row["face_bytes"],
+            generation_count=row["generation_count"],
+            generation_bytes=row["generation_bytes"],
+            updated_at=self._parse_datetime(row.get("updated_at")),
+        )
+
+    @staticmethod
+    def _parse_datetime(value: str | None) -> datetime | None:
+        return datetime.fromisoformat(value) if value else None
+
+
+__all__ = ["QuotaRepository"]
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import json
 from datetime import datetime
 from typing import Any
 
@@ -15,16 +16,15 @@ class SessionRepository(BaseRepository):
         prompt: str | None,
         status: str,
         tokens_spent: int,
+        inputs: dict[str, Any] | None = None,
     ) -> Session:
-        await self.db.execute(
+        row = await self.db.fetchone(
             """
-            INSERT INTO sessions(user_id, style, prompt, status, tokens_spent)
-            VALUES(?, ?, ?, ?, ?)
+            INSERT INTO sessions(user_id, style, prompt, status, tokens_spent, inputs)
+            VALUES(?, ?, ?, ?, ?, ?)
+            RETURNING *
             """,
-            (user_id, style, prompt, status, tokens_spent),
-        )
-        row = await self.db.fetchone(
-            "SELECT * FROM sessions WHERE rowid=last_insert_rowid()"
+            (user_id, style, prompt, status, tokens_spent, json.dumps(inputs) if inputs is not None else None),
         )
         if not row:
             raise RuntimeError("Session create failed")
@@ -59,6 +59,35 @@ class SessionRepository(BaseRepository):
         row = await self.db.fetchone("SELECT * FROM sessions WHERE id=?", (session_id,))
         return self._row_to_session(row) if row else None
 
+    async def stale_processing(self, older_than_seconds: float, limit: int) -> list[Session]:
+        """Rows left in `processing` for longer than `older_than_seconds` (since the last heartbeat, resume or creation)."""
+        rows = await self.db.fetchall(
+            """
+            SELECT * FROM sessions
+            WHERE status='processing' AND COALESCE(heartbeat_at, recovered_at, created_at) <= datetime('now', ?)
+            ORDER BY id
+            LIMIT ?
+            """,
+            (f"-{int(older_than_seconds)} seconds", limit),
+        )
+        return [self._row_to_session(row) for row in rows]
+
+    async def mark_resumed(self, session_id: int) -> bool:
+        changed = await self.db.execute(
+            "UPDATE sessions SET recovered_at=CURRENT_TIMESTAMP, heartbeat_at=CURRENT_TIMESTAMP "
+            "WHERE id=? AND status='processing'",
+            (session_id,),
+        )
+        return bool(changed)
+
+    async def touch_heartbeat(self, ids: list[int]) -> int:
+        """Mark processing rows as still being worked on."""
+        placeholders = ", ".join("?" for _ in ids)
+        return await self.db.execute(
+            f"UPDATE sessions SET heartbeat_at=CURRENT_TIMESTAMP WHERE status='processing' AND id IN ({placeholders})",
+            tuple(ids),
+        )
+
     def _row_to_session(self, row: dict[str, Any]) -> Session:
         return Session(
             id=row["id"],
@@ -71,6 +100,8 @@ class SessionRepository(BaseRepository):
             tokens_spent=row.get("tokens_spent"),
             created_at=self._parse_datetime(row.get("created_at")),
             updated_at=self._parse_datetime(row.get("updated_at")),
+            inputs=json.loads(row["inputs"]) if row.get("inputs") else None,
+            recovered_at=self._parse_datetime(row["recovered_at"]) if row.get("recovered_at") else None,
         )
 
     @staticmethod
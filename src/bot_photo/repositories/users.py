@@ -3,8 +3,9 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Any
 
-from ..models import User
+from ..models import LedgerReason, User
 from .base import BaseRepository
+from .ledger import INSERT_ENTRY
 
 
 class UserRepository(BaseRepository):
@@ -17,51 +18,44 @@ class UserRepository(BaseRepository):
         starting_tokens: int,
         hourly_limit: int,
     ) -> User:
-        await self.db.execute(
-            """
-            INSERT INTO users(telegram_id, username, full_name, tokens, is_admin, hourly_limit)
-            VALUES(?, ?, ?, ?, ?, ?)
-            ON CONFLICT(telegram_id) DO UPDATE SET
-                username=excluded.username,
-                full_name=excluded.full_name,
-                is_admin=excluded.is_admin,
-                last_seen_at=CURRENT_TIMESTAMP,
-                tokens=CASE WHEN users.tokens = 0 THEN excluded.tokens ELSE users.tokens END
-            """,
-            (
-                telegram_id,
-                username,
-                full_name,
-                starting_tokens,
-                1 if is_admin else 0,
-                hourly_limit,
-            ),
-        )
-        user = await self.get_by_id(telegram_id)
-        if user:
-            return user
-        raise RuntimeError("Failed to create user")
+        # New users, and users who ran out, get `starting_tokens`; the grant goes
+        # into the token ledger together with the balance change.
+        async with self.db.transaction():
+            previous = await self.db.fetchval("SELECT tokens FROM users WHERE telegram_id=?", (telegram_id,))
+            row = await self.db.fetchone(
+                """
+                INSERT INTO users(telegram_id, username, full_name, tokens, is_admin, hourly_limit)
+                VALUES(?, ?, ?, ?, ?, ?)
+                ON CONFLICT(telegram_id) DO UPDATE SET
+                    username=excluded.username,
+                    full_name=excluded.full_name,
+                    is_admin=excluded.is_admin,
+                    last_seen_at=CURRENT_TIMESTAMP,
+                    tokens=CASE WHEN users.tokens = 0 THEN excluded.tokens ELSE users.tokens END
+                RETURNING *
+                """,
+                (
+                    telegram_id,
+                    username,
+                    full_name,
+                    starting_tokens,
+                    1 if is_admin else 0,
+                    hourly_limit,
+                ),
+            )
+            if not row:
+                raise RuntimeError("Failed to create user")
+            granted = row["tokens"] - (previous or 0)
+            if granted:
+                await self.db.execute(
+                    INSERT_ENTRY, (telegram_id, granted, row["tokens"], LedgerReason.STARTING_GRANT, None)
+                )
+        return self._row_to_user(row)
 
     async def get_by_id(self, telegram_id: int) -> User | None:
         row = await self.db.fetchone("SELECT * FROM users WHERE telegram_id=?", (telegram_id,))
         return self._row_to_user(row) if row else None
 
-    async def update_tokens(self, telegram_id: int, delta: int) -> int:
-        # Clamp to non-negative and return the new balance.
-        row = await self.db.fetchone(
-            """
-            UPDATE users
-            SET tokens = MAX(tokens + ?, 0),
-                last_seen_at = CURRENT_TIMESTAMP
-            WHERE telegram_id=?
-            RETURNING tokens
-            """,
-            (delta, telegram_id),
-        )
-        if not row:
-            return 0
-        return row["tokens"]
-
     async def set_demo_viewed(self, telegram_id: int) -> None:
         await self.db.execute(
             "UPDATE users SET demo_viewed_at=CURRENT_TIMESTAMP WHERE telegram_id=?",
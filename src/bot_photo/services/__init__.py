@@ -1,14 +1,22 @@
 from .examples import Example, ExamplesService
+from .face_materializer import FaceMaterializer
 from .limits import RateLimitService
 from .nano_banana import NanoBananaClient
-from .tokens import TokenService
+from .quotas import QuotaService
+from .styles import Style, StyleRegistry
+from .tokens import InsufficientTokensError, TokenService
 from .crypto_pay import CryptoPayService
 
 __all__ = [
     "Example",
     "ExamplesService",
+    "FaceMaterializer",
     "RateLimitService",
     "NanoBananaClient",
+    "QuotaService",
+    "Style",
+    "StyleRegistry",
+    "InsufficientTokensError",
     "TokenService",
     "CryptoPayService",
 ]
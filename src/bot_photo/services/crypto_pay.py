@@ -1,17 +1,39 @@
 from __future__ import annotations
 
-from aiocryptopay import AioCryptoPay, Networks
-from aiocryptopay.models.invoice import Invoice
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from aiocryptopay import AioCryptoPay
+    from aiocryptopay.models.invoice import Invoice
+
+# Upper bound of `count` in the getInvoices API method.
+MAX_INVOICES_PER_REQUEST = 1000
 
 
 class CryptoPayService:
+    """Thin wrapper over `AioCryptoPay`.
+
+    The `aiocryptopay` package and its client are loaded on the first API call,
+    so a bot that never touches payments does not pay for them at startup.
+    """
+
     def __init__(self, token: str, network: str = "TEST_NET") -> None:
-        resolved_network = Networks.TEST_NET
-        try:
-            resolved_network = Networks[network] if isinstance(network, str) else network
-        except Exception:
+        self._token = token
+        self._network = network
+        self._api: AioCryptoPay | None = None
+
+    @property
+    def _client(self) -> AioCryptoPay:
+        if self._api is None:
+            from aiocryptopay import AioCryptoPay, Networks
+
             resolved_network = Networks.TEST_NET
-        self._client = AioCryptoPay(token=token, network=resolved_network)
+            try:
+                resolved_network = Networks[self._network] if isinstance(self._network, str) else self._network
+            except Exception:
+                resolved_network = Networks.TEST_NET
+            self._api = AioCryptoPay(token=self._token, network=resolved_network)
+        return self._api
 
     async def create_invoice(
         self,
@@ -39,7 +61,13 @@ class CryptoPayService:
         return invoices[0] if invoices else None
 
     async def get_invoices(self, invoice_ids: list[int]) -> list[Invoice]:
-        return await self._client.get_invoices(invoice_ids=invoice_ids)
+        """Fetch up to `MAX_INVOICES_PER_REQUEST` invoices in one API call."""
+        invoices = await self._client.get_invoices(invoice_ids=invoice_ids, count=len(invoice_ids))
+        # The client returns None for an empty result and a bare Invoice for a single id.
+        if invoices is None:
+            return []
+        return invoices if isinstance(invoices, list) else [invoices]
 
     async def close(self) -> None:
-        await self._client.close()
+        if self._api is not None:
+            await self._api.close()
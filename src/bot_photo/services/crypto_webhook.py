@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import logging
+
+from aiohttp import web
+
+from .invoice_poller import InvoicePoller
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = "crypto-pay-api-signature"
+
+
+class CryptoPayWebhook:
+    """aiohttp handler for Crypto Pay `invoice_paid` updates.
+
+    The body is authenticated with the `crypto-pay-api-signature` header (HMAC-SHA256
+    of the raw body keyed with SHA-256 of the app token) before it is parsed. Paid
+    invoices are credited through `InvoicePoller.credit`, so a webhook, the poller
+    and the "check payment" button racing on one invoice credit it once. Crypto Pay
+    retries on non-2xx answers, so only unauthenticated or malformed requests fail.
+    """
+
+    def __init__(self, token: str, poller: InvoicePoller) -> None:
+        self._secret = hashlib.sha256(token.encode()).digest()
+        self._poller = poller
+
+    async def handle(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        if not verify_signature(self._secret, body, request.headers.get(SIGNATURE_HEADER, "")):
+            logger.warning("Rejected Crypto Pay webhook with a bad signature from %s", request.remote)
+            return web.Response(status=401)
+        try:
+            update = json.loads(body)
+            if update["update_type"] != "invoice_paid":
+                return web.Response(text="ok")
+            # Only the fields needed for crediting; the full invoice model is stricter
+            # than the webhook payload needs to be.
+            invoice = update["payload"]
+            invoice_id = int(invoice["invoice_id"])
+            status = str(invoice["status"]).lower()
+            paid_at = invoice.get("paid_at")
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Malformed Crypto Pay webhook body")
+            return web.Response(status=400)
+        if status != "paid":
+            return web.Response(text="ok")
+        result = await self._poller.credit(invoice_id, paid_at)
+        if result is None:
+            logger.debug("Invoice %s from webhook is unknown or already credited", invoice_id)
+            return web.Response(text="ok")
+        logger.info("Credited invoice %s from webhook", invoice_id)
+        await self._poller.notify(*result)
+        return web.Response(text="ok")
+
+
+def verify_signature(secret: bytes, body: bytes, signature: str) -> bool:
+    expected = hmac.new(secret, body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature.strip().lower())
+
+
+__all__ = ["CryptoPayWebhook", "SIGNATURE_HEADER", "verify_signature"]
@@ -1,10 +1,21 @@
 from __future__ import annotations
 
+import asyncio
 import json
-from dataclasses import dataclass
+import logging
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Iterable
 
+from aiogram.types import FSInputFile, InputFile
+
+from ..storage.renditions import probe_size
+
+logger = logging.getLogger(__name__)
+
+# (mtime_ns, size) of a file, or None if it is missing.
+FileStamp = tuple[int, int] | None
+
 
 @dataclass(slots=True)
 class Example:
@@ -12,38 +23,130 @@ class Example:
     title: str
     caption: str
     file_path: Path
+    available: bool = False
+    size: int = 0
+    width: int | None = None
+    height: int | None = None
+    # Telegram file_id of the photo once it has been sent, so later sends skip the upload.
+    file_id: str | None = None
+    stamp: FileStamp = None
+
+
+@dataclass(frozen=True, slots=True)
+class _Catalog:
+    examples: dict[str, Example] = field(default_factory=dict)
+    # Stamps of the manifest and every file it names; any change triggers a rebuild.
+    stamps: tuple[tuple[str, FileStamp], ...] = ()
 
 
 class ExamplesService:
-    def __init__(self, directory: Path) -> None:
+    """Style examples described by `manifest.json` in the examples directory.
+
+    The catalog is built off the event loop with file existence, sizes and image
+    dimensions resolved up front, then swapped in whole, so lookups never touch
+    the disk. `start()` polls the manifest and the files it names every
+    `reload_interval` seconds and rebuilds the catalog when any of them change.
+    """
+
+    def __init__(self, directory: Path, reload_interval: float = 0.0) -> None:
         self._directory = directory
         self._manifest_path = directory / "manifest.json"
-        self._examples: dict[str, Example] = {}
+        self._reload_interval = reload_interval
+        self._catalog = _Catalog()
+        self._task: asyncio.Task[None] | None = None
 
     def load(self) -> None:
-        if not self._manifest_path.exists():
-            self._examples = {}
-            return
+        self._catalog = self._build(self._catalog)
+
+    async def reload(self) -> bool:
+        """Rebuild the catalog if the manifest or an example file changed."""
+        catalog = self._catalog
+        if await asyncio.to_thread(self._current_stamps, catalog) == catalog.stamps:
+            return False
+        self._catalog = await asyncio.to_thread(self._build, catalog)
+        logger.info("Examples catalog reloaded: %s styles", len(self._catalog.examples))
+        return True
+
+    def start(self) -> None:
+        if self._task is None and self._reload_interval > 0:
+            self._task = asyncio.create_task(self._watch(), name="examples-reload")
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def list_examples(self) -> Iterable[Example]:
+        return self._catalog.examples.values()
+
+    def get_by_style(self, style: str) -> Example | None:
+        return self._catalog.examples.get(style)
+
+    def photo(self, example: Example) -> InputFile | str:
+        """What to pass to `answer_photo`: the cached file_id, or the file itself."""
+        return example.file_id or FSInputFile(example.file_path)
+
+    def remember_file_id(self, example: Example, file_id: str) -> None:
+        example.file_id = file_id
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self._reload_interval)
+            try:
+                await self.reload()
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # pragma: no cover - keep watching after a bad manifest
+                logger.exception("Failed to reload examples from %s", self._manifest_path)
+
+    def _build(self, previous: _Catalog) -> _Catalog:
+        manifest_stamp = _stamp(self._manifest_path)
+        if manifest_stamp is None:
+            return _Catalog(stamps=((self._manifest_path.as_posix(), None),))
         with self._manifest_path.open("r", encoding="utf-8") as file:
             items = json.load(file)
-        result: dict[str, Example] = {}
+        examples: dict[str, Example] = {}
+        stamps: list[tuple[str, FileStamp]] = [(self._manifest_path.as_posix(), manifest_stamp)]
         for item in items:
             style = item["style"]
-            file_name = item["file"]
+            file_path = self._directory / item["file"]
+            stamp = _stamp(file_path)
+            stamps.append((file_path.as_posix(), stamp))
             example = Example(
                 style=style,
                 title=item.get("title", style.title()),
                 caption=item.get("caption", ""),
-                file_path=self._directory / file_name,
+                file_path=file_path,
+                available=stamp is not None,
+                size=stamp[1] if stamp else 0,
+                stamp=stamp,
             )
-            result[style] = example
-        self._examples = result
+            known = previous.examples.get(style)
+            if known and known.file_path == file_path and known.stamp == stamp:
+                example.width, example.height, example.file_id = known.width, known.height, known.file_id
+            elif stamp is not None:
+                example.width, example.height = probe_size(file_path) or (None, None)
+            examples[style] = example
+        return _Catalog(examples=examples, stamps=tuple(stamps))
 
-    def list_examples(self) -> Iterable[Example]:
-        return self._examples.values()
+    def _current_stamps(self, catalog: _Catalog) -> tuple[tuple[str, FileStamp], ...]:
+        current = _stamp(self._manifest_path)
+        if not catalog.stamps or catalog.stamps[0][1] != current:
+            # The manifest itself changed; the file list may differ, so force a rebuild.
+            return ((self._manifest_path.as_posix(), current),)
+        return tuple((path, _stamp(Path(path))) for path, _ in catalog.stamps)
 
-    def get_by_style(self, style: str) -> Example | None:
-        return self._examples.get(style)
+
+def _stamp(path: Path) -> FileStamp:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
 
 
 __all__ = ["ExamplesService", "Example"]
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Sequence
+
+from aiogram import Bot
+
+from ..repositories.faces import FaceRepository
+from ..storage import FileStorage
+
+logger = logging.getLogger(__name__)
+
+
+class FaceMaterializer:
+    """Turns Telegram face photos into stored files, downloading each photo at most once.
+
+    `file_unique_id` is the same for a photo however it reaches the bot, so a photo
+    that is already stored is reused instead of downloaded again. Concurrent requests
+    for one photo share a single download, and at most `max_concurrency` downloads
+    run at a time.
+    """
+
+    def __init__(self, storage: FileStorage, faces: FaceRepository, max_concurrency: int = 4) -> None:
+        self._storage = storage
+        self._faces = faces
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self._inflight: dict[str, asyncio.Future[Path]] = {}
+
+    async def fetch(self, bot: Bot, user_id: int, file_id: str, file_unique_id: str | None = None) -> Path:
+        if file_unique_id:
+            known = await self._faces.find_path_by_unique_id(file_unique_id)
+            if known:
+                path = await self._storage.materialize(known)
+                if path:
+                    return path
+        key = file_unique_id or file_id
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        pending = asyncio.ensure_future(self._download(bot, user_id, file_id))
+        self._inflight[key] = pending
+        pending.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(pending)
+
+    async def ensure(
+        self,
+        bot: Bot,
+        user_id: int,
+        *,
+        face_id: int | None,
+        file_path: str | None,
+        file_id: str | None,
+        file_unique_id: str | None = None,
+    ) -> Path:
+        """Return a local file for a saved face, re-fetching it if the stored copy is gone."""
+        path, fetched = await self._resolve(bot, user_id, file_path, file_id, file_unique_id)
+        if fetched and face_id:
+            await self._faces.update_file_path(face_id, user_id, path.as_posix())
+        return path
+
+    async def prepare(
+        self,
+        bot: Bot,
+        user_id: int,
+        faces: Sequence[dict[str, Any]],
+        on_ready: Callable[[Path], Awaitable[None]] | None = None,
+    ) -> list[Path]:
+        """Resolve several faces (as kept in FSM data) concurrently, keeping their order.
+
+        `on_ready` runs for each face as soon as its file is local, so callers can
+        start encoding it while the rest are still downloading. Re-fetched paths
+        are written back in a single statement.
+        """
+
+        async def resolve(face: dict[str, Any]) -> tuple[Path, bool]:
+            resolved = await self._resolve(
+                bot, user_id, face.get("file_path"), face.get("file_id"), face.get("file_unique_id")
+            )
+            if on_ready:
+                await on_ready(resolved[0])
+            return resolved
+
+        results = await asyncio.gather(*(resolve(face) for face in faces))
+        refetched = [(face, path) for face, (path, fetched) in zip(faces, results) if fetched]
+        updates = [(face["face_id"], path.as_posix()) for face, path in refetched if face.get("face_id")]
+        if updates:
+            await self._faces.update_file_paths(user_id, updates)
+        for face, path in refetched:
+            face["file_path"] = path.as_posix()
+        return [path for path, _ in results]
+
+    async def _resolve(
+        self,
+        bot: Bot,
+        user_id: int,
+        file_path: str | None,
+        file_id: str | None,
+        file_unique_id: str | None,
+    ) -> tuple[Path, bool]:
+        if file_path:
+            path = await self._storage.materialize(file_path)
+            if path:
+                return path, False
+        if not file_id:
+            raise RuntimeError("Не удалось получить файл лица.")
+        return await self.fetch(bot, user_id, file_id, file_unique_id), True
+
+    async def _download(self, bot: Bot, user_id: int, file_id: str) -> Path:
+        async with self._semaphore:
+            logger.debug("Downloading face %s", file_id)
+            return await self._storage.save_face(bot, user_id, file_id)
+
+
+__all__ = ["FaceMaterializer"]
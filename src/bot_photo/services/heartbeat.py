@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from ..repositories.prompts import PromptRepository
+from ..repositories.sessions import SessionRepository
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationHeartbeat:
+    """Marks the generations this process is running as alive.
+
+    Handlers wrap the scheduler wait and the upstream call in `track`; every
+    `interval_seconds` the tracked rows get a fresh `heartbeat_at`, which is what
+    recovery measures staleness from, so rows queued or generating on any worker
+    of a cluster are left alone. `is_live` answers for this process directly.
+    """
+
+    def __init__(self, sessions: SessionRepository, prompts: PromptRepository, interval_seconds: float = 60.0) -> None:
+        self._repos = {"session": sessions, "prompt": prompts}
+        self._interval = interval_seconds
+        self._live: dict[str, dict[int, int]] = {kind: {} for kind in self._repos}
+        self._task: asyncio.Task[None] | None = None
+
+    @asynccontextmanager
+    async def track(self, kind: str, row_id: int) -> AsyncIterator[None]:
+        live = self._live[kind]
+        live[row_id] = live.get(row_id, 0) + 1
+        try:
+            yield
+        finally:
+            live[row_id] -= 1
+            if not live[row_id]:
+                del live[row_id]
+
+    def is_live(self, kind: str, row_id: int) -> bool:
+        return row_id in self._live[kind]
+
+    async def beat(self) -> int:
+        """Refresh `heartbeat_at` of every tracked row; returns how many were touched."""
+        touched = 0
+        for kind, repo in self._repos.items():
+            if self._live[kind]:
+                touched += await repo.touch_heartbeat(list(self._live[kind]))
+        return touched
+
+    def start(self) -> None:
+        if self._task is None and self._interval > 0:
+            self._task = asyncio.create_task(self._run_forever(), name="generation-heartbeat")
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            try:
+                await self.beat()
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # pragma: no cover - keep beating after a failed pass
+                logger.exception("Failed to refresh generation heartbeats")
+
+
+__all__ = ["GenerationHeartbeat"]
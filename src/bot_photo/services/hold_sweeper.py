@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from .tokens import TokenService
+
+logger = logging.getLogger(__name__)
+
+
+class HoldSweeper:
+    """Releases token holds that outlived their TTL every `interval_seconds`."""
+
+    def __init__(self, tokens: TokenService, interval_seconds: float = 60.0) -> None:
+        self._tokens = tokens
+        self._interval = interval_seconds
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        if self._task is None and self._interval > 0:
+            self._task = asyncio.create_task(self._run_forever(), name="token-hold-sweeper")
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run_forever(self) -> None:
+        while True:
+            try:
+                await self._tokens.release_expired_holds()
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # pragma: no cover - keep sweeping after a failed pass
+                logger.exception("Failed to release expired token holds")
+            await asyncio.sleep(self._interval)
+
+
+__all__ = ["HoldSweeper"]
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import logging
+from typing import Awaitable, Callable
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+
+class HttpServer:
+    """Small local aiohttp server shared by metrics and other internal endpoints."""
+
+    def __init__(self, host: str, port: int) -> None:
+        self._host = host
+        self._port = port
+        self._app = web.Application()
+        self._runner: web.AppRunner | None = None
+
+    def add_get(self, path: str, handler: Handler) -> None:
+        self._app.router.add_get(path, handler)
+
+    def add_post(self, path: str, handler: Handler) -> None:
+        self._app.router.add_post(path, handler)
+
+    async def start(self) -> None:
+        if self._runner:
+            return
+        self._runner = web.AppRunner(self._app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self._host, self._port).start()
+        logger.info("HTTP server listening on http://%s:%s", self._host, self._port)
+
+    async def close(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+__all__ = ["HttpServer"]
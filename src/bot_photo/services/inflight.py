@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import logging
+from types import TracebackType
+
+from ..models import User
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIER = "default"
+
+BUSY_TEXT = "⏳ У тебя уже идёт генерация. Дождись результата и попробуй снова."
+
+
+def parse_limits(value: str | None) -> dict[str, int]:
+    """Parse `tier=limit` pairs such as `default=1,admin=3`."""
+    limits: dict[str, int] = {}
+    for part in (value or "").split(","):
+        tier, sep, limit = part.partition("=")
+        if sep and tier.strip():
+            limits[tier.strip()] = int(limit)
+    return limits
+
+
+def user_tier(user: User) -> str:
+    return "admin" if user.is_admin else DEFAULT_TIER
+
+
+class InflightLease:
+    """One running generation of a user; leaving the `async with` block frees the slot."""
+
+    def __init__(self, registry: InflightRegistry, user_id: int) -> None:
+        self._registry = registry
+        self.user_id = user_id
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._registry._release(self.user_id)
+
+    async def __aenter__(self) -> InflightLease:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.release()
+
+
+class InflightRegistry:
+    """Counts running generations per user, shared by every handler that starts one.
+
+    A user may have at most `limits[tier]` generations in flight (the `default`
+    tier's limit applies to tiers that are not listed; <= 0 means no cap). Extra
+    submissions are rejected up front, before any tokens are held or an upstream
+    call is made.
+    """
+
+    def __init__(self, limits: dict[str, int]) -> None:
+        self._limits = dict(limits)
+        self._running: dict[int, int] = {}
+
+    def limit(self, tier: str) -> int:
+        return self._limits.get(tier, self._limits.get(DEFAULT_TIER, 1))
+
+    def running(self, user_id: int) -> int:
+        return self._running.get(user_id, 0)
+
+    def try_acquire(self, user_id: int, tier: str = DEFAULT_TIER) -> InflightLease | None:
+        limit = self.limit(tier)
+        running = self._running.get(user_id, 0)
+        if 0 < limit <= running:
+            logger.info("Rejected generation of user %s: %s already running (tier %s)", user_id, running, tier)
+            return None
+        self._running[user_id] = running + 1
+        return InflightLease(self, user_id)
+
+    def _release(self, user_id: int) -> None:
+        running = self._running.get(user_id, 0) - 1
+        if running > 0:
+            self._running[user_id] = running
+        else:
+            self._running.pop(user_id, None)
+
+
+__all__ = ["BUSY_TEXT", "DEFAULT_TIER", "InflightLease", "InflightRegistry", "parse_limits", "user_tier"]
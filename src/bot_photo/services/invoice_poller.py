@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+from aiogram import Bot
+
+from ..db import Database
+from ..models import LedgerReason, Payment
+from ..repositories.payments import PaymentRepository
+from .crypto_pay import MAX_INVOICES_PER_REQUEST, CryptoPayService
+from .scheduler import PriorityClassifier
+from .tokens import TokenService
+
+if TYPE_CHECKING:
+    from aiocryptopay.models.invoice import Invoice
+
+logger = logging.getLogger(__name__)
+
+
+class InvoicePoller:
+    """Background reconciler for Crypto Pay invoices users have not confirmed by hand.
+
+    Every `interval_seconds` it takes the pending payments that are due, asks Crypto Pay
+    about up to `batch_size` of them per `getInvoices` call, credits the paid ones and
+    tells their users. Invoices that are still active are re-checked with exponential
+    backoff capped at `max_backoff_seconds`; expired ones are closed and never polled
+    again. `credit` is shared with the manual "check payment" button and the Crypto Pay
+    webhook: claiming the row and adding the tokens happen in one transaction, so an
+    invoice is credited exactly once whichever path sees it first, and the user's
+    cached scheduler class is dropped so the purchase counts right away.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        crypto: CryptoPayService,
+        payments: PaymentRepository,
+        tokens: TokenService,
+        *,
+        interval_seconds: float = 30.0,
+        batch_size: int = 100,
+        max_backoff_seconds: float = 1800.0,
+        priorities: PriorityClassifier | None = None,
+    ) -> None:
+        self._database = database
+        self._crypto = crypto
+        self._payments = payments
+        self._tokens = tokens
+        self._interval = interval_seconds
+        self._batch_size = max(1, min(batch_size, MAX_INVOICES_PER_REQUEST))
+        self._max_backoff = max(max_backoff_seconds, interval_seconds)
+        self._priorities = priorities
+        self._bot: Bot | None = None
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self, bot: Bot) -> None:
+        self._bot = bot
+        if self._task is None and self._interval > 0:
+            self._task = asyncio.create_task(self._run_forever(), name="invoice-poller")
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def poll_once(self) -> int:
+        """Check every due invoice once; returns how many payments were credited."""
+        credited = 0
+        while True:
+            due = await self._payments.due_for_check(self._batch_size)
+            if not due:
+                break
+            invoices = {
+                invoice.invoice_id: invoice
+                for invoice in await self._crypto.get_invoices([payment.invoice_id for payment in due])
+            }
+            waiting: list[int] = []
+            for payment in due:
+                invoice = invoices.get(payment.invoice_id)
+                status = invoice_status(invoice) if invoice else None
+                if status == "paid":
+                    result = await self.credit(payment.invoice_id, invoice.paid_at)
+                    if result is not None:
+                        credited += 1
+                        await self.notify(*result)
+                elif status == "expired":
+                    await self._payments.update_status(payment.invoice_id, "expired")
+                else:
+                    waiting.append(payment.invoice_id)
+            await self._payments.postpone_checks(waiting, self._interval, self._max_backoff)
+            if len(due) < self._batch_size:
+                break
+        if credited:
+            logger.info("Credited %s paid invoices", credited)
+        return credited
+
+    async def credit(self, invoice_id: int, paid_at: datetime | str | None = None) -> tuple[Payment, int] | None:
+        """Credit a paid invoice exactly once.
+
+        Returns the payment and the user's new balance, or None if the invoice is
+        unknown or was already credited.
+        """
+        async with self._database.transaction():
+            payment = await self._payments.claim_credit(invoice_id, paid_at)
+            if payment is None:
+                return None
+            balance = await self._tokens.add(
+                payment.user_id, payment.tokens, LedgerReason.PAYMENT, f"invoice:{invoice_id}"
+            )
+        if self._priorities:
+            self._priorities.forget(payment.user_id)
+        return payment, balance
+
+    async def notify(self, payment: Payment, balance: int) -> None:
+        if self._bot is None:
+            return
+        text = (
+            "<b>Оплата прошла ✅</b>\n\n"
+            f"Зачислено: {payment.tokens} токенов\n"
+            f"Баланс: {balance} токенов"
+        )
+        try:
+            await self._bot.send_message(payment.user_id, text, parse_mode="HTML")
+        except Exception:  # pragma: no cover - the tokens are credited either way
+            logger.warning("Failed to notify user %s about a credited payment", payment.user_id, exc_info=True)
+
+    async def _run_forever(self) -> None:
+        while True:
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # pragma: no cover - keep polling after API errors
+                logger.exception("Invoice polling failed")
+            await asyncio.sleep(self._interval)
+
+
+def invoice_status(invoice: Invoice) -> str:
+    return str(invoice.status).lower()
+
+
+__all__ = ["InvoicePoller", "invoice_status"]
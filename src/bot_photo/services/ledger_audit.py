@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from ..metrics import MetricsRegistry
+from .tokens import TokenService
+
+logger = logging.getLogger(__name__)
+
+
+class LedgerAuditor:
+    """Periodically checks that every `users.tokens` equals the sum of the user's ledger.
+
+    Mismatches are logged by `TokenService.check_consistency` and exported as the
+    `token_ledger_drift_users` gauge so an alert can fire on anything above zero.
+    """
+
+    def __init__(
+        self,
+        tokens: TokenService,
+        *,
+        interval_seconds: float = 3600.0,
+        metrics: MetricsRegistry | None = None,
+    ) -> None:
+        self._tokens = tokens
+        self._interval = interval_seconds
+        self._drift_gauge = (
+            metrics.gauge("token_ledger_drift_users", "Users whose balance disagrees with the token ledger.")
+            if metrics
+            else None
+        )
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        if self._task is None and self._interval > 0:
+            self._task = asyncio.create_task(self._run_forever(), name="ledger-audit")
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run_once(self) -> int:
+        drift = await self._tokens.check_consistency()
+        if self._drift_gauge:
+            self._drift_gauge.set(len(drift))
+        return len(drift)
+
+    async def _run_forever(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # pragma: no cover - keep auditing after a failed pass
+                logger.exception("Token ledger audit failed")
+            await asyncio.sleep(self._interval)
+
+
+__all__ = ["LedgerAuditor"]
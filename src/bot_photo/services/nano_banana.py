@@ -1,12 +1,22 @@
 from __future__ import annotations
 
+import asyncio
 import base64
 import json
+import time
+from collections import OrderedDict
 from pathlib import Path
 from typing import Any, Awaitable, Callable, Iterable
 
 import aiohttp
 
+from ..metrics import MetricsRegistry, current_update_stats
+from ..storage.files import content_hash
+
+# Base64 payloads of content-addressed faces, keyed by sha256. Faces are reused
+# across generations, so re-reading and re-encoding them each time is wasted work.
+ENCODED_CACHE_SIZE = 64
+
 
 class NanoBananaAPIError(RuntimeError):
     def __init__(self, status: int, payload: Any) -> None:
@@ -35,12 +45,29 @@ class NanoBananaAPIError(RuntimeError):
 
 
 class NanoBananaClient:
-    def __init__(self, api_key: str, base_url: str, model: str, fallback_model: str | None) -> None:
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str,
+        model: str,
+        fallback_model: str | None,
+        metrics: MetricsRegistry | None = None,
+    ) -> None:
         self._api_key = api_key
         self._base_url = base_url.rstrip("/")
         self._model = model
         self._fallback_model = fallback_model
         self._session: aiohttp.ClientSession | None = None
+        self._encoded_cache: OrderedDict[str, str] = OrderedDict()
+        self._request_duration = (
+            metrics.histogram(
+                "upstream_request_duration_seconds",
+                "Calls to the image generation API, by endpoint and HTTP status.",
+                ("endpoint", "status"),
+            )
+            if metrics
+            else None
+        )
 
     async def _ensure_session(self) -> aiohttp.ClientSession:
         if self._session and not self._session.closed:
@@ -52,37 +79,13 @@ class NanoBananaClient:
         if self._session and not self._session.closed:
             await self._session.close()
 
-    async def generate_photosession(
-        self,
-        style: str,
-        prompt: str | None,
-        orientation: str,
-        face_urls: Iterable[str],
-    ) -> dict[str, Any]:
-        base_prompt = prompt or f"Высококлассная реалистичная фотосессия в стиле {style}"
-
-        if orientation == "vertical":
-            aspect_ratio_prompt = "vertical aspect ratio, 9:16"
-        elif orientation == "horizontal":
-            aspect_ratio_prompt = "horizontal aspect ratio, 16:9"
-        else:
-            aspect_ratio_prompt = ""
-
-        if aspect_ratio_prompt:
-            base_prompt = f"{aspect_ratio_prompt}, {base_prompt}"
-
-        prompt_text = (
-            f"{base_prompt}, 1080p resolution, high-end retouch, natural skin texture, "
-            "подбери сцену, свет и композицию под стиль, "
-            "выбери одежду и аксессуары, гармоничные с локацией, "
-            "определи пол/образ по лицу и подбери соответствующий образ, "
-            "premium fashion lighting, cinematic depth of field"
-        )
+    async def generate_photosession(self, prompt_text: str, face_urls: Iterable[str]) -> dict[str, Any]:
+        """Generate from a full prompt (see `StyleRegistry.prompt`) and the face images."""
 
         async def _request(model: str, include_faces: bool) -> dict[str, Any]:
             parts: list[dict[str, Any]] = []
             if include_faces:
-                parts.extend(self._inline_face_parts(face_urls))
+                parts.extend(await self._inline_face_parts(face_urls))
             parts.append({"text": prompt_text})
             payload = {
                 "contents": [{"role": "user", "parts": parts}],
@@ -108,7 +111,7 @@ class NanoBananaClient:
         async def _request(model: str) -> dict[str, Any]:
             parts: list[dict[str, Any]] = []
             if face_urls:
-                parts.extend(self._inline_face_parts(face_urls))
+                parts.extend(await self._inline_face_parts(face_urls))
             parts.append({"text": text_prompt})
             payload = {
                 "contents": [{"role": "user", "parts": parts}],
@@ -121,15 +124,30 @@ class NanoBananaClient:
     async def _post(self, endpoint: str, payload: dict[str, Any]) -> dict[str, Any]:
         session = await self._ensure_session()
         url = f"{self._base_url}{endpoint}"
-        async with session.post(url, json=payload, timeout=aiohttp.ClientTimeout(total=120)) as resp:
-            if resp.status >= 400:
-                text = await resp.text()
-                try:
-                    data = json.loads(text)
-                except json.JSONDecodeError:
-                    data = text
-                raise NanoBananaAPIError(resp.status, data)
-            return await resp.json()
+        started = time.perf_counter()
+        status = "error"
+        try:
+            async with session.post(url, json=payload, timeout=aiohttp.ClientTimeout(total=120)) as resp:
+                status = str(resp.status)
+                if resp.status >= 400:
+                    text = await resp.text()
+                    try:
+                        data = json.loads(text)
+                    except json.JSONDecodeError:
+                        data = text
+                    raise NanoBananaAPIError(resp.status, data)
+                return await resp.json()
+        finally:
+            self._observe(endpoint, status, started)
+
+    def _observe(self, endpoint: str, status: str, started: float) -> None:
+        elapsed = time.perf_counter() - started
+        if self._request_duration:
+            self._request_duration.observe(elapsed, endpoint=endpoint, status=status)
+        stats = current_update_stats()
+        if stats:
+            stats.upstream_calls += 1
+            stats.upstream_seconds += elapsed
 
     async def _with_fallback(
         self, request: Callable[[str], Awaitable[dict[str, Any]]]
@@ -149,18 +167,44 @@ class NanoBananaClient:
         if last_error:
             raise last_error
 
-    def _inline_face_parts(self, sources: Iterable[str]) -> Iterable[dict[str, Any]]:
+    async def preload_face(self, path: str | Path) -> None:
+        """Encode a face ahead of the request so building the payload is a cache hit."""
+        path = Path(path)
+        if content_hash(path):
+            await self._encode_file(path)
+
+    async def _inline_face_parts(self, sources: Iterable[str]) -> list[dict[str, Any]]:
+        parts: list[dict[str, Any]] = []
         for source in sources:
             path = Path(source)
-            if not path.exists():
+            encoded = await self._encode_file(path)
+            if encoded is None:
                 continue
-            mime = self._guess_mime_type(path)
-            yield {
-                "inline_data": {
-                    "mime_type": mime,
-                    "data": base64.b64encode(path.read_bytes()).decode("utf-8"),
-                }
-            }
+            parts.append({"inline_data": {"mime_type": self._guess_mime_type(path), "data": encoded}})
+        return parts
+
+    async def _encode_file(self, path: Path) -> str | None:
+        """Base64 of a face file, None if it is missing; cache misses are read off the event loop."""
+        key = content_hash(path)
+        if key:
+            cached = self._cached_encoding(key)
+            if cached:
+                return cached
+        encoded = await asyncio.to_thread(_encode_bytes, path)
+        if key and encoded is not None:
+            self._remember_encoding(key, encoded)
+        return encoded
+
+    def _cached_encoding(self, key: str) -> str | None:
+        encoded = self._encoded_cache.get(key)
+        if encoded is not None:
+            self._encoded_cache.move_to_end(key)
+        return encoded
+
+    def _remember_encoding(self, key: str, encoded: str) -> None:
+        self._encoded_cache[key] = encoded
+        if len(self._encoded_cache) > ENCODED_CACHE_SIZE:
+            self._encoded_cache.popitem(last=False)
 
     @staticmethod
     def _guess_mime_type(path: Path) -> str:
@@ -191,4 +235,46 @@ class NanoBananaClient:
         return headers
 
 
-__all__ = ["NanoBananaClient", "NanoBananaAPIError"]
+def _encode_bytes(path: Path) -> str | None:
+    try:
+        return base64.b64encode(path.read_bytes()).decode("utf-8")
+    except FileNotFoundError:
+        return None
+
+
+def extract_image(response: dict[str, Any]) -> bytes:
+    """First image of a generation response, inline part or `images`/`data` entry."""
+    data = _extract_inline_image(response)
+    if data:
+        return data
+    images = response.get("images") or response.get("data")
+    if images:
+        raw = images[0]
+        if isinstance(raw, dict):
+            raw = raw.get("b64_json") or raw.get("content")
+        if isinstance(raw, str):
+            return base64.b64decode(raw)
+        if isinstance(raw, bytes):
+            return raw
+    raise RuntimeError("Ответ модели пустой")
+
+
+def _extract_inline_image(response: dict[str, Any]) -> bytes | None:
+    contents = [candidate.get("content") or {} for candidate in response.get("candidates") or []]
+    contents += response.get("contents") or []
+    for content in contents:
+        data = _decode_inline_parts(content.get("parts") or [])
+        if data:
+            return data
+    return None
+
+
+def _decode_inline_parts(parts: list[dict[str, Any]]) -> bytes | None:
+    for part in parts:
+        inline_data = part.get("inline_data") or part.get("inlineData")
+        if isinstance(inline_data, dict) and inline_data.get("data"):
+            return base64.b64decode(inline_data["data"])
+    return None
+
+
+__all__ = ["NanoBananaClient", "NanoBananaAPIError", "extract_image"]
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import logging
+
+from ..models import UserQuota
+from ..repositories.quotas import QuotaRepository
+
+logger = logging.getLogger(__name__)
+
+EVICTION_BATCH = 20
+
+
+class QuotaService:
+    """Per-user storage limits. Any limit <= 0 means no cap.
+
+    Face uploads are refused once a user holds `max_faces` faces or `max_face_bytes`
+    of them. Generations are never refused: once their stored results exceed
+    `max_generation_bytes`, the oldest ones lose their file (the history row stays;
+    storage GC removes the unreferenced file).
+    """
+
+    def __init__(
+        self,
+        quotas: QuotaRepository,
+        *,
+        max_faces: int = 0,
+        max_face_bytes: int = 0,
+        max_generation_bytes: int = 0,
+    ) -> None:
+        self._quotas = quotas
+        self.max_faces = max_faces
+        self.max_face_bytes = max_face_bytes
+        self.max_generation_bytes = max_generation_bytes
+
+    async def usage(self, user_id: int) -> UserQuota:
+        return await self._quotas.get(user_id)
+
+    async def can_add_face(self, user_id: int) -> bool:
+        usage = await self._quotas.get(user_id)
+        if self.max_faces > 0 and usage.face_count >= self.max_faces:
+            return False
+        if self.max_face_bytes > 0 and usage.face_bytes >= self.max_face_bytes:
+            return False
+        return True
+
+    async def enforce_generations(self, user_id: int) -> int:
+        """Drop the oldest stored results until the user fits; returns how many were dropped.
+
+        The newest result is always kept, even if it alone is over the limit.
+        """
+        if self.max_generation_bytes <= 0:
+            return 0
+        usage = await self._quotas.get(user_id)
+        excess = usage.generation_bytes - self.max_generation_bytes
+        remaining = usage.generation_count
+        evicted = 0
+        while excess > 0 and remaining > 1:
+            batch = await self._quotas.oldest_generations(user_id, min(EVICTION_BATCH, remaining - 1))
+            if not batch:
+                break
+            for source, row_id, _, size in batch:
+                if excess <= 0:
+                    break
+                await self._quotas.detach_generation(source, row_id)
+                excess -= size
+                remaining -= 1
+                evicted += 1
+        if evicted:
+            logger.info("Evicted %s old generations of user %s over quota", evicted, user_id)
+        return evicted
+
+
+__all__ = ["QuotaService"]
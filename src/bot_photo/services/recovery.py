@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import AbstractAsyncContextManager, nullcontext
+from dataclasses import dataclass
+from typing import Any
+
+from aiogram import Bot
+from aiogram.types import FSInputFile
+
+from ..db import Database
+from ..metrics import MetricsRegistry
+from ..models import LedgerReason, PromptGeneration, Session, TokenHold
+from ..repositories.faces import FaceRepository
+from ..repositories.prompts import PromptRepository
+from ..repositories.sessions import SessionRepository
+from ..storage import TELEGRAM, FileStorage
+from .face_materializer import FaceMaterializer
+from .heartbeat import GenerationHeartbeat
+from .nano_banana import NanoBananaClient, extract_image
+from .quotas import QuotaService
+from .scheduler import DEFAULT_CLASS, GenerationScheduler
+from .shutdown import ShutdownCoordinator
+from .styles import StyleRegistry
+from .tokens import InsufficientTokensError, TokenService
+
+logger = logging.getLogger(__name__)
+
+RESUMED_CAPTION = "Готово! Генерация прервалась из-за перезапуска бота, но мы её довели до конца."
+ABANDONED_TEXT = (
+    "⚠️ Генерация прервалась из-за сбоя и не будет завершена. Токены за неё не списаны — запусти её снова."
+)
+
+
+@dataclass(slots=True)
+class RecoverySummary:
+    resumed: int = 0
+    refunded: int = 0
+    tokens_returned: int = 0
+
+
+class GenerationRecovery:
+    """Finds generations stuck in `processing` after a crash and settles them.
+
+    A row is stuck once it has been processing for `stale_seconds` without a heartbeat
+    (see `GenerationHeartbeat`); rows this process is still running are skipped. If it was created
+    with its inputs stored and has not been resumed before, a fresh hold is placed
+    and the generation runs again in the background, delivering to the user's chat.
+    Otherwise (no inputs, already resumed once, or not enough tokens) the row is
+    marked failed and whatever it reserved or charged is given back. Each batch is
+    settled in one transaction; runs at startup and every `interval_seconds`.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        sessions: SessionRepository,
+        prompts: PromptRepository,
+        faces: FaceRepository,
+        tokens: TokenService,
+        *,
+        nano: NanoBananaClient,
+        materializer: FaceMaterializer,
+        styles: StyleRegistry,
+        storage: FileStorage,
+        scheduler: GenerationScheduler,
+        quotas: QuotaService,
+        shutdown: ShutdownCoordinator | None = None,
+        heartbeat: GenerationHeartbeat | None = None,
+        stale_seconds: float = 900.0,
+        interval_seconds: float = 300.0,
+        batch_size: int = 50,
+        metrics: MetricsRegistry | None = None,
+    ) -> None:
+        self._db = database
+        self._sessions = sessions
+        self._prompts = prompts
+        self._faces = faces
+        self._tokens = tokens
+        self._nano = nano
+        self._materializer = materializer
+        self._styles = styles
+        self._storage = storage
+        self._scheduler = scheduler
+        self._quotas = quotas
+        self._shutdown = shutdown
+        self._heartbeat = heartbeat
+        self._stale = stale_seconds
+        self._interval = interval_seconds
+        self._batch_size = batch_size
+        self._recovered = (
+            metrics.counter(
+                "generation_recovery_total",
+                "Stuck generations settled by the recovery sweep.",
+                ("kind", "outcome"),
+            )
+            if metrics
+            else None
+        )
+        self._bot: Bot | None = None
+        self._task: asyncio.Task[None] | None = None
+        self._resumes: set[asyncio.Task[None]] = set()
+
+    def start(self, bot: Bot) -> None:
+        self._bot = bot
+        if self._task is None and self._interval > 0:
+            self._task = asyncio.create_task(self._run_forever(), name="generation-recovery")
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # A cancelled resume leaves its row processing with `recovered_at` set; the next sweep refunds it.
+        for task in list(self._resumes):
+            task.cancel()
+        if self._resumes:
+            await asyncio.gather(*self._resumes, return_exceptions=True)
+
+    async def run_once(self) -> RecoverySummary:
+        summary = RecoverySummary()
+        sessions = self._not_live("session", await self._sessions.stale_processing(self._stale, self._batch_size))
+        if sessions:
+            await self._settle("session", sessions, summary)
+        prompts = self._not_live("prompt", await self._prompts.stale_processing(self._stale, self._batch_size))
+        if prompts:
+            await self._settle("prompt", prompts, summary)
+        if summary.resumed or summary.refunded:
+            logger.info(
+                "Recovered stuck generations: %s resumed, %s refunded (%s tokens returned)",
+                summary.resumed,
+                summary.refunded,
+                summary.tokens_returned,
+            )
+        return summary
+
+    def _not_live(self, kind: str, rows: list[Any]) -> list[Any]:
+        if self._heartbeat is None:
+            return rows
+        return [row for row in rows if not self._heartbeat.is_live(kind, row.id)]
+
+    async def _settle(
+        self, kind: str, rows: list[Session] | list[PromptGeneration], summary: RecoverySummary
+    ) -> None:
+        resumed: list[tuple[Session | PromptGeneration, TokenHold]] = []
+        abandoned: list[Session | PromptGeneration] = []
+        repo = self._sessions if kind == "session" else self._prompts
+        reason = LedgerReason.SESSION if kind == "session" else LedgerReason.PROMPT
+        async with self._db.transaction():
+            for row in rows:
+                ref = f"{kind}:{row.id}"
+                hold = await self._resume_hold(row, ref, reason) if self._bot else None
+                if hold and await repo.mark_resumed(row.id):
+                    resumed.append((row, hold))
+                    continue
+                summary.tokens_returned += await self._tokens.refund_abandoned(
+                    row.user_id, ref, row.tokens_spent or 0
+                )
+                await repo.update_status(row.id, status="failed")
+                abandoned.append(row)
+        summary.resumed += len(resumed)
+        summary.refunded += len(abandoned)
+        if self._recovered:
+            if resumed:
+                self._recovered.inc(len(resumed), kind=kind, outcome="resumed")
+            if abandoned:
+                self._recovered.inc(len(abandoned), kind=kind, outcome="refunded")
+        for row in abandoned:
+            await self._notify(row.user_id, ABANDONED_TEXT)
+        for row, hold in resumed:
+            task = asyncio.create_task(self._resume(kind, row, hold), name=f"resume-{kind}-{row.id}")
+            self._resumes.add(task)
+            task.add_done_callback(self._resumes.discard)
+
+    async def _resume_hold(self, row: Session | PromptGeneration, ref: str, reason: str) -> TokenHold | None:
+        """Swap the row's old hold for a fresh one, or None if it cannot be resumed."""
+        if row.inputs is None or row.recovered_at is not None or not row.tokens_spent:
+            return None
+        previous = await self._tokens.find_hold(ref)
+        if previous is None:
+            return None
+        if previous.status == "held":
+            await self._tokens.release(previous)
+        try:
+            return await self._tokens.hold(row.user_id, row.tokens_spent, reason, ref)
+        except InsufficientTokensError:
+            return None
+
+    async def _resume(self, kind: str, row: Session | PromptGeneration, hold: TokenHold) -> None:
+        if self._shutdown:
+            async with self._shutdown.track():
+                await self._resume_tracked(kind, row, hold)
+        else:
+            await self._resume_tracked(kind, row, hold)
+
+    async def _resume_tracked(self, kind: str, row: Session | PromptGeneration, hold: TokenHold) -> None:
+        repo = self._sessions if kind == "session" else self._prompts
+        try:
+            async with self._track(kind, row.id), self._scheduler.slot(row.user_id, DEFAULT_CLASS):
+                await self._tokens.extend(hold)
+                if kind == "session":
+                    result = await self._generate_session(row)
+                else:
+                    result = await self._generate_prompt(row)
+            image_path = await self._storage.save_generation(extract_image(result))
+            await self._bot.send_photo(
+                row.user_id,
+                FSInputFile(await self._storage.rendition(image_path, TELEGRAM.name, wait=False) or image_path),
+                caption=RESUMED_CAPTION,
+            )
+        except Exception:
+            logger.exception("Resuming %s %s failed", kind, row.id)
+            await self._tokens.release(hold)
+            await repo.update_status(row.id, status="failed")
+            if self._recovered:
+                self._recovered.inc(kind=kind, outcome="resume_failed")
+            await self._notify(row.user_id, ABANDONED_TEXT)
+            return
+        async with self._db.transaction():
+            await repo.update_status(row.id, status="ready", result_path=image_path.as_posix())
+            await self._tokens.commit(hold)
+        await self._quotas.enforce_generations(row.user_id)
+
+    def _track(self, kind: str, row_id: int) -> AbstractAsyncContextManager[None]:
+        return self._heartbeat.track(kind, row_id) if self._heartbeat else nullcontext()
+
+    async def _generate_session(self, session: Session) -> dict[str, Any]:
+        prepared = await self._materializer.prepare(
+            self._bot, session.user_id, session.inputs.get("faces") or [], on_ready=self._nano.preload_face
+        )
+        return await self._nano.generate_photosession(
+            self._styles.prompt(session.style, session.inputs.get("orientation"), session.prompt),
+            face_urls=[path.as_posix() for path in prepared],
+        )
+
+    async def _generate_prompt(self, record: PromptGeneration) -> dict[str, Any]:
+        face_urls: list[str] | None = None
+        face_id = record.inputs.get("face_id")
+        if face_id:
+            face = await self._faces.get_by_id(face_id, record.user_id)
+            if not face:
+                raise RuntimeError(f"Face {face_id} of user {record.user_id} is gone")
+            path = await self._materializer.ensure(
+                self._bot,
+                record.user_id,
+                face_id=face.id,
+                file_path=face.file_path,
+                file_id=face.file_id,
+                file_unique_id=face.file_unique_id,
+            )
+            face_urls = [path.as_posix()]
+        return await self._nano.generate_prompt(prompt=record.prompt, template=record.template, face_urls=face_urls)
+
+    async def _notify(self, user_id: int, text: str) -> None:
+        if not self._bot:
+            return
+        try:
+            await self._bot.send_message(user_id, text)
+        except Exception:  # pragma: no cover - the user may have blocked the bot
+            logger.warning("Could not notify user %s about a recovered generation", user_id)
+
+    async def _run_forever(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # pragma: no cover - keep sweeping after a failed pass
+                logger.exception("Generation recovery pass failed")
+            await asyncio.sleep(self._interval)
+
+
+__all__ = ["ABANDONED_TEXT", "GenerationRecovery", "RESUMED_CAPTION", "RecoverySummary"]
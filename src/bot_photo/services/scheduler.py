@@ -0,0 +1,362 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Iterable
+
+from aiogram import types
+
+from ..metrics import MetricsRegistry
+from ..models import User
+from ..repositories.payments import PaymentRepository
+from ..repositories.quotas import QuotaRepository
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLASS = "default"
+PRIORITY_CLASSES = ("admin", "priority", "paid", "new", DEFAULT_CLASS)
+LANE = "priority"
+SHARED = "shared"
+
+# Called with the 1-based queue position while waiting, and with 0 once the slot is granted.
+PositionCallback = Callable[[int], Awaitable[None]]
+
+QUEUE_TEXT = "⏳ Ты в очереди: {position}-й. Генерация начнётся автоматически."
+
+
+def parse_weights(value: str | None) -> dict[str, float]:
+    """Parse `class=weight` pairs such as `admin=4,paid=3,new=2,default=1`."""
+    weights: dict[str, float] = {}
+    for part in (value or "").split(","):
+        name, sep, weight = part.partition("=")
+        if sep and name.strip():
+            weights[name.strip()] = float(weight)
+    return weights
+
+
+@dataclass(eq=False)
+class _Ticket:
+    user_id: int
+    priority: str
+    lane: bool
+    start: float
+    finish: float
+    seq: int
+    enqueued: float
+    future: asyncio.Future[None]
+    on_position: PositionCallback | None = None
+    position: int = 0
+    notified_at: float = field(default=0.0)
+    notification: asyncio.Task[None] | None = None
+    shown: bool = False
+    cancelled: bool = False
+
+    def __lt__(self, other: _Ticket) -> bool:
+        return (not self.lane, self.finish, self.seq) < (not other.lane, other.finish, other.seq)
+
+
+class GenerationScheduler:
+    """Admission control for upstream generation calls with weighted fair queuing.
+
+    At most `concurrency` generations run at once. Waiting requests are served in
+    order of their virtual finish time: every user is a flow, and each request
+    finishes `1 / weight` of its priority class after the later of its user's
+    previous finish and the virtual clock. A user with many requests therefore
+    interleaves with everyone else instead of going first, and heavier classes get
+    proportionally more turns. Waiters are told their queue position (at most
+    every `position_interval` seconds); the shown position only ever counts down.
+
+    Classes in `lane_classes` form the priority lane: their requests are served
+    before everyone else's, and `reserved` of the slots are kept for them alone
+    (at least one slot always stays shared). Each lane has its own queue-wait
+    target; `generation_wait_slo_total` counts waits that met or missed it.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 4,
+        weights: dict[str, float] | None = None,
+        *,
+        reserved: int = 0,
+        lane_classes: Iterable[str] = (),
+        lane_slo_seconds: float = 5.0,
+        shared_slo_seconds: float = 60.0,
+        position_interval: float = 3.0,
+        metrics: MetricsRegistry | None = None,
+    ) -> None:
+        self._concurrency = max(1, concurrency)
+        self._reserved = min(max(0, reserved), self._concurrency - 1)
+        self._lane_classes = frozenset(lane_classes)
+        self._slo = {LANE: lane_slo_seconds, SHARED: shared_slo_seconds}
+        self._weights = {name: weight for name, weight in (weights or {}).items() if weight > 0}
+        self._position_interval = position_interval
+        self._queue: list[_Ticket] = []
+        self._waiting = 0
+        self._running = 0
+        self._running_shared = 0
+        self._virtual_time = 0.0
+        self._last_finish: dict[int, float] = {}
+        self._seq = 0
+        self._notifications: set[asyncio.Task[None]] = set()
+        self._wait_seconds = (
+            metrics.histogram(
+                "generation_queue_wait_seconds",
+                "Time generation requests wait for an upstream slot.",
+                ("priority",),
+            )
+            if metrics
+            else None
+        )
+        self._service_seconds = (
+            metrics.histogram(
+                "generation_service_seconds",
+                "Time generation requests hold an upstream slot.",
+                ("priority",),
+            )
+            if metrics
+            else None
+        )
+        self._depth = metrics.gauge("generation_queue_depth", "Generation requests waiting for a slot.") if metrics else None
+        self._active = metrics.gauge("generation_running", "Generation requests holding a slot.") if metrics else None
+        self._slo_total = (
+            metrics.counter(
+                "generation_wait_slo_total",
+                "Generation requests whose queue wait met or missed their lane's target.",
+                ("lane", "outcome"),
+            )
+            if metrics
+            else None
+        )
+        if metrics:
+            target = metrics.gauge("generation_wait_slo_seconds", "Queue-wait target per lane.", ("lane",))
+            for lane, seconds in self._slo.items():
+                target.set(seconds, lane=lane)
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def weight(self, priority: str) -> float:
+        return self._weights.get(priority, self._weights.get(DEFAULT_CLASS, 1.0))
+
+    def lane(self, priority: str) -> str:
+        return LANE if priority in self._lane_classes else SHARED
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        user_id: int,
+        priority: str = DEFAULT_CLASS,
+        on_position: PositionCallback | None = None,
+    ) -> AsyncIterator[None]:
+        ticket = self._enqueue(user_id, priority, on_position)
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled():
+                self._release(ticket)
+            else:
+                ticket.cancelled = True
+                self._waiting -= 1
+                self._update_gauges()
+            raise
+        started = time.monotonic()
+        waited = started - ticket.enqueued
+        if self._wait_seconds:
+            self._wait_seconds.observe(waited, priority=priority)
+        if self._slo_total:
+            lane = LANE if ticket.lane else SHARED
+            self._slo_total.inc(lane=lane, outcome="met" if waited <= self._slo[lane] else "missed")
+        if ticket.notification:
+            await ticket.notification  # let an edit already in flight land before the running text
+        if ticket.shown and on_position:
+            await _notify(on_position, 0)
+        try:
+            yield
+        finally:
+            if self._service_seconds:
+                self._service_seconds.observe(time.monotonic() - started, priority=priority)
+            self._release(ticket)
+
+    def _enqueue(self, user_id: int, priority: str, on_position: PositionCallback | None) -> _Ticket:
+        start = max(self._virtual_time, self._last_finish.get(user_id, 0.0))
+        finish = start + 1.0 / self.weight(priority)
+        self._last_finish[user_id] = finish
+        self._seq += 1
+        ticket = _Ticket(
+            user_id=user_id,
+            priority=priority,
+            lane=priority in self._lane_classes,
+            start=start,
+            finish=finish,
+            seq=self._seq,
+            enqueued=time.monotonic(),
+            future=asyncio.get_running_loop().create_future(),
+            on_position=on_position,
+        )
+        heapq.heappush(self._queue, ticket)
+        self._waiting += 1
+        self._dispatch()
+        if not ticket.future.done():
+            self._report_positions()
+        self._update_gauges()
+        return ticket
+
+    def _dispatch(self) -> None:
+        """Grant slots to the head of the queue while there are slots it may use."""
+        while self._queue and self._running < self._concurrency:
+            ticket = self._queue[0]
+            if ticket.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            if not ticket.lane and self._running_shared >= self._concurrency - self._reserved:
+                break  # only lane requests, which sort first, may take the reserved slots
+            heapq.heappop(self._queue)
+            self._waiting -= 1
+            self._grant(ticket)
+
+    def _grant(self, ticket: _Ticket) -> None:
+        self._running += 1
+        if not ticket.lane:
+            self._running_shared += 1
+        self._virtual_time = max(self._virtual_time, ticket.start)
+        ticket.future.set_result(None)
+
+    def _release(self, ticket: _Ticket) -> None:
+        self._running -= 1
+        if not ticket.lane:
+            self._running_shared -= 1
+        self._dispatch()
+        if len(self._last_finish) > 1024:
+            # Flows that finished behind the virtual clock would restart from it anyway.
+            self._last_finish = {
+                user_id: finish for user_id, finish in self._last_finish.items() if finish > self._virtual_time
+            }
+        self._report_positions()
+        self._update_gauges()
+
+    def _report_positions(self) -> None:
+        if not any(ticket.on_position for ticket in self._queue):
+            return
+        now = time.monotonic()
+        waiting = sorted(ticket for ticket in self._queue if not ticket.cancelled)
+        for position, ticket in enumerate(waiting, start=1):
+            if not ticket.on_position:
+                continue
+            if ticket.position and (position >= ticket.position or now - ticket.notified_at < self._position_interval):
+                continue  # a lane arrival may push a waiter back, but the shown position never goes up
+            if ticket.notification and not ticket.notification.done():
+                continue
+            ticket.position = position
+            ticket.notified_at = now
+            task = asyncio.create_task(self._send_position(ticket))
+            ticket.notification = task
+            self._notifications.add(task)
+            task.add_done_callback(self._notifications.discard)
+
+    @staticmethod
+    async def _send_position(ticket: _Ticket) -> None:
+        # The slot may have been granted, or the wait given up, before this task ran.
+        if ticket.future.done() or ticket.cancelled or not ticket.on_position:
+            return
+        ticket.shown = True
+        await _notify(ticket.on_position, ticket.position)
+
+    def _update_gauges(self) -> None:
+        if self._depth:
+            self._depth.set(self._waiting)
+        if self._active:
+            self._active.set(self._running)
+
+
+class PriorityClassifier:
+    """Picks the scheduler class of a user: admins; `priority` customers, who were
+    credited at least `priority_min_tokens` in one payment within the last
+    `priority_window_days`; other paying customers; users who have not received a
+    result yet; and everyone else.
+
+    The purchase-based tier is cached per user for `cache_seconds`; `forget()`
+    drops a user's entry once a new payment is credited.
+    """
+
+    def __init__(
+        self,
+        payments: PaymentRepository,
+        quotas: QuotaRepository,
+        *,
+        priority_min_tokens: int = 250,
+        priority_window_days: float = 30.0,
+        cache_seconds: float = 300.0,
+    ) -> None:
+        self._payments = payments
+        self._quotas = quotas
+        self._min_tokens = priority_min_tokens
+        self._window_days = priority_window_days
+        self._cache_seconds = cache_seconds
+        self._tiers: dict[int, tuple[str | None, float]] = {}
+
+    async def classify(self, user: User) -> str:
+        if user.is_admin:
+            return "admin"
+        tier = await self._purchase_tier(user.telegram_id)
+        if tier:
+            return tier
+        if (await self._quotas.get(user.telegram_id)).generation_count == 0:
+            return "new"
+        return DEFAULT_CLASS
+
+    def forget(self, user_id: int) -> None:
+        self._tiers.pop(user_id, None)
+
+    async def _purchase_tier(self, user_id: int) -> str | None:
+        now = time.monotonic()
+        cached = self._tiers.get(user_id)
+        if cached and cached[1] > now:
+            return cached[0]
+        credited, recent_large = await self._payments.purchase_summary(
+            user_id, min_tokens=self._min_tokens, within_days=self._window_days
+        )
+        tier = "priority" if recent_large else "paid" if credited else None
+        if len(self._tiers) >= 4096:
+            self._tiers = {key: value for key, value in self._tiers.items() if value[1] > now}
+        self._tiers[user_id] = (tier, now + self._cache_seconds)
+        return tier
+
+
+def position_updater(status_message: types.Message, running_text: str) -> PositionCallback:
+    """Shows the queue position in `status_message`, then `running_text` once the slot is granted."""
+
+    async def update(position: int) -> None:
+        text = QUEUE_TEXT.format(position=position) if position else running_text
+        await status_message.edit_text(text)
+
+    return update
+
+
+async def _notify(callback: PositionCallback, position: int) -> None:
+    try:
+        await callback(position)
+    except Exception:  # pragma: no cover - feedback is best effort
+        logger.debug("Queue position update failed", exc_info=True)
+
+
+__all__ = [
+    "DEFAULT_CLASS",
+    "GenerationScheduler",
+    "LANE",
+    "PRIORITY_CLASSES",
+    "SHARED",
+    "PositionCallback",
+    "PriorityClassifier",
+    "QUEUE_TEXT",
+    "parse_weights",
+    "position_updater",
+]
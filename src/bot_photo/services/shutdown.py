@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from ..metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+INTERRUPTED_TEXT = "⚠️ Бот перезапускается, генерация прервана. Токены не списаны — запусти её снова через минуту."
+RESTARTING_TEXT = "Бот перезапускается, попробуй через минуту."
+
+
+class ShutdownCoordinator:
+    """Lets in-flight updates finish before the application is torn down.
+
+    Every update runs inside `track()`. Once `drain()` is called no new update is
+    admitted; running ones get up to `drain_seconds` to finish their generation and
+    deliver the result. Whatever is still running after that is cancelled, and the
+    handlers release its token hold and mark its row failed on the way out.
+    """
+
+    def __init__(self, drain_seconds: float = 30.0, *, metrics: MetricsRegistry | None = None) -> None:
+        self._drain_seconds = drain_seconds
+        self._tasks: set[asyncio.Task[object]] = set()
+        self._draining = False
+        self._inflight = metrics.gauge("updates_in_flight", "Updates being handled right now.") if metrics else None
+
+    @property
+    def draining(self) -> bool:
+        return self._draining
+
+    @property
+    def inflight(self) -> int:
+        return len(self._tasks)
+
+    @asynccontextmanager
+    async def track(self) -> AsyncIterator[None]:
+        task = asyncio.current_task()
+        if task is None or task in self._tasks:
+            yield
+            return
+        self._tasks.add(task)
+        self._update_gauge()
+        try:
+            yield
+        finally:
+            self._tasks.discard(task)
+            self._update_gauge()
+
+    async def drain(self) -> int:
+        """Stop admitting updates and wait for running ones; returns how many had to be cancelled."""
+        self._draining = True
+        pending = set(self._tasks)
+        if not pending:
+            return 0
+        logger.info("Waiting up to %.0fs for %s in-flight updates", self._drain_seconds, len(pending))
+        _, pending = await asyncio.wait(pending, timeout=self._drain_seconds)
+        if not pending:
+            logger.info("All in-flight updates finished")
+            return 0
+        logger.warning("Cancelling %s updates still running after the drain deadline", len(pending))
+        for task in pending:
+            task.cancel()
+        # Give the cancelled handlers a moment to release holds and notify users.
+        await asyncio.wait(pending, timeout=5.0)
+        return len(pending)
+
+    def _update_gauge(self) -> None:
+        if self._inflight:
+            self._inflight.set(len(self._tasks))
+
+
+__all__ = ["INTERRUPTED_TEXT", "RESTARTING_TEXT", "ShutdownCoordinator"]
@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator
+
+from ..repositories.blobs import BlobRepository
+from ..storage import FileStorage, create_file_storage
+from ..storage.backends import ObjectInfo
+from ..storage.renditions import is_rendition, original_stem
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class GcReport:
+    scanned: int = 0
+    referenced: int = 0
+    too_young: int = 0
+    orphaned: int = 0
+    deleted: int = 0
+    reclaimed_bytes: int = 0
+    passes_completed: int = 0
+    dry_run: bool = True
+    orphans: list[str] = field(default_factory=list)
+
+    def merge(self, other: GcReport) -> None:
+        self.scanned += other.scanned
+        self.referenced += other.referenced
+        self.too_young += other.too_young
+        self.orphaned += other.orphaned
+        self.deleted += other.deleted
+        self.reclaimed_bytes += other.reclaimed_bytes
+        self.passes_completed += other.passes_completed
+        self.orphans.extend(other.orphans)
+
+    def format(self) -> str:
+        action = "would delete" if self.dry_run else "deleted"
+        lines = [
+            f"scanned={self.scanned} referenced={self.referenced} too_young={self.too_young} "
+            f"orphaned={self.orphaned} {action}={self.orphaned if self.dry_run else self.deleted} "
+            f"bytes={self.reclaimed_bytes}"
+        ]
+        lines.extend(f"  {path}" for path in self.orphans)
+        return "\n".join(lines)
+
+
+@dataclass(slots=True)
+class _Candidate:
+    path: Path
+    size: int
+    mtime: float
+    # The file whose references keep this one alive (itself, or the original of a rendition).
+    owner: Path
+
+
+class StorageGarbageCollector:
+    """Incrementally reconciles the storage tree against blob reference counts.
+
+    Each step takes at most `batch_size` objects from the storage backend listing,
+    continuing where the previous step stopped, so a full pass is spread over many
+    small steps instead of one I/O burst. A file is removed only when its
+    `blobs.refcount` is 0 (no face/session/prompt row points at it) and
+    it is older than `grace_seconds` (which also covers files written just before
+    their row is inserted). Renditions live exactly as long as their original.
+    Deletions are throttled to `deletes_per_second`.
+    """
+
+    def __init__(
+        self,
+        storage: FileStorage,
+        blobs: BlobRepository,
+        *,
+        grace_seconds: float = 24 * 3600,
+        batch_size: int = 200,
+        deletes_per_second: float = 20.0,
+        interval_seconds: float = 60.0,
+        dry_run: bool = False,
+    ) -> None:
+        self._storage = storage
+        self._blobs = blobs
+        self._grace_seconds = grace_seconds
+        self._batch_size = max(1, batch_size)
+        self._delete_delay = 1.0 / deletes_per_second if deletes_per_second > 0 else 0.0
+        self._interval = interval_seconds
+        self._dry_run = dry_run
+        self._walker: AsyncIterator[tuple[Path, ObjectInfo]] | None = None
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        if self._task is None and self._interval > 0:
+            self._task = asyncio.create_task(self._run_forever(), name="storage-gc")
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run_pass(self) -> GcReport:
+        """Run steps until one full pass over the tree has completed."""
+        self._walker = None
+        total = GcReport(dry_run=self._dry_run)
+        while not total.passes_completed:
+            total.merge(await self.step())
+        return total
+
+    async def step(self) -> GcReport:
+        report = GcReport(dry_run=self._dry_run)
+        batch, finished = await self._next_batch()
+        if finished:
+            report.passes_completed = 1
+        if not batch:
+            return report
+        report.scanned = len(batch)
+        owners = {item.owner.as_posix() for item in batch}
+        referenced = await self._blobs.referenced_paths(sorted(owners))
+        threshold = time.time() - self._grace_seconds
+        for item in batch:
+            if item.owner.as_posix() in referenced:
+                report.referenced += 1
+                continue
+            if item.mtime > threshold:
+                report.too_young += 1
+                continue
+            report.orphaned += 1
+            report.reclaimed_bytes += item.size
+            report.orphans.append(item.path.as_posix())
+            if self._dry_run:
+                continue
+            # The reference set above may be stale: a row or a re-upload of the same
+            # content can have appeared since.
+            if await self._blobs.still_needed(item.owner.as_posix(), self._grace_seconds):
+                report.orphaned -= 1
+                report.reclaimed_bytes -= item.size
+                report.orphans.pop()
+                report.referenced += 1
+                continue
+            await self._storage.delete(item.path)
+            await self._blobs.delete(item.path.as_posix())
+            report.deleted += 1
+            if self._delete_delay:
+                await asyncio.sleep(self._delete_delay)
+        return report
+
+    async def _run_forever(self) -> None:
+        while True:
+            try:
+                report = await self.step()
+                if report.orphaned:
+                    logger.info("Storage GC step: %s", report.format().splitlines()[0])
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # pragma: no cover - keep the loop alive
+                logger.exception("Storage GC step failed")
+            # Walk through a pass in quick steps, then rest for the full interval.
+            await asyncio.sleep(self._interval if self._walker is None else min(1.0, self._interval))
+
+    async def _next_batch(self) -> tuple[list[_Candidate], bool]:
+        if self._walker is None:
+            self._walker = self._storage.iter_objects()
+        batch: list[_Candidate] = []
+        async for path, info in self._walker:
+            batch.append(_Candidate(path, info.size, info.mtime, _owner(path)))
+            if len(batch) >= self._batch_size:
+                return batch, False
+        self._walker = None
+        return batch, True
+
+
+def _owner(path: Path) -> Path:
+    # Renditions are kept alive by their original. Generations are stored as .jpg;
+    # a rendition collected because its original has another suffix is simply
+    # re-rendered on demand.
+    if is_rendition(path):
+        return path.with_name(f"{original_stem(path)}.jpg")
+    return path
+
+
+async def _main() -> None:
+    from ..config import Settings
+    from ..db import Database
+
+    parser = argparse.ArgumentParser(description="Report (or delete) storage files no row references.")
+    parser.add_argument("--delete", action="store_true", help="actually delete orphans (default: dry run)")
+    parser.add_argument("--grace-hours", type=float, default=None)
+    args = parser.parse_args()
+
+    settings = Settings()
+    database = Database(settings.database_path)
+    await database.connect()
+    storage = create_file_storage(settings)
+    collector = StorageGarbageCollector(
+        storage,
+        BlobRepository(database),
+        grace_seconds=(args.grace_hours if args.grace_hours is not None else settings.storage_gc_grace_hours) * 3600,
+        batch_size=settings.storage_gc_batch_size,
+        deletes_per_second=settings.storage_gc_deletes_per_second,
+        dry_run=not args.delete,
+    )
+    try:
+        print((await collector.run_pass()).format())
+    finally:
+        await database.close()
+        await storage.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
+
+
+__all__ = ["GcReport", "StorageGarbageCollector"]
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import json
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .examples import Example, ExamplesService
+
+logger = logging.getLogger(__name__)
+
+ORIENTATIONS = ("vertical", "horizontal")
+
+
+@dataclass(frozen=True, slots=True)
+class Style:
+    key: str
+    label: str
+    scene: str
+    orientation: str
+    example: str
+    # Full upstream prompt per orientation for generations without a user prompt.
+    default_prompts: dict[str, str] = field(default_factory=dict)
+
+
+class StyleRegistry:
+    """Photosession styles loaded once from a JSON data file (`repo/styles.json`).
+
+    Every style carries its label, scene description, default orientation and the
+    examples-manifest entry used for its preview and fallback image. Prompt text is
+    assembled at load time, so a generation only joins the precompiled parts.
+    Styles whose example is missing fall back to `default_example`.
+    """
+
+    def __init__(self, path: Path, examples: ExamplesService) -> None:
+        self._path = path
+        self._examples = examples
+        self._styles: dict[str, Style] = {}
+        self._aspects: dict[str, str] = {}
+        self._suffix = ""
+        self._default_example = ""
+
+    def load(self) -> None:
+        with self._path.open("r", encoding="utf-8") as file:
+            data = json.load(file)
+        self._aspects = {name: data["aspects"].get(name, "") for name in ORIENTATIONS}
+        self._suffix = data["prompt_suffix"]
+        self._default_example = data["default_example"]
+        template = data["default_prompt"]
+        styles: dict[str, Style] = {}
+        for item in data["styles"]:
+            orientation = item.get("orientation", "vertical")
+            if orientation not in ORIENTATIONS:
+                raise ValueError(f"Style {item['key']}: unknown orientation {orientation}")
+            scene = template.format(label=item["label"], scene=item["scene"])
+            styles[item["key"]] = Style(
+                key=item["key"],
+                label=item["label"],
+                scene=item["scene"],
+                orientation=orientation,
+                example=item.get("example") or self._default_example,
+                default_prompts={name: self._compose(name, scene) for name in ORIENTATIONS},
+            )
+        self._styles = styles
+        self._check_examples()
+
+    def choices(self) -> list[tuple[str, str]]:
+        return [(style.key, style.label) for style in self._styles.values()]
+
+    def get(self, key: str | None) -> Style | None:
+        return self._styles.get(key) if key else None
+
+    def label(self, key: str) -> str:
+        style = self._styles.get(key)
+        return style.label if style else key
+
+    def default_orientation(self, key: str) -> str:
+        style = self._styles.get(key)
+        return style.orientation if style else ORIENTATIONS[0]
+
+    def prompt(self, key: str, orientation: str, user_prompt: str | None = None) -> str:
+        """Upstream prompt text; a user prompt replaces the style's scene description."""
+        style = self._styles.get(key)
+        if not user_prompt:
+            if style:
+                return style.default_prompts.get(orientation) or style.default_prompts[ORIENTATIONS[0]]
+            user_prompt = f"Высококлассная реалистичная фотосессия в стиле {key}"
+        return self._compose(orientation, user_prompt)
+
+    def example(self, key: str | None) -> Example | None:
+        """Preview/fallback image for a style: its own example, else the default one."""
+        style = self.get(key)
+        for name in (style.example if style else None, self._default_example):
+            example = self._examples.get_by_style(name) if name else None
+            if example and example.available:
+                return example
+        return None
+
+    def _compose(self, orientation: str, scene: str) -> str:
+        aspect = self._aspects.get(orientation, "")
+        return f"{aspect}, {scene}, {self._suffix}" if aspect else f"{scene}, {self._suffix}"
+
+    def _check_examples(self) -> None:
+        default = self._examples.get_by_style(self._default_example)
+        if not default or not default.available:
+            logger.warning("Default style example %r is missing; styles may have no preview", self._default_example)
+        missing = sorted(
+            style.key
+            for style in self._styles.values()
+            if not (example := self._examples.get_by_style(style.example)) or not example.available
+        )
+        if missing:
+            logger.info("%s of %s styles use the default example image", len(missing), len(self._styles))
+            logger.debug("Styles without their own example: %s", ", ".join(missing))
+
+
+__all__ = ["ORIENTATIONS", "Style", "StyleRegistry"]
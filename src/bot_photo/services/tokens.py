@@ -1,27 +1,128 @@
 from __future__ import annotations
 
+import logging
+
+from ..models import LedgerDrift, LedgerEntry, LedgerReason, TokenHold
+from ..repositories.ledger import LedgerRepository
 from ..repositories.users import UserRepository
 
+logger = logging.getLogger(__name__)
+
+
+class InsufficientTokensError(RuntimeError):
+    def __init__(self, user_id: int, amount: int) -> None:
+        super().__init__(f"User {user_id} has fewer than {amount} tokens")
+        self.user_id = user_id
+        self.amount = amount
+
 
 class TokenService:
-    def __init__(self, users: UserRepository) -> None:
+    """Token balances. Every change goes through the ledger with a reason and an
+    optional reference such as `session:12`, `invoice:7` or `admin:42`.
+
+    Generations reserve their cost with `hold` and settle it with `commit` once the
+    result is delivered or `release` on failure. Held tokens are not available to
+    other requests; holds left behind (e.g. by a crash) lapse after `hold_ttl_seconds`.
+    The TTL counts from the hold or the last `extend`, which generations call once
+    their scheduler slot is granted; a lapsed hold is still charged on `commit`.
+    """
+
+    def __init__(self, users: UserRepository, ledger: LedgerRepository, hold_ttl_seconds: float = 900.0) -> None:
         self._users = users
+        self._ledger = ledger
+        self._hold_ttl = hold_ttl_seconds
 
     async def balance(self, user_id: int) -> int:
-        user = await self._users.get_by_id(user_id)
-        return user.tokens if user else 0
+        """Available balance: tokens not reserved by active holds."""
+        return await self._ledger.available(user_id)
 
     async def ensure_can_spend(self, user_id: int, amount: int) -> bool:
-        user = await self._users.get_by_id(user_id)
-        return bool(user and user.tokens >= amount)
+        return await self._ledger.available(user_id) >= amount
 
-    async def spend(self, user_id: int, amount: int) -> int:
-        """Subtract amount and return new balance (clamped at zero)."""
-        return await self._users.update_tokens(user_id, -amount)
+    async def spend(self, user_id: int, amount: int, reason: str, ref: str | None = None) -> int:
+        """Subtract amount and return the new balance; raises InsufficientTokensError instead of going below zero."""
+        balance = await self._ledger.apply(user_id, -amount, reason, ref)
+        if balance is None:
+            raise InsufficientTokensError(user_id, amount)
+        return balance
 
-    async def add(self, user_id: int, amount: int) -> int:
+    async def add(self, user_id: int, amount: int, reason: str, ref: str | None = None) -> int:
         """Add amount and return new balance."""
-        return await self._users.update_tokens(user_id, amount)
+        balance = await self._ledger.apply(user_id, amount, reason, ref)
+        if balance is None:
+            raise LookupError(f"Unknown user {user_id}")
+        return balance
+
+    async def refund(self, user_id: int, amount: int, ref: str | None = None) -> int:
+        return await self.add(user_id, amount, LedgerReason.REFUND, ref)
+
+    async def hold(self, user_id: int, amount: int, reason: str, ref: str | None = None) -> TokenHold:
+        hold = await self._ledger.place_hold(user_id, amount, reason, ref, self._hold_ttl)
+        if hold is None:
+            raise InsufficientTokensError(user_id, amount)
+        return hold
+
+    async def extend(self, hold: TokenHold) -> bool:
+        """Restart the hold's TTL; False if it was already settled or lapsed."""
+        extended = await self._ledger.extend_hold(hold.id, self._hold_ttl)
+        if not extended:
+            logger.warning("Token hold %s of user %s lapsed before its generation started", hold.id, hold.user_id)
+        return extended
+
+    async def commit(self, hold: TokenHold) -> int | None:
+        """Charge a hold, lapsed or not; returns the new balance, or None if it was already committed or released."""
+        balance = await self._ledger.commit_hold(hold.id)
+        if balance is None:
+            logger.warning("Token hold %s of user %s is already settled; nothing was charged", hold.id, hold.user_id)
+        return balance
+
+    async def release(self, hold: TokenHold) -> None:
+        await self._ledger.release_hold(hold.id)
+
+    async def find_hold(self, ref: str) -> TokenHold | None:
+        return await self._ledger.find_hold(ref)
+
+    async def refund_abandoned(self, user_id: int, ref: str, amount: int) -> int:
+        """Undo what an unfinished generation `ref` reserved or charged; returns the tokens given back.
+
+        An active hold is released. A charge recorded in the ledger (a committed hold
+        or a spend from before holds) is refunded. A row older than the ledger has no
+        trace at all, so it gets `amount` back.
+        """
+        hold = await self._ledger.find_hold(ref)
+        if hold and hold.status == "held":
+            await self._ledger.release_hold(hold.id)
+            return hold.amount
+        entries = await self._ledger.find_by_ref(ref)
+        if hold is None and not entries:
+            charged = amount
+        else:
+            charged = -sum(entry.delta for entry in entries)
+        if charged <= 0:
+            return 0
+        await self.refund(user_id, charged, ref)
+        return charged
+
+    async def release_expired_holds(self) -> int:
+        released = await self._ledger.release_expired()
+        if released:
+            logger.info("Released %s expired token holds", released)
+        return released
+
+    async def history(self, user_id: int, limit: int = 20, before_id: int | None = None) -> list[LedgerEntry]:
+        return await self._ledger.history(user_id, limit, before_id)
+
+    async def check_consistency(self, limit: int = 100) -> list[LedgerDrift]:
+        """Compare materialized balances with the ledger and log any mismatch."""
+        drift = await self._ledger.find_drift(limit)
+        for item in drift:
+            logger.error(
+                "Token balance of user %s is %s but the ledger sums to %s",
+                item.user_id,
+                item.balance,
+                item.ledger_balance,
+            )
+        return drift
 
 
-__all__ = ["TokenService"]
\ No newline at end of file
+__all__ = ["InsufficientTokensError", "TokenService"]
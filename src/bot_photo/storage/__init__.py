@@ -1,3 +1,15 @@
-from .files import FileStorage
+from .backends import LocalBackend, ObjectInfo, StorageBackend
+from .factory import create_file_storage
+from .files import FileStorage, content_hash
+from .renditions import PREVIEW, TELEGRAM
 
-__all__ = ["FileStorage"]
+__all__ = [
+    "FileStorage",
+    "LocalBackend",
+    "ObjectInfo",
+    "PREVIEW",
+    "StorageBackend",
+    "TELEGRAM",
+    "content_hash",
+    "create_file_storage",
+]
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterable, AsyncIterator, Iterator
+
+from .disk import DiskIO
+
+LIST_PAGE_SIZE = 256
+
+
+@dataclass(frozen=True, slots=True)
+class ObjectInfo:
+    key: str
+    size: int
+    mtime: float
+
+
+class StorageBackend(ABC):
+    """Key/value object store behind `FileStorage`.
+
+    Keys look like `faces/ab/cd/<hash>.jpg`: the first segment names a root
+    (`faces`, `sessions`), the rest is the content-addressed path. Every backend
+    can hand out a local file for a key (`local_path`), which is what Telegram
+    uploads, Pillow and the upstream client read from.
+    """
+
+    remote: bool = False
+
+    @abstractmethod
+    def cache_path(self, key: str) -> Path:
+        """Where the local copy of `key` lives (it may not exist yet)."""
+
+    @abstractmethod
+    async def put(self, key: str, content: bytes) -> None: ...
+
+    @abstractmethod
+    async def put_stream(self, key: str, chunks: AsyncIterable[bytes]) -> None: ...
+
+    @abstractmethod
+    async def put_file(self, key: str, path: Path) -> None:
+        """Move a finished local file in as `key`; `path` is consumed."""
+
+    @abstractmethod
+    async def local_path(self, key: str) -> Path | None:
+        """Return a local file for `key`, fetching it if needed; None if missing."""
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool: ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None: ...
+
+    @abstractmethod
+    def iter_objects(self, prefix: str) -> AsyncIterator[ObjectInfo]: ...
+
+    async def touch(self, key: str) -> None:
+        """Mark `key` as just written, so GC treats it as young again.
+
+        Backends that cannot do this cheaply skip it; GC also checks `blobs.updated_at`.
+        """
+        return None
+
+    async def close(self) -> None:
+        return None
+
+
+class LocalBackend(StorageBackend):
+    """Objects stored as plain files under one directory per root."""
+
+    def __init__(self, roots: dict[str, Path], disk: DiskIO) -> None:
+        self._roots = roots
+        self._disk = disk
+        for root in roots.values():
+            root.mkdir(parents=True, exist_ok=True)
+            disk.ensure_dir(root)
+
+    @property
+    def roots(self) -> dict[str, Path]:
+        return self._roots
+
+    def cache_path(self, key: str) -> Path:
+        root, _, rest = key.partition("/")
+        if root not in self._roots or not rest:
+            raise KeyError(f"Unknown storage key: {key}")
+        return self._roots[root] / rest
+
+    async def put(self, key: str, content: bytes) -> None:
+        await self._disk.run(self._disk.write_atomic, self.cache_path(key), content)
+
+    async def put_stream(self, key: str, chunks: AsyncIterable[bytes]) -> None:
+        await self._disk.write_stream(self.cache_path(key), chunks)
+
+    async def put_file(self, key: str, path: Path) -> None:
+        await self._disk.run(self._disk.move, path, self.cache_path(key))
+
+    async def local_path(self, key: str) -> Path | None:
+        path = self.cache_path(key)
+        return path if await self._disk.run(path.exists) else None
+
+    async def exists(self, key: str) -> bool:
+        return await self._disk.run(self.cache_path(key).exists)
+
+    async def delete(self, key: str) -> None:
+        await self._disk.run(_unlink, self.cache_path(key))
+
+    async def touch(self, key: str) -> None:
+        await self._disk.run(_touch, self.cache_path(key))
+
+    async def iter_objects(self, prefix: str) -> AsyncIterator[ObjectInfo]:
+        root, _, _ = prefix.partition("/")
+        if root not in self._roots:
+            return
+        walker = self._walk(root)
+        while True:
+            page = await self._disk.run(_take, walker, LIST_PAGE_SIZE)
+            for info in page:
+                if info.key.startswith(prefix):
+                    yield info
+            if len(page) < LIST_PAGE_SIZE:
+                return
+
+    def _walk(self, root: str) -> Iterator[ObjectInfo]:
+        base = self._roots[root]
+        stack = [base]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(Path(entry.path))
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                relative = Path(entry.path).relative_to(base).as_posix()
+                yield ObjectInfo(f"{root}/{relative}", stat.st_size, stat.st_mtime)
+
+
+def _take(iterator: Iterator[ObjectInfo], count: int) -> list[ObjectInfo]:
+    page: list[ObjectInfo] = []
+    for item in iterator:
+        page.append(item)
+        if len(page) >= count:
+            break
+    return page
+
+
+def _unlink(path: Path) -> None:
+    path.unlink(missing_ok=True)
+
+
+def _touch(path: Path) -> None:
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+__all__ = ["LocalBackend", "ObjectInfo", "StorageBackend"]
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from pathlib import Path
+
+from .backends import LocalBackend
+
+
+class LruDiskCache:
+    """Size-bounded local copies of remote objects, evicting the least recently used.
+
+    The cache reuses the local storage layout, so a cached object lives at the same
+    path it would have with the filesystem backend. Existing files are picked up
+    (oldest first) on first use, so a restart does not forget the cache.
+    """
+
+    def __init__(self, local: LocalBackend, max_bytes: int) -> None:
+        self._local = local
+        self._max_bytes = max_bytes
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._size = 0
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    @property
+    def local(self) -> LocalBackend:
+        return self._local
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    async def lookup(self, key: str) -> Path | None:
+        await self._load()
+        if key not in self._entries:
+            return None
+        path = await self._local.local_path(key)
+        if path is None:
+            self.discard(key)
+            return None
+        self._entries.move_to_end(key)
+        return path
+
+    async def add(self, key: str, size: int) -> None:
+        await self._load()
+        self.discard(key)
+        self._entries[key] = size
+        self._size += size
+        await self._evict(keep=key)
+
+    def discard(self, key: str) -> None:
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._size -= size
+
+    async def _evict(self, keep: str) -> None:
+        while self._size > self._max_bytes and len(self._entries) > 1:
+            key, size = next(iter(self._entries.items()))
+            if key == keep:
+                self._entries.move_to_end(key)
+                continue
+            self.discard(key)
+            await self._local.delete(key)
+
+    async def _load(self) -> None:
+        if self._loaded:
+            return
+        async with self._lock:
+            if self._loaded:
+                return
+            found = []
+            for root in self._local.roots:
+                async for info in self._local.iter_objects(f"{root}/"):
+                    # Skip temp files and the staging area for incoming uploads.
+                    if not any(part.startswith(".") for part in info.key.split("/")):
+                        found.append(info)
+            for info in sorted(found, key=lambda item: item.mtime):
+                self._entries[info.key] = info.size
+                self._size += info.size
+            self._loaded = True
+
+
+__all__ = ["LruDiskCache"]
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import AsyncIterable, BinaryIO, Callable, TypeVar
+
+T = TypeVar("T")
+
+FSYNC_POLICIES = ("never", "file", "full")
+
+
+class DiskIO:
+    """Blocking file operations executed on a dedicated bounded thread pool.
+
+    Writes go to a temp file in the target directory and are renamed into place,
+    so readers never see a partially written file. `fsync` controls durability:
+    "never" (rely on the page cache), "file" (fsync the data) or "full" (also
+    fsync the directory entry after the rename).
+    """
+
+    def __init__(self, workers: int = 4, fsync: str = "never") -> None:
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self._fsync = fsync
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="storage-io")
+        self._known_dirs: set[Path] = set()
+
+    async def run(self, func: Callable[..., T], *args: object) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def ensure_dir(self, directory: Path) -> None:
+        if directory in self._known_dirs:
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+        self._known_dirs.add(directory)
+
+    def write_atomic(self, destination: Path, content: bytes) -> None:
+        tmp_path, file = self._open_tmp(destination)
+        try:
+            with file:
+                file.write(content)
+                self._sync(file)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        self._commit(tmp_path, destination)
+
+    async def write_stream(self, destination: Path, chunks: AsyncIterable[bytes]) -> int:
+        """Stream chunks into `destination` atomically; only one chunk is held in memory."""
+        tmp_path, file = await self.run(self._open_tmp, destination)
+        size = 0
+        try:
+            async for chunk in chunks:
+                await self.run(file.write, chunk)
+                size += len(chunk)
+            await self.run(self._sync, file)
+            await self.run(file.close)
+        except BaseException:
+            await self.run(file.close)
+            await self.run(partial(tmp_path.unlink, missing_ok=True))
+            raise
+        await self.run(self._commit, tmp_path, destination)
+        return size
+
+    def move(self, source: Path, destination: Path) -> None:
+        self.ensure_dir(destination.parent)
+        os.replace(source, destination)
+        if self._fsync == "full":
+            _fsync_dir(destination.parent)
+
+    def _open_tmp(self, destination: Path) -> tuple[Path, BinaryIO]:
+        directory = destination.parent
+        self.ensure_dir(directory)
+        tmp_path = directory / f".{destination.name}.{uuid.uuid4().hex[:8]}.tmp"
+        return tmp_path, open(tmp_path, "wb")
+
+    def _sync(self, file: BinaryIO) -> None:
+        if self._fsync != "never":
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _commit(self, tmp_path: Path, destination: Path) -> None:
+        try:
+            os.replace(tmp_path, destination)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        if self._fsync == "full":
+            _fsync_dir(destination.parent)
+
+
+def _fsync_dir(directory: Path) -> None:
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:  # pragma: no cover - not supported on Windows
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+__all__ = ["DiskIO", "FSYNC_POLICIES"]
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from .backends import LocalBackend, StorageBackend
+from .cache import LruDiskCache
+from .disk import DiskIO
+from .files import FACES, SESSIONS, FileStorage
+from .s3 import S3Backend
+
+if TYPE_CHECKING:
+    from ..config import Settings
+    from ..repositories.blobs import BlobRepository
+
+STORAGE_BACKENDS = ("local", "s3")
+
+
+def create_file_storage(settings: Settings, blobs: BlobRepository | None = None) -> FileStorage:
+    """Build `FileStorage` with the backend selected by STORAGE_BACKEND."""
+    if settings.storage_backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend: {settings.storage_backend}")
+    disk = DiskIO(settings.storage_io_workers, settings.storage_fsync)
+    local = LocalBackend({FACES: settings.faces_path, SESSIONS: settings.sessions_path}, disk)
+    backend: StorageBackend = local
+    if settings.storage_backend == "s3":
+        if not settings.s3_endpoint_url or not settings.s3_bucket:
+            raise ValueError("S3_ENDPOINT_URL and S3_BUCKET are required for STORAGE_BACKEND=s3")
+        backend = S3Backend(
+            endpoint_url=settings.s3_endpoint_url,
+            bucket=settings.s3_bucket,
+            access_key=settings.s3_access_key,
+            secret_key=settings.s3_secret_key,
+            region=settings.s3_region,
+            cache=LruDiskCache(local, settings.storage_cache_max_mb * 1024 * 1024),
+            disk=disk,
+            part_size=settings.s3_part_size_mb * 1024 * 1024,
+        )
+    return FileStorage(
+        settings.faces_path,
+        settings.sessions_path,
+        backend=backend,
+        disk=disk,
+        blobs=blobs,
+        render_workers=settings.storage_render_workers,
+    )
+
+
+__all__ = ["STORAGE_BACKENDS", "create_file_storage"]
@@ -1,28 +1,249 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import logging
+import re
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import TYPE_CHECKING, AsyncIterable, AsyncIterator, Callable, TypeVar
 
 from aiogram import Bot
 
+from .backends import LocalBackend, ObjectInfo, StorageBackend
+from .disk import DiskIO
+from .renditions import RENDITIONS, render, rendition_path, renditions_available
+
+if TYPE_CHECKING:
+    from ..repositories.blobs import BlobRepository
+
+T = TypeVar("T")
+
+DOWNLOAD_CHUNK = 64 * 1024
+# Incoming downloads are staged here until their hash (and so their key) is known.
+STAGING_DIR = ".incoming"
+
+logger = logging.getLogger(__name__)
+
+_HASH_NAME = re.compile(r"^[0-9a-f]{64}$")
+
+FACES = "faces"
+SESSIONS = "sessions"
+
 
 class FileStorage:
-    def __init__(self, faces_root: Path, sessions_root: Path) -> None:
-        self._faces_root = faces_root
-        self._sessions_root = sessions_root
-        self._faces_root.mkdir(parents=True, exist_ok=True)
-        self._sessions_root.mkdir(parents=True, exist_ok=True)
+    """Storage for faces and generations on top of a pluggable `StorageBackend`.
+
+    Callers keep working with local paths under `faces_root`/`sessions_root`; each
+    path maps to a backend key (`faces/ab/cd/<hash>.jpg`). With the default
+    filesystem backend the path is the object itself, with a remote backend it is
+    the location of the local cached copy, fetched on demand by `materialize`.
+
+    Files are content-addressed: the sha256 of the bytes names the file and two
+    levels of sharding keep directories small. Identical uploads are stored once;
+    `blobs` records the size of each stored path. Blocking work runs on the
+    `DiskIO` thread pool so the event loop never stalls on disk.
+
+    When Pillow is installed every generation also gets a small preview and a
+    Telegram-sized JPEG next to it (`<hash>.preview.jpg`, `<hash>.telegram.jpg`),
+    rendered in the background on a separate pool so saving never waits for it.
+    """
+
+    def __init__(
+        self,
+        faces_root: Path,
+        sessions_root: Path,
+        *,
+        backend: StorageBackend | None = None,
+        disk: DiskIO | None = None,
+        blobs: BlobRepository | None = None,
+        io_workers: int = 4,
+        fsync: str = "never",
+        render_workers: int = 1,
+    ) -> None:
+        self._roots = {FACES: faces_root, SESSIONS: sessions_root}
+        self._disk = disk or DiskIO(io_workers, fsync)
+        self._backend = backend or LocalBackend(self._roots, self._disk)
+        self._blobs = blobs
+        self._render_executor = ThreadPoolExecutor(
+            max_workers=max(1, render_workers), thread_name_prefix="storage-render"
+        )
+        self._pending_renders: dict[Path, asyncio.Task[None]] = {}
+
+    @property
+    def backend(self) -> StorageBackend:
+        return self._backend
 
     async def save_face(self, bot: Bot, user_id: int, file_id: str) -> Path:
-        face_dir = self._faces_root / str(user_id)
-        face_dir.mkdir(parents=True, exist_ok=True)
-        filename = f"{uuid.uuid4().hex}.jpg"
-        destination = face_dir / filename
-        await bot.download(file_id, destination=destination)
-        return destination
+        """Stream a Telegram photo into storage without holding it in memory."""
+        if bot.session.api.is_local:
+            buffer = await bot.download(file_id)
+            return await self._store(FACES, buffer.getvalue(), ".jpg")
+        file = await bot.get_file(file_id)
+        chunks = bot.session.stream_content(
+            url=bot.session.api.file_url(bot.token, file.file_path),
+            chunk_size=DOWNLOAD_CHUNK,
+            raise_for_status=True,
+        )
+        return await self._store_stream(FACES, chunks, ".jpg")
 
     async def save_generation(self, content: bytes, suffix: str = ".jpg") -> Path:
-        filename = f"{uuid.uuid4().hex}{suffix}"
-        destination = self._sessions_root / filename
-        destination.write_bytes(content)
+        destination = await self._store(SESSIONS, content, suffix)
+        self._schedule_renditions(destination, content)
         return destination
+
+    async def materialize(self, path: str | Path) -> Path | None:
+        """Return a readable local file for a stored path, or None if it is gone."""
+        path = Path(path)
+        key = self.key_for(path)
+        if key is None:
+            return path if await self._disk.run(path.exists) else None
+        return await self._backend.local_path(key)
+
+    async def rendition(self, path: str | Path, name: str, *, wait: bool = True) -> Path | None:
+        """Return the named rendition of a stored generation, or the original; None if both are gone.
+
+        Waits for a render that is still in flight and renders on demand for files
+        saved before renditions existed. With `wait=False` the original is returned
+        while the rendition is not ready, and any missing rendition is made in the
+        background.
+        """
+        original = Path(path)
+        target = rendition_path(original, name)
+        if wait:
+            await self._wait_render(original)
+        elif original in self._pending_renders:
+            return await self.materialize(original)
+        if found := await self.materialize(target):
+            return found
+        local_original = await self.materialize(original)
+        if not renditions_available() or local_original is None:
+            return local_original
+        self._schedule_renditions(original, await self._disk.run(local_original.read_bytes))
+        if not wait:
+            return local_original
+        await self._wait_render(original)
+        return await self.materialize(target) or local_original
+
+    async def write_bytes(self, destination: Path, content: bytes) -> None:
+        key = self.key_for(destination)
+        if key is None:
+            await self._disk.run(self._disk.write_atomic, destination, content)
+        else:
+            await self._backend.put(key, content)
+
+    async def read_bytes(self, path: Path) -> bytes:
+        local = await self.materialize(path)
+        if local is None:
+            raise FileNotFoundError(path)
+        return await self._disk.run(local.read_bytes)
+
+    async def exists(self, path: Path) -> bool:
+        key = self.key_for(path)
+        if key is None:
+            return await self._disk.run(path.exists)
+        return await self._backend.exists(key)
+
+    async def delete(self, path: Path) -> None:
+        key = self.key_for(path)
+        if key is None:
+            await self._disk.run(lambda: path.unlink(missing_ok=True))
+        else:
+            await self._backend.delete(key)
+
+    async def iter_objects(self) -> AsyncIterator[tuple[Path, ObjectInfo]]:
+        """Every stored object with the local path callers know it by."""
+        for root in self._roots:
+            async for info in self._backend.iter_objects(f"{root}/"):
+                yield self._backend.cache_path(info.key), info
+
+    def key_for(self, path: Path) -> str | None:
+        for root, directory in self._roots.items():
+            try:
+                relative = path.relative_to(directory)
+            except ValueError:
+                continue
+            return f"{root}/{relative.as_posix()}"
+        return None
+
+    async def close(self) -> None:
+        for task in list(self._pending_renders.values()):
+            task.cancel()
+        await self._backend.close()
+        self._render_executor.shutdown(wait=True)
+        self._disk.close()
+
+    async def run_io(self, func: Callable[..., T], *args: object) -> T:
+        """Run a blocking callable on the storage I/O pool."""
+        return await self._disk.run(func, *args)
+
+    async def _store(self, root: str, content: bytes, suffix: str) -> Path:
+        digest = await self._disk.run(_sha256, content)
+        key = f"{root}/{digest[:2]}/{digest[2:4]}/{digest}{suffix}"
+        if await self._backend.exists(key):
+            # An old orphan stored again must not look old to a GC pass already under way.
+            await self._backend.touch(key)
+        else:
+            await self._backend.put(key, content)
+        destination = self._backend.cache_path(key)
+        if self._blobs:
+            await self._blobs.record(destination.as_posix(), digest, len(content))
+        return destination
+
+    async def _store_stream(self, root: str, chunks: AsyncIterable[bytes], suffix: str) -> Path:
+        staging = self._roots[root] / STAGING_DIR / f"{uuid.uuid4().hex}{suffix}"
+        hasher = hashlib.sha256()
+
+        async def hashed() -> AsyncIterator[bytes]:
+            async for chunk in chunks:
+                hasher.update(chunk)
+                yield chunk
+
+        size = await self._disk.write_stream(staging, hashed())
+        digest = hasher.hexdigest()
+        key = f"{root}/{digest[:2]}/{digest[2:4]}/{digest}{suffix}"
+        if await self._backend.exists(key):
+            await self._disk.run(lambda: staging.unlink(missing_ok=True))
+            await self._backend.touch(key)
+        else:
+            await self._backend.put_file(key, staging)
+        destination = self._backend.cache_path(key)
+        if self._blobs:
+            await self._blobs.record(destination.as_posix(), digest, size)
+        return destination
+
+    def _schedule_renditions(self, original: Path, content: bytes) -> None:
+        if not renditions_available() or original in self._pending_renders:
+            return
+        task = asyncio.create_task(self._render_and_store(original, content))
+        self._pending_renders[original] = task
+        task.add_done_callback(lambda _: self._pending_renders.pop(original, None))
+
+    async def _render_and_store(self, original: Path, content: bytes) -> None:
+        loop = asyncio.get_running_loop()
+        for spec in RENDITIONS:
+            key = self.key_for(rendition_path(original, spec.name))
+            if key is None or await self._backend.exists(key):
+                continue
+            try:
+                data = await loop.run_in_executor(self._render_executor, render, content, spec)
+                await self._backend.put(key, data)
+            except Exception as exc:
+                logger.warning("Failed to render %s for %s: %s", spec.name, original, exc)
+                return
+
+    async def _wait_render(self, original: Path) -> None:
+        pending = self._pending_renders.get(original)
+        if pending is not None:
+            await asyncio.shield(pending)
+
+
+def _sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def content_hash(path: str | Path) -> str | None:
+    """Return the sha256 encoded in a content-addressed file name, if any."""
+    stem = Path(path).stem
+    return stem if _HASH_NAME.match(stem) else None
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import io
+from dataclasses import dataclass
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - Pillow is optional
+    Image = None
+
+
+@dataclass(frozen=True, slots=True)
+class RenditionSpec:
+    name: str
+    max_side: int
+    quality: int
+
+
+PREVIEW = RenditionSpec("preview", 320, 70)
+TELEGRAM = RenditionSpec("telegram", 1280, 85)
+RENDITIONS = (PREVIEW, TELEGRAM)
+_NAMES = {spec.name for spec in RENDITIONS}
+
+
+def renditions_available() -> bool:
+    return Image is not None
+
+
+def rendition_path(original: Path, name: str) -> Path:
+    return original.with_name(f"{original.stem}.{name}.jpg")
+
+
+def original_stem(path: Path) -> str:
+    """Strip a rendition marker (`<hash>.preview.jpg` -> `<hash>`) from a file name."""
+    stem, _, marker = path.stem.rpartition(".")
+    return stem if stem and marker in _NAMES else path.stem
+
+
+def is_rendition(path: Path) -> bool:
+    return original_stem(path) != path.stem
+
+
+def probe_size(path: Path) -> tuple[int, int] | None:
+    """(width, height) read from the image header, or None without Pillow or for unreadable files."""
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except (OSError, ValueError):
+        return None
+
+
+def render(content: bytes, spec: RenditionSpec) -> bytes:
+    """Downscale to fit `spec.max_side` and re-encode as a progressive JPEG."""
+    if Image is None:
+        raise RuntimeError("Pillow is not installed")
+    with Image.open(io.BytesIO(content)) as image:
+        image = image.convert("RGB")
+        image.thumbnail((spec.max_side, spec.max_side))
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=spec.quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+__all__ = [
+    "PREVIEW",
+    "RENDITIONS",
+    "RenditionSpec",
+    "TELEGRAM",
+    "is_rendition",
+    "original_stem",
+    "probe_size",
+    "render",
+    "rendition_path",
+    "renditions_available",
+]
@@ -0,0 +1,317 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import logging
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncIterable, AsyncIterator
+from urllib.parse import quote, urlsplit
+
+import aiohttp
+from yarl import URL
+
+from .backends import ObjectInfo, StorageBackend
+from .cache import LruDiskCache
+from .disk import DiskIO
+
+logger = logging.getLogger(__name__)
+
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+MIN_PART_SIZE = 5 * 1024 * 1024
+DOWNLOAD_CHUNK = 256 * 1024
+
+
+class S3Error(RuntimeError):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(f"S3 error {status}: {message}")
+        self.status = status
+
+
+class S3Backend(StorageBackend):
+    """S3-compatible object store (AWS, MinIO, R2, ...) fronted by a local LRU cache.
+
+    Requests use path-style addressing and are signed with AWS Signature V4.
+    Objects larger than `part_size` are uploaded with multipart uploads, reading
+    one part at a time from the cached file; downloads stream straight to disk.
+    """
+
+    remote = True
+
+    def __init__(
+        self,
+        *,
+        endpoint_url: str,
+        bucket: str,
+        access_key: str,
+        secret_key: str,
+        region: str,
+        cache: LruDiskCache,
+        disk: DiskIO,
+        part_size: int = 8 * 1024 * 1024,
+    ) -> None:
+        self._endpoint = endpoint_url.rstrip("/")
+        self._host = urlsplit(self._endpoint).netloc
+        self._bucket = bucket
+        self._access_key = access_key
+        self._secret_key = secret_key
+        self._region = region
+        self._cache = cache
+        self._disk = disk
+        self._part_size = max(part_size, MIN_PART_SIZE)
+        self._session: aiohttp.ClientSession | None = None
+        self._downloads: dict[str, asyncio.Future[Path | None]] = {}
+
+    def cache_path(self, key: str) -> Path:
+        return self._cache.local.cache_path(key)
+
+    async def put(self, key: str, content: bytes) -> None:
+        await self._cache.local.put(key, content)
+        await self._cache.add(key, len(content))
+        if len(content) <= self._part_size:
+            await self._put_object(key, content)
+        else:
+            await self._multipart_upload(key, _slices(content, self._part_size))
+
+    async def put_stream(self, key: str, chunks: AsyncIterable[bytes]) -> None:
+        await self._cache.local.put_stream(key, chunks)
+        await self._upload_cached(key)
+
+    async def put_file(self, key: str, path: Path) -> None:
+        await self._cache.local.put_file(key, path)
+        await self._upload_cached(key)
+
+    async def local_path(self, key: str) -> Path | None:
+        cached = await self._cache.lookup(key)
+        if cached:
+            return cached
+        pending = self._downloads.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._download(key))
+            self._downloads[key] = pending
+            pending.add_done_callback(lambda _: self._downloads.pop(key, None))
+        return await asyncio.shield(pending)
+
+    async def exists(self, key: str) -> bool:
+        if await self._cache.lookup(key):
+            return True
+        async with self._request("HEAD", key) as response:
+            if response.status == 404:
+                return False
+            await self._raise_for_status(response)
+            return True
+
+    async def delete(self, key: str) -> None:
+        async with self._request("DELETE", key) as response:
+            if response.status != 404:
+                await self._raise_for_status(response)
+        self._cache.discard(key)
+        await self._cache.local.delete(key)
+
+    async def iter_objects(self, prefix: str) -> AsyncIterator[ObjectInfo]:
+        token: str | None = None
+        while True:
+            query = {"list-type": "2", "prefix": prefix}
+            if token:
+                query["continuation-token"] = token
+            async with self._request("GET", None, query=query) as response:
+                await self._raise_for_status(response)
+                root = ET.fromstring(await response.read())
+            namespace = root.tag.partition("}")[0] + "}" if root.tag.startswith("{") else ""
+            for item in root.iter(f"{namespace}Contents"):
+                modified = item.findtext(f"{namespace}LastModified") or ""
+                yield ObjectInfo(
+                    key=item.findtext(f"{namespace}Key") or "",
+                    size=int(item.findtext(f"{namespace}Size") or 0),
+                    mtime=_parse_timestamp(modified),
+                )
+            if (root.findtext(f"{namespace}IsTruncated") or "").lower() != "true":
+                return
+            token = root.findtext(f"{namespace}NextContinuationToken")
+            if not token:
+                return
+
+    async def close(self) -> None:
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    async def _download(self, key: str) -> Path | None:
+        async with self._request("GET", key) as response:
+            if response.status == 404:
+                return None
+            await self._raise_for_status(response)
+            path = self.cache_path(key)
+            size = await self._disk.write_stream(path, response.content.iter_chunked(DOWNLOAD_CHUNK))
+        await self._cache.add(key, size)
+        return path
+
+    async def _upload_cached(self, key: str) -> None:
+        path = self.cache_path(key)
+        size = (await self._disk.run(path.stat)).st_size
+        await self._cache.add(key, size)
+        if size <= self._part_size:
+            await self._put_object(key, await self._disk.run(path.read_bytes))
+        else:
+            await self._multipart_upload(key, self._file_parts(path))
+
+    async def _put_object(self, key: str, content: bytes) -> None:
+        async with self._request("PUT", key, body=content) as response:
+            await self._raise_for_status(response)
+
+    async def _multipart_upload(self, key: str, parts: AsyncIterable[bytes]) -> None:
+        async with self._request("POST", key, query={"uploads": ""}) as response:
+            await self._raise_for_status(response)
+            upload_id = _find_text(ET.fromstring(await response.read()), "UploadId")
+        if not upload_id:
+            raise S3Error(500, "CreateMultipartUpload returned no UploadId")
+        etags: list[tuple[int, str]] = []
+        try:
+            number = 0
+            async for part in parts:
+                number += 1
+                query = {"partNumber": str(number), "uploadId": upload_id}
+                async with self._request("PUT", key, query=query, body=part) as response:
+                    await self._raise_for_status(response)
+                    etags.append((number, response.headers.get("ETag", "")))
+            body = "".join(
+                f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>" for number, etag in etags
+            )
+            payload = f"<CompleteMultipartUpload>{body}</CompleteMultipartUpload>".encode()
+            async with self._request("POST", key, query={"uploadId": upload_id}, body=payload) as response:
+                await self._raise_for_status(response)
+                # S3 may report a failed completion with a 200 and an <Error> body.
+                text = await response.read()
+                if b"<Error>" in text:
+                    raise S3Error(response.status, text.decode("utf-8", "replace"))
+        except BaseException:
+            try:
+                async with self._request("DELETE", key, query={"uploadId": upload_id}):
+                    pass
+            except Exception:  # pragma: no cover - best effort cleanup
+                logger.warning("Failed to abort multipart upload %s for %s", upload_id, key)
+            raise
+
+    async def _file_parts(self, path: Path) -> AsyncIterator[bytes]:
+        file = await self._disk.run(open, path, "rb")
+        try:
+            while True:
+                part = await self._disk.run(file.read, self._part_size)
+                if not part:
+                    return
+                yield part
+        finally:
+            await self._disk.run(file.close)
+
+    def _request(
+        self,
+        method: str,
+        key: str | None,
+        *,
+        query: dict[str, str] | None = None,
+        body: bytes = b"",
+    ) -> Any:
+        path = f"/{self._bucket}" + (f"/{quote(key, safe='/~')}" if key else "")
+        query = query or {}
+        payload_hash = hashlib.sha256(body).hexdigest() if body else EMPTY_SHA256
+        headers = sign_v4(
+            method=method,
+            host=self._host,
+            path=path,
+            query=query,
+            headers={},
+            payload_hash=payload_hash,
+            access_key=self._access_key,
+            secret_key=self._secret_key,
+            region=self._region,
+        )
+        query_string = _canonical_query(query)
+        url = URL(f"{self._endpoint}{path}" + (f"?{query_string}" if query_string else ""), encoded=True)
+        return self._ensure_session().request(method, url, data=body or None, headers=headers)
+
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=300))
+        return self._session
+
+    @staticmethod
+    async def _raise_for_status(response: aiohttp.ClientResponse) -> None:
+        if response.status >= 300:
+            raise S3Error(response.status, (await response.text())[:500])
+
+
+def sign_v4(
+    *,
+    method: str,
+    host: str,
+    path: str,
+    query: dict[str, str],
+    headers: dict[str, str],
+    payload_hash: str,
+    access_key: str,
+    secret_key: str,
+    region: str,
+    service: str = "s3",
+    now: datetime | None = None,
+) -> dict[str, str]:
+    """Return `headers` plus the AWS Signature V4 `Authorization` for one request."""
+    now = now or datetime.now(timezone.utc)
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    date = now.strftime("%Y%m%d")
+    signed_headers = {
+        **{name.lower(): value.strip() for name, value in headers.items()},
+        "host": host,
+        "x-amz-content-sha256": payload_hash,
+        "x-amz-date": amz_date,
+    }
+    names = sorted(signed_headers)
+    canonical_request = "\n".join(
+        [
+            method,
+            path,
+            _canonical_query(query),
+            "".join(f"{name}:{signed_headers[name]}\n" for name in names),
+            ";".join(names),
+            payload_hash,
+        ]
+    )
+    scope = f"{date}/{region}/{service}/aws4_request"
+    string_to_sign = "\n".join(
+        ["AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()]
+    )
+    key = f"AWS4{secret_key}".encode()
+    for part in (date, region, service, "aws4_request"):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+    signed_headers["Authorization"] = (
+        f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, "
+        f"SignedHeaders={';'.join(names)}, Signature={signature}"
+    )
+    return signed_headers
+
+
+def _canonical_query(query: dict[str, str]) -> str:
+    return "&".join(f"{quote(name, safe='~')}={quote(value, safe='~')}" for name, value in sorted(query.items()))
+
+
+def _find_text(root: ET.Element, name: str) -> str | None:
+    for element in root.iter():
+        if element.tag == name or element.tag.endswith(f"}}{name}"):
+            return element.text
+    return None
+
+
+def _parse_timestamp(value: str) -> float:
+    if not value:
+        return 0.0
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+async def _slices(content: bytes, size: int) -> AsyncIterator[bytes]:
+    view = memoryview(content)
+    for offset in range(0, len(content), size):
+        yield bytes(view[offset : offset + size])
+
+
+__all__ = ["S3Backend", "S3Error", "sign_v4"]
@@ -1,39 +1,59 @@
 from .context import (
     get_database,
     get_examples_service,
+    get_face_materializer,
     get_faces_repo,
     get_file_storage,
     get_generation_client,
+    get_ledger_repo,
     get_limit_service,
     get_prompt_repo,
+    get_quota_service,
+    get_quotas_repo,
     get_repo,
     get_service,
     get_sessions_repo,
     get_settings,
+    get_style_registry,
     get_token_service,
     get_usage_repo,
     get_users_repo,
     get_payments_repo,
     get_crypto_pay_service,
+    get_invoice_poller,
+    get_inflight_registry,
+    get_generation_scheduler,
+    get_priority_classifier,
+    get_generation_heartbeat,
     init_context,
 )
 
 __all__ = [
     "get_database",
     "get_examples_service",
+    "get_face_materializer",
     "get_faces_repo",
     "get_file_storage",
     "get_generation_client",
+    "get_ledger_repo",
     "get_limit_service",
     "get_prompt_repo",
+    "get_quota_service",
+    "get_quotas_repo",
     "get_repo",
     "get_service",
     "get_sessions_repo",
     "get_settings",
+    "get_style_registry",
     "get_token_service",
     "get_usage_repo",
     "get_users_repo",
     "get_payments_repo",
     "get_crypto_pay_service",
+    "get_invoice_poller",
+    "get_inflight_registry",
+    "get_generation_scheduler",
+    "get_priority_classifier",
+    "get_generation_heartbeat",
     "init_context",
 ]
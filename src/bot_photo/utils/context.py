@@ -7,16 +7,25 @@ from aiogram import Bot
 from ..config import Settings
 from ..db import Database
 from ..repositories.faces import FaceRepository
+from ..repositories.ledger import LedgerRepository
 from ..repositories.prompts import PromptRepository
+from ..repositories.quotas import QuotaRepository
 from ..repositories.sessions import SessionRepository
 from ..repositories.usage import UsageRepository
 from ..repositories.users import UserRepository
 from ..repositories.payments import PaymentRepository
 from ..services.examples import ExamplesService
+from ..services.face_materializer import FaceMaterializer
 from ..services.limits import RateLimitService
 from ..services.nano_banana import NanoBananaClient
+from ..services.quotas import QuotaService
+from ..services.styles import StyleRegistry
 from ..services.tokens import TokenService
 from ..services.crypto_pay import CryptoPayService
+from ..services.inflight import InflightRegistry
+from ..services.scheduler import GenerationScheduler, PriorityClassifier
+from ..services.heartbeat import GenerationHeartbeat
+from ..services.invoice_poller import InvoicePoller
 from ..storage import FileStorage
 
 _APP_CONTEXT: dict[str, Any] = {}
@@ -87,6 +96,14 @@ def get_payments_repo(bot: Bot | None) -> PaymentRepository:
     return get_repo(bot, "payments")
 
 
+def get_ledger_repo(bot: Bot | None) -> LedgerRepository:
+    return get_repo(bot, "ledger")
+
+
+def get_quotas_repo(bot: Bot | None) -> QuotaRepository:
+    return get_repo(bot, "quotas")
+
+
 def get_token_service(bot: Bot | None) -> TokenService:
     return get_service(bot, "tokens")
 
@@ -95,6 +112,10 @@ def get_limit_service(bot: Bot | None) -> RateLimitService:
     return get_service(bot, "limits")
 
 
+def get_quota_service(bot: Bot | None) -> QuotaService:
+    return get_service(bot, "quotas")
+
+
 def get_generation_client(bot: Bot | None) -> NanoBananaClient:
     return get_service(bot, "nano")
 
@@ -103,9 +124,37 @@ def get_examples_service(bot: Bot | None) -> ExamplesService:
     return get_service(bot, "examples")
 
 
+def get_style_registry(bot: Bot | None) -> StyleRegistry:
+    return get_service(bot, "styles")
+
+
 def get_file_storage(bot: Bot | None) -> FileStorage:
     return _get_context("file_storage")
 
 
+def get_face_materializer(bot: Bot | None) -> FaceMaterializer:
+    return get_service(bot, "faces")
+
+
 def get_crypto_pay_service(bot: Bot | None) -> CryptoPayService:
     return get_service(bot, "crypto_pay")
+
+
+def get_invoice_poller(bot: Bot | None) -> InvoicePoller:
+    return get_service(bot, "invoices")
+
+
+def get_inflight_registry(bot: Bot | None) -> InflightRegistry:
+    return get_service(bot, "inflight")
+
+
+def get_generation_scheduler(bot: Bot | None) -> GenerationScheduler:
+    return get_service(bot, "scheduler")
+
+
+def get_priority_classifier(bot: Bot | None) -> PriorityClassifier:
+    return get_service(bot, "priorities")
+
+
+def get_generation_heartbeat(bot: Bot | None) -> GenerationHeartbeat:
+    return get_service(bot, "heartbeat")
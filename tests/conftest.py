@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.bot_photo.db import Database, prepare_schema  # noqa: E402
+
+Scenario = Callable[[Database], Awaitable[None]]
+
+
+@pytest.fixture
+def run_with_database(tmp_path: Path) -> Callable[[Scenario], None]:
+    """Run `scenario(database)` on a fresh, fully migrated database under `tmp_path`."""
+
+    def run(scenario: Scenario) -> None:
+        async def main() -> None:
+            database = Database(tmp_path / "app.db")
+            await database.connect()
+            await prepare_schema(database)
+            try:
+                await scenario(database)
+            finally:
+                await database.close()
+
+        asyncio.run(main())
+
+    return run
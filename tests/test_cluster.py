@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import sys
+
+import pytest
+
+from aiogram.types import Update
+
+from src.bot_photo.cluster import ChatOrderedRunner, ClusterFront, _poll, check_worker_slots, worker_env
+from src.bot_photo.config import Settings
+
+# Announces itself, then dies on the first update without acknowledging it.
+DYING_WORKER = "import sys; print('{\"ready\": true}', flush=True); sys.stdin.readline()"
+
+
+def _settings(**values) -> Settings:
+    return Settings(
+        _env_file=None, TELEGRAM_BOT_TOKEN="1:test", CRYPTO_BOT_TOKEN="1:test", NANO_BANANA_API_KEY="test", **values
+    )
+
+
+def _message(update_id: int, chat_id: int) -> Update:
+    return Update.model_validate(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": 1,
+                "date": 0,
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+                "text": "/start",
+            },
+        }
+    )
+
+
+def test_worker_env_splits_reserved_slots():
+    settings = _settings(GENERATION_CONCURRENCY=8, PRIORITY_RESERVED_SLOTS=2)
+    env = worker_env(settings, 1, 2, base={})
+    assert (env["GENERATION_CONCURRENCY"], env["PRIORITY_RESERVED_SLOTS"]) == ("4", "1")
+    env = worker_env(_settings(GENERATION_CONCURRENCY=8, PRIORITY_RESERVED_SLOTS=1), 0, 4, base={})
+    assert (env["GENERATION_CONCURRENCY"], env["PRIORITY_RESERVED_SLOTS"]) == ("2", "1")
+
+
+def test_split_without_shared_slot_is_rejected():
+    check_worker_slots(_settings(GENERATION_CONCURRENCY=4, PRIORITY_RESERVED_SLOTS=1), 2)
+    with pytest.raises(ValueError, match="no shared slot"):
+        check_worker_slots(_settings(GENERATION_CONCURRENCY=4, PRIORITY_RESERVED_SLOTS=1), 4)
+
+
+def test_updates_lost_with_a_worker_are_reported():
+    lost: list[int] = []
+
+    async def on_lost(update: Update) -> None:
+        lost.append(update.update_id)
+
+    async def scenario() -> None:
+        front = ClusterFront(1, lambda index: [sys.executable, "-c", DYING_WORKER], lambda index: {}, on_lost=on_lost)
+        await front.start()
+        assert await front.dispatch(_message(1, 42)) is False
+        # Within the restart interval the dead worker is not respawned; the update is lost as well.
+        assert await front.dispatch(_message(2, 42)) is False
+        await front.close()
+
+    asyncio.run(scenario())
+    assert lost == [1, 2]
+
+
+def test_updates_of_one_chat_are_handled_in_order():
+    events: list[tuple[str, int]] = []
+
+    async def handle(update: Update) -> None:
+        events.append(("start", update.update_id))
+        # The first update of chat 42 is the slowest; the second must still wait for it.
+        await asyncio.sleep({1: 0.03, 2: 0.0, 3: 0.01}[update.update_id])
+        events.append(("end", update.update_id))
+
+    async def scenario() -> None:
+        runner = ChatOrderedRunner(handle)
+        for update in (_message(1, 42), _message(2, 42), _message(3, 43)):
+            runner.submit(update)
+        await runner.wait()
+
+    asyncio.run(scenario())
+    assert events.index(("end", 1)) < events.index(("start", 2))
+    # Another chat is not held up by chat 42.
+    assert events.index(("end", 3)) < events.index(("end", 1))
+
+
+def test_polling_confirms_only_acknowledged_updates():
+    class Bot:
+        def __init__(self) -> None:
+            self.batches = [[_message(10, 42), _message(11, 43)]]
+            self.confirmed: int | None = None
+
+        async def get_updates(self, offset=None, timeout=None, request_timeout=None, limit=None):
+            if timeout == 0:
+                self.confirmed = offset
+                return []
+            if self.batches:
+                return self.batches.pop()
+            await asyncio.Event().wait()
+
+    class Front:
+        async def dispatch(self, update: Update) -> bool:
+            if update.update_id == 11:
+                await asyncio.Event().wait()  # a worker that never acknowledges
+            return True
+
+    async def scenario() -> int | None:
+        bot = Bot()
+        poller = asyncio.create_task(_poll(bot, Front(), drain_seconds=0.05))
+        await asyncio.sleep(0.01)
+        poller.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await poller
+        return bot.confirmed
+
+    assert asyncio.run(scenario()) == 11
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import json
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from src.bot_photo.db import Database
+from src.bot_photo.models import LedgerReason
+from src.bot_photo.repositories.ledger import LedgerRepository
+from src.bot_photo.repositories.payments import PaymentRepository
+from src.bot_photo.repositories.users import UserRepository
+from src.bot_photo.services.crypto_pay import CryptoPayService
+from src.bot_photo.services.crypto_webhook import SIGNATURE_HEADER, CryptoPayWebhook
+from src.bot_photo.services.invoice_poller import InvoicePoller
+from src.bot_photo.services.tokens import TokenService
+
+TOKEN = "1:test"
+USER_ID = 7
+INVOICE_ID = 501
+
+
+class Priorities:
+    """Records which users' cached scheduler class was dropped."""
+
+    def __init__(self) -> None:
+        self.forgotten: list[int] = []
+
+    def forget(self, user_id: int) -> None:
+        self.forgotten.append(user_id)
+
+
+def _body(invoice_id: int = INVOICE_ID, status: str = "paid") -> bytes:
+    payload = {"invoice_id": invoice_id, "status": status, "paid_at": "2026-01-01T00:00:00Z"}
+    return json.dumps({"update_type": "invoice_paid", "payload": payload}).encode()
+
+
+def _sign(body: bytes, token: str = TOKEN) -> str:
+    return hmac.new(hashlib.sha256(token.encode()).digest(), body, hashlib.sha256).hexdigest()
+
+
+async def _poller(database: Database, priorities: Priorities) -> InvoicePoller:
+    users = UserRepository(database)
+    payments = PaymentRepository(database)
+    await users.upsert_user(USER_ID, "user", "User", False, 10, 10)
+    await payments.save_invoice(invoice_id=INVOICE_ID, user_id=USER_ID, amount_usdt=1.0, tokens=50, status="active")
+    tokens = TokenService(users, LedgerRepository(database))
+    return InvoicePoller(database, CryptoPayService(TOKEN), payments, tokens, interval_seconds=0, priorities=priorities)
+
+
+async def _client(poller: InvoicePoller) -> TestClient:
+    app = web.Application()
+    app.router.add_post("/crypto-pay", CryptoPayWebhook(TOKEN, poller).handle)
+    client = TestClient(TestServer(app))
+    await client.start_server()
+    return client
+
+
+async def _payment_entries(database: Database) -> int:
+    return await database.fetchval("SELECT COUNT(*) FROM token_ledger WHERE reason=?", (LedgerReason.PAYMENT,))
+
+
+def test_rejects_bad_signatures(run_with_database):
+    async def scenario(database: Database) -> None:
+        client = await _client(await _poller(database, Priorities()))
+        body = _body()
+        try:
+            for signature in ("", _sign(body, token="2:other"), _sign(body + b" ")):
+                response = await client.post("/crypto-pay", data=body, headers={SIGNATURE_HEADER: signature})
+                assert response.status == 401
+        finally:
+            await client.close()
+        assert await _payment_entries(database) == 0
+
+    run_with_database(scenario)
+
+
+def test_credits_a_paid_invoice_once(run_with_database):
+    async def scenario(database: Database) -> None:
+        priorities = Priorities()
+        poller = await _poller(database, priorities)
+        client = await _client(poller)
+        body = _body()
+        try:
+            for _ in range(2):
+                response = await client.post("/crypto-pay", data=body, headers={SIGNATURE_HEADER: _sign(body)})
+                assert response.status == 200
+        finally:
+            await client.close()
+        assert await poller.credit(INVOICE_ID) is None
+        assert await _payment_entries(database) == 1
+        assert await database.fetchval("SELECT tokens FROM users WHERE telegram_id=?", (USER_ID,)) == 60
+        assert priorities.forgotten == [USER_ID]
+
+    run_with_database(scenario)
+
+
+def test_webhook_racing_the_poller_credits_once(run_with_database):
+    async def scenario(database: Database) -> None:
+        poller = await _poller(database, Priorities())
+        client = await _client(poller)
+        body = _body()
+        try:
+            response, polled = await asyncio.gather(
+                client.post("/crypto-pay", data=body, headers={SIGNATURE_HEADER: _sign(body)}),
+                poller.credit(INVOICE_ID),
+            )
+            assert response.status == 200
+        finally:
+            await client.close()
+        assert await _payment_entries(database) == 1
+        assert polled is None or polled[1] == 60
+
+    run_with_database(scenario)
+
+
+def test_ignores_unpaid_and_rejects_malformed_updates(run_with_database):
+    async def scenario(database: Database) -> None:
+        client = await _client(await _poller(database, Priorities()))
+        try:
+            for body, status in ((_body(status="active"), 200), (b"{}", 400), (b"not json", 400)):
+                response = await client.post("/crypto-pay", data=body, headers={SIGNATURE_HEADER: _sign(body)})
+                assert response.status == status
+        finally:
+            await client.close()
+        assert await _payment_entries(database) == 0
+
+    run_with_database(scenario)
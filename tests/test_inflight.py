@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import asyncio
+
+from aiogram.methods import AnswerCallbackQuery
+from aiogram.types import CallbackQuery
+from aiogram.types import User as TelegramUser
+
+from src.bot_photo.middlewares import CallbackDebounceMiddleware
+from src.bot_photo.services.inflight import InflightRegistry, parse_limits
+
+USER_ID = 7
+
+
+class Bot:
+    """Stands in for `aiogram.Bot`: records the API methods it is asked to call."""
+
+    def __init__(self) -> None:
+        self.calls: list[object] = []
+
+    async def __call__(self, method: object, request_timeout: int | None = None) -> bool:
+        self.calls.append(method)
+        return True
+
+
+def _press(bot: Bot, query_id: str, data: str = "session:generate", user_id: int = USER_ID) -> CallbackQuery:
+    user = TelegramUser(id=user_id, is_bot=False, first_name="User")
+    return CallbackQuery(id=query_id, from_user=user, chat_instance="chat", data=data).as_(bot)
+
+
+def test_extra_generations_are_rejected_until_a_lease_is_released():
+    registry = InflightRegistry(parse_limits("default=1,admin=2"))
+
+    lease = registry.try_acquire(USER_ID)
+    assert lease is not None
+    assert registry.try_acquire(USER_ID) is None
+    assert registry.try_acquire(USER_ID + 1) is not None
+    lease.release()
+    lease.release()
+    assert registry.running(USER_ID) == 0
+    assert registry.try_acquire(USER_ID) is not None
+
+
+def test_limits_follow_the_tier():
+    registry = InflightRegistry(parse_limits("default=1,admin=2,vip=0"))
+
+    assert [registry.try_acquire(1, "admin") is not None for _ in range(3)] == [True, True, False]
+    # Unlisted tiers use the default limit; 0 means no cap.
+    assert registry.limit("paid") == 1
+    assert all(registry.try_acquire(2, "vip") for _ in range(5))
+
+
+def test_lease_is_released_when_the_block_fails():
+    async def scenario() -> None:
+        registry = InflightRegistry({"default": 1})
+        lease = registry.try_acquire(USER_ID)
+        assert lease is not None
+        try:
+            async with lease:
+                raise RuntimeError("upstream failed")
+        except RuntimeError:
+            pass
+        assert registry.running(USER_ID) == 0
+
+    asyncio.run(scenario())
+
+
+def test_debounce_drops_double_taps_and_redeliveries():
+    async def scenario() -> None:
+        bot = Bot()
+        middleware = CallbackDebounceMiddleware(window_seconds=60)
+        handled: list[str] = []
+
+        async def handler(event: CallbackQuery, data: dict) -> None:
+            handled.append(event.id)
+
+        for query in (
+            _press(bot, "1"),
+            _press(bot, "2"),  # the same button again within the window
+            _press(bot, "1", data="session:cancel"),  # a redelivered query id
+            _press(bot, "3", data="session:cancel"),
+            _press(bot, "4", user_id=USER_ID + 1),
+        ):
+            await middleware(handler, query, {})
+        assert handled == ["1", "3", "4"]
+        # Dropped presses are still answered so the client stops its spinner.
+        assert [call.callback_query_id for call in bot.calls if isinstance(call, AnswerCallbackQuery)] == ["2", "1"]
+
+    asyncio.run(scenario())
+
+
+def test_presses_outside_the_window_go_through():
+    async def scenario() -> None:
+        middleware = CallbackDebounceMiddleware(window_seconds=0)
+        handled: list[str] = []
+
+        async def handler(event: CallbackQuery, data: dict) -> None:
+            handled.append(event.id)
+
+        bot = Bot()
+        for query_id in ("1", "2", "3"):
+            await middleware(handler, _press(bot, query_id), {})
+        assert handled == ["1", "2", "3"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+from src.bot_photo.db import Database
+from src.bot_photo.models import LedgerReason
+from src.bot_photo.repositories.ledger import LedgerRepository
+from src.bot_photo.repositories.payments import PaymentRepository
+from src.bot_photo.repositories.users import UserRepository
+from src.bot_photo.services.invoice_poller import InvoicePoller
+from src.bot_photo.services.tokens import TokenService
+
+USER_ID = 7
+STARTING_TOKENS = 10
+TOKENS_PER_INVOICE = 50
+
+
+class CryptoPay:
+    """Answers `get_invoices` from a status table and records how it was called."""
+
+    def __init__(self, statuses: dict[int, str]) -> None:
+        self.statuses = statuses
+        self.calls: list[list[int]] = []
+
+    async def get_invoices(self, invoice_ids: list[int]) -> list[SimpleNamespace]:
+        self.calls.append(list(invoice_ids))
+        return [
+            SimpleNamespace(invoice_id=invoice_id, status=self.statuses[invoice_id], paid_at=None)
+            for invoice_id in invoice_ids
+            if invoice_id in self.statuses
+        ]
+
+
+async def _poller(database: Database, crypto: CryptoPay, batch_size: int = 100) -> InvoicePoller:
+    users = UserRepository(database)
+    payments = PaymentRepository(database)
+    await users.upsert_user(USER_ID, "user", "User", False, STARTING_TOKENS, 10)
+    for invoice_id in crypto.statuses:
+        await payments.save_invoice(
+            invoice_id=invoice_id, user_id=USER_ID, amount_usdt=1.0, tokens=TOKENS_PER_INVOICE, status="active"
+        )
+    tokens = TokenService(users, LedgerRepository(database))
+    return InvoicePoller(database, crypto, payments, tokens, interval_seconds=30, batch_size=batch_size)
+
+
+async def _status(database: Database, invoice_id: int) -> str:
+    return await database.fetchval("SELECT status FROM payments WHERE invoice_id=?", (invoice_id,))
+
+
+async def _balance(database: Database) -> int:
+    return await database.fetchval("SELECT tokens FROM users WHERE telegram_id=?", (USER_ID,))
+
+
+def test_paid_invoices_are_credited_once_across_polls(run_with_database):
+    async def scenario(database: Database) -> None:
+        crypto = CryptoPay({1: "paid", 2: "active", 3: "expired"})
+        poller = await _poller(database, crypto)
+
+        assert await poller.poll_once() == 1
+        assert [await _status(database, invoice_id) for invoice_id in (1, 2, 3)] == ["credited", "active", "expired"]
+        # Credited and expired invoices are done; the active one waits out its backoff.
+        assert await poller.poll_once() == 0
+        assert len(crypto.calls) == 1
+
+        crypto.statuses[2] = "paid"
+        await database.execute("UPDATE payments SET next_check_at=NULL")
+        assert await poller.poll_once() == 1
+        assert await poller.poll_once() == 0
+        # The manual "check payment" button and the webhook share `credit`.
+        assert await poller.credit(1) is None
+
+        entries = await database.fetchval(
+            "SELECT COUNT(*) FROM token_ledger WHERE reason=?", (LedgerReason.PAYMENT,)
+        )
+        assert entries == 2
+        assert await _balance(database) == STARTING_TOKENS + 2 * TOKENS_PER_INVOICE
+
+    run_with_database(scenario)
+
+
+def test_due_invoices_are_asked_about_in_batches(run_with_database):
+    async def scenario(database: Database) -> None:
+        crypto = CryptoPay({invoice_id: "paid" for invoice_id in range(1, 6)})
+        poller = await _poller(database, crypto, batch_size=2)
+
+        assert await poller.poll_once() == 5
+        assert sorted(len(call) for call in crypto.calls) == [1, 2, 2]
+        assert await _balance(database) == STARTING_TOKENS + 5 * TOKENS_PER_INVOICE
+
+    run_with_database(scenario)
+
+
+def test_still_active_invoices_back_off(run_with_database):
+    async def scenario(database: Database) -> None:
+        poller = await _poller(database, CryptoPay({1: "active"}))
+
+        await poller.poll_once()
+        first = await database.fetchone("SELECT check_attempts, next_check_at FROM payments WHERE invoice_id=1")
+        await database.execute("UPDATE payments SET next_check_at=NULL")
+        await poller.poll_once()
+        second = await database.fetchone("SELECT check_attempts, next_check_at FROM payments WHERE invoice_id=1")
+        assert (first["check_attempts"], second["check_attempts"]) == (1, 2)
+        assert second["next_check_at"] > first["next_check_at"]
+
+    run_with_database(scenario)
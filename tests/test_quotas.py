@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from src.bot_photo.db import Database
+from src.bot_photo.models import UserQuota
+from src.bot_photo.repositories.blobs import BlobRepository
+from src.bot_photo.repositories.faces import FaceRepository
+from src.bot_photo.repositories.quotas import QuotaRepository
+from src.bot_photo.repositories.sessions import SessionRepository
+from src.bot_photo.repositories.users import UserRepository
+from src.bot_photo.services.quotas import QuotaService
+
+USER_ID = 1
+
+
+async def _user_with_blobs(database: Database, sizes: dict[str, int]) -> None:
+    await UserRepository(database).upsert_user(USER_ID, "user", "User", False, 10, 5)
+    blobs = BlobRepository(database)
+    for path, size in sizes.items():
+        await blobs.record(path, path, size)
+
+
+async def _generation(database: Database, path: str) -> int:
+    sessions = SessionRepository(database)
+    session = await sessions.create_session(USER_ID, "style", None, "processing", 1)
+    await sessions.update_status(session.id, "ready", path)
+    return session.id
+
+
+def _counters(usage: UserQuota) -> tuple[int, int, int, int]:
+    return usage.face_count, usage.face_bytes, usage.generation_count, usage.generation_bytes
+
+
+def test_triggers_keep_usage_current(run_with_database):
+    async def scenario(database: Database) -> None:
+        await _user_with_blobs(database, {"face-a": 100, "face-b": 50, "result": 300})
+        faces = FaceRepository(database)
+        quotas = QuotaRepository(database)
+
+        face = await faces.add_face(USER_ID, None, None, "face-a")
+        await faces.add_face(USER_ID, None, None, "face-b")
+        await _generation(database, "result")
+        usage = await quotas.get(USER_ID)
+        assert (usage.face_count, usage.face_bytes) == (2, 150)
+        assert (usage.generation_count, usage.generation_bytes) == (1, 300)
+
+        await faces.update_file_path(face.id, USER_ID, "face-b")
+        assert (await quotas.get(USER_ID)).face_bytes == 100
+        await faces.delete_face(face.id, USER_ID)
+        usage = await quotas.get(USER_ID)
+        assert (usage.face_count, usage.face_bytes) == (1, 50)
+
+        # A from-scratch recount agrees with what the triggers kept.
+        await quotas.rebuild()
+        assert _counters(await quotas.get(USER_ID)) == _counters(usage)
+
+    run_with_database(scenario)
+
+
+def test_face_limits_refuse_new_faces(run_with_database):
+    async def scenario(database: Database) -> None:
+        await _user_with_blobs(database, {"face-a": 100, "face-b": 100})
+        faces = FaceRepository(database)
+        by_count = QuotaService(QuotaRepository(database), max_faces=2)
+        by_bytes = QuotaService(QuotaRepository(database), max_face_bytes=200)
+
+        await faces.add_face(USER_ID, None, None, "face-a")
+        assert await by_count.can_add_face(USER_ID) and await by_bytes.can_add_face(USER_ID)
+        await faces.add_face(USER_ID, None, None, "face-b")
+        assert not await by_count.can_add_face(USER_ID)
+        assert not await by_bytes.can_add_face(USER_ID)
+        assert await QuotaService(QuotaRepository(database)).can_add_face(USER_ID)
+
+    run_with_database(scenario)
+
+
+def test_oldest_generations_are_evicted_first(run_with_database):
+    async def scenario(database: Database) -> None:
+        await _user_with_blobs(database, {f"result-{n}": 100 for n in range(4)})
+        ids = [await _generation(database, f"result-{n}") for n in range(4)]
+        quotas = QuotaRepository(database)
+        service = QuotaService(quotas, max_generation_bytes=250)
+
+        assert await service.enforce_generations(USER_ID) == 2
+        usage = await quotas.get(USER_ID)
+        assert (usage.generation_count, usage.generation_bytes) == (2, 200)
+        sessions = SessionRepository(database)
+        kept = [(await sessions.get_by_id(session_id)).result_path for session_id in ids]
+        assert kept == [None, None, "result-2", "result-3"]
+        assert await service.enforce_generations(USER_ID) == 0
+
+    run_with_database(scenario)
+
+
+def test_newest_generation_is_kept_over_the_limit(run_with_database):
+    async def scenario(database: Database) -> None:
+        await _user_with_blobs(database, {"small": 10, "huge": 1000})
+        await _generation(database, "small")
+        newest = await _generation(database, "huge")
+        service = QuotaService(QuotaRepository(database), max_generation_bytes=100)
+
+        assert await service.enforce_generations(USER_ID) == 1
+        assert (await SessionRepository(database).get_by_id(newest)).result_path == "huge"
+
+    run_with_database(scenario)
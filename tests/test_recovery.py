@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import asyncio
+
+from src.bot_photo.db import Database
+from src.bot_photo.models import LedgerReason
+from src.bot_photo.repositories.faces import FaceRepository
+from src.bot_photo.repositories.ledger import LedgerRepository
+from src.bot_photo.repositories.prompts import PromptRepository
+from src.bot_photo.repositories.sessions import SessionRepository
+from src.bot_photo.repositories.users import UserRepository
+from src.bot_photo.services.heartbeat import GenerationHeartbeat
+from src.bot_photo.services.recovery import GenerationRecovery
+from src.bot_photo.services.scheduler import GenerationScheduler
+from src.bot_photo.services.tokens import TokenService
+
+USER_ID = 7
+
+
+class Harness:
+    """A recovery sweep over a fresh database. Without a bot nothing is resumed, so
+    every stale row is refunded and the generation collaborators are never used."""
+
+    def __init__(self, database: Database) -> None:
+        self.db = database
+        self.sessions = SessionRepository(database)
+        self.prompts = PromptRepository(database)
+        self.tokens = TokenService(UserRepository(database), LedgerRepository(database))
+        self.scheduler = GenerationScheduler(1)
+        self.heartbeat = GenerationHeartbeat(self.sessions, self.prompts)
+        self.recovery = GenerationRecovery(
+            database,
+            self.sessions,
+            self.prompts,
+            FaceRepository(database),
+            self.tokens,
+            nano=None,
+            materializer=None,
+            styles=None,
+            storage=None,
+            scheduler=self.scheduler,
+            quotas=None,
+            heartbeat=self.heartbeat,
+            stale_seconds=900,
+        )
+
+    async def start_session(self, *, age_hours: int = 2):
+        """A processing session with its cost held, created `age_hours` ago."""
+        session = await self.sessions.create_session(
+            USER_ID, "studio", None, "processing", 10, inputs={"orientation": "portrait", "faces": []}
+        )
+        hold = await self.tokens.hold(USER_ID, 10, LedgerReason.SESSION, f"session:{session.id}")
+        await self.db.execute(
+            "UPDATE sessions SET created_at=datetime('now', ?) WHERE id=?", (f"-{age_hours} hours", session.id)
+        )
+        return session, hold
+
+    async def status(self, session_id: int) -> str:
+        return await self.db.fetchval("SELECT status FROM sessions WHERE id=?", (session_id,))
+
+
+async def _harness(database: Database) -> Harness:
+    await UserRepository(database).upsert_user(USER_ID, "user", "User", False, 100, 10)
+    return Harness(database)
+
+
+def test_skips_generation_running_in_this_process(run_with_database):
+    async def scenario(database: Database) -> None:
+        h = await _harness(database)
+        session, hold = await h.start_session()
+        async with h.heartbeat.track("session", session.id):
+            summary = await h.recovery.run_once()
+        assert (summary.resumed, summary.refunded) == (0, 0)
+        assert await h.status(session.id) == "processing"
+        assert (await h.tokens.find_hold(hold.ref)).status == "held"
+
+    run_with_database(scenario)
+
+
+def test_skips_generation_waiting_for_a_slot(run_with_database):
+    async def scenario(database: Database) -> None:
+        h = await _harness(database)
+        session, _ = await h.start_session()
+        started = asyncio.Event()
+
+        async def generation() -> None:
+            async with h.heartbeat.track("session", session.id), h.scheduler.slot(USER_ID, "default"):
+                started.set()
+
+        async with h.scheduler.slot(USER_ID + 1, "default"):
+            task = asyncio.create_task(generation())
+            await asyncio.sleep(0.01)
+            assert not started.is_set()
+            summary = await h.recovery.run_once()
+        await task
+        assert summary.refunded == 0
+        assert await h.status(session.id) == "processing"
+
+    run_with_database(scenario)
+
+
+def test_skips_rows_another_worker_keeps_alive(run_with_database):
+    async def scenario(database: Database) -> None:
+        h = await _harness(database)
+        session, _ = await h.start_session()
+        other_worker = GenerationHeartbeat(h.sessions, h.prompts)
+        async with other_worker.track("session", session.id):
+            assert await other_worker.beat() == 1
+            summary = await h.recovery.run_once()
+        assert summary.refunded == 0
+        assert await h.status(session.id) == "processing"
+
+    run_with_database(scenario)
+
+
+def test_refunds_abandoned_rows(run_with_database):
+    async def scenario(database: Database) -> None:
+        h = await _harness(database)
+        session, hold = await h.start_session()
+        fresh, _ = await h.start_session(age_hours=0)
+        assert await h.tokens.balance(USER_ID) == 80
+        summary = await h.recovery.run_once()
+        assert (summary.resumed, summary.refunded, summary.tokens_returned) == (0, 1, 10)
+        assert await h.status(session.id) == "failed"
+        assert await h.status(fresh.id) == "processing"
+        assert (await h.tokens.find_hold(hold.ref)).status == "released"
+        assert await h.tokens.balance(USER_ID) == 90
+
+    run_with_database(scenario)
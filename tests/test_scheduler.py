@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import asyncio
+
+from src.bot_photo.services.scheduler import GenerationScheduler
+
+BLOCKER = 0
+
+
+async def _served_order(scheduler: GenerationScheduler, requests: list[tuple[str, int, str]]) -> list[str]:
+    """Queue `requests` (name, user id, class) behind a held slot and return the order they are served in."""
+    order: list[str] = []
+
+    async def request(name: str, user_id: int, priority: str) -> None:
+        async with scheduler.slot(user_id, priority):
+            order.append(name)
+            await asyncio.sleep(0)
+
+    async with scheduler.slot(BLOCKER):
+        tasks = [asyncio.create_task(request(*item)) for item in requests]
+        await asyncio.sleep(0)
+        assert scheduler.waiting == len(requests)
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_concurrency_is_capped():
+    async def scenario() -> None:
+        scheduler = GenerationScheduler(2)
+        peak = 0
+
+        async def request(user_id: int) -> None:
+            nonlocal peak
+            async with scheduler.slot(user_id):
+                peak = max(peak, scheduler.running)
+                await asyncio.sleep(0.001)
+
+        await asyncio.gather(*(request(user_id) for user_id in range(10)))
+        assert peak == 2
+        assert (scheduler.running, scheduler.waiting) == (0, 0)
+
+    asyncio.run(scenario())
+
+
+def test_users_take_turns():
+    async def scenario() -> None:
+        scheduler = GenerationScheduler(1)
+        order = await _served_order(
+            scheduler, [(f"a{n}", 1, "default") for n in range(1, 5)] + [(f"b{n}", 2, "default") for n in (1, 2)]
+        )
+        assert order == ["a1", "b1", "a2", "b2", "a3", "a4"]
+
+    asyncio.run(scenario())
+
+
+def test_heavier_classes_get_more_turns():
+    async def scenario() -> None:
+        scheduler = GenerationScheduler(1, {"paid": 2, "default": 1})
+        order = await _served_order(
+            scheduler, [(f"p{n}", 1, "paid") for n in range(1, 5)] + [(f"d{n}", 2, "default") for n in (1, 2)]
+        )
+        assert order == ["p1", "p2", "d1", "p3", "p4", "d2"]
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_gives_up_its_turn():
+    async def scenario() -> None:
+        scheduler = GenerationScheduler(1)
+        served: list[int] = []
+
+        async def request(user_id: int) -> None:
+            async with scheduler.slot(user_id):
+                served.append(user_id)
+
+        async with scheduler.slot(BLOCKER):
+            first = asyncio.create_task(request(1))
+            second = asyncio.create_task(request(2))
+            await asyncio.sleep(0)
+            first.cancel()
+            await asyncio.sleep(0)
+            assert scheduler.waiting == 1
+        await second
+        assert served == [2]
+        assert scheduler.running == 0
+
+    asyncio.run(scenario())
+
+
+def test_waiters_hear_their_position():
+    async def scenario() -> None:
+        scheduler = GenerationScheduler(1, position_interval=0)
+        positions: list[int] = []
+
+        async def on_position(position: int) -> None:
+            positions.append(position)
+
+        async def request() -> None:
+            async with scheduler.slot(2, on_position=on_position):
+                pass
+
+        async with scheduler.slot(BLOCKER):
+            waiter = asyncio.create_task(request())
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            assert positions == [1]
+        await waiter
+        assert positions == [1, 0]
+
+    asyncio.run(scenario())
+
+
+def test_lane_requests_go_first():
+    async def scenario() -> None:
+        scheduler = GenerationScheduler(1, lane_classes=["priority"])
+        order = await _served_order(
+            scheduler, [("d1", 1, "default"), ("d2", 2, "default"), ("p1", 3, "priority"), ("d3", 1, "default")]
+        )
+        assert order == ["p1", "d1", "d2", "d3"]
+
+    asyncio.run(scenario())
+
+
+def test_reserved_slot_is_kept_for_the_lane():
+    async def scenario() -> None:
+        scheduler = GenerationScheduler(2, reserved=1, lane_classes=["priority"])
+        release = asyncio.Event()
+        running: list[str] = []
+
+        async def request(name: str, user_id: int, priority: str) -> None:
+            async with scheduler.slot(user_id, priority):
+                running.append(name)
+                await release.wait()
+
+        shared = [asyncio.create_task(request(f"d{n}", n, "default")) for n in (1, 2)]
+        await asyncio.sleep(0)
+        assert (running, scheduler.waiting) == (["d1"], 1)
+        lane = asyncio.create_task(request("p1", 3, "priority"))
+        await asyncio.sleep(0)
+        assert running == ["d1", "p1"]
+        release.set()
+        await asyncio.gather(*shared, lane)
+        assert running == ["d1", "p1", "d2"]
+
+    asyncio.run(scenario())
+
+
+def test_one_slot_always_stays_shared():
+    async def scenario() -> None:
+        scheduler = GenerationScheduler(2, reserved=5, lane_classes=["priority"])
+        async with scheduler.slot(1, "default"):
+            assert scheduler.running == 1
+
+    asyncio.run(asyncio.wait_for(scenario(), 1))
+
+
+def test_position_is_not_shown_after_the_slot_is_granted():
+    async def scenario() -> None:
+        scheduler = GenerationScheduler(1, position_interval=0)
+        positions: list[int] = []
+
+        async def on_position(position: int) -> None:
+            positions.append(position)
+
+        async def request() -> None:
+            async with scheduler.slot(2, on_position=on_position):
+                pass
+
+        async with scheduler.slot(BLOCKER):
+            waiter = asyncio.create_task(request())
+            await asyncio.sleep(0)
+        # The slot was granted before the queued position update got to run.
+        await waiter
+        assert positions == []
+
+    asyncio.run(scenario())
+
+
+def test_shown_position_only_counts_down():
+    async def scenario() -> None:
+        scheduler = GenerationScheduler(1, lane_classes=["priority"], position_interval=0)
+        positions: list[int] = []
+
+        async def on_position(position: int) -> None:
+            positions.append(position)
+
+        async def request(user_id: int, priority: str, callback=None) -> None:
+            async with scheduler.slot(user_id, priority, on_position=callback):
+                await asyncio.sleep(0)
+
+        async with scheduler.slot(BLOCKER):
+            watched = asyncio.create_task(request(1, "default", on_position))
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            lane = [asyncio.create_task(request(user_id, "priority")) for user_id in (2, 3)]
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+        await asyncio.gather(watched, *lane)
+        assert positions == [1, 0]
+
+    asyncio.run(scenario())
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import asyncio
+
+from aiogram.types import Update
+
+from src.bot_photo.middlewares.shutdown import ShutdownMiddleware
+from src.bot_photo.services.shutdown import ShutdownCoordinator
+
+
+async def _tracked(coordinator: ShutdownCoordinator, seconds: float, log: list[str], name: str) -> None:
+    async with coordinator.track():
+        try:
+            await asyncio.sleep(seconds)
+            log.append(f"{name} finished")
+        except asyncio.CancelledError:
+            # Handlers release their hold and mark the row failed here.
+            log.append(f"{name} cleaned up")
+            raise
+
+
+def test_drain_waits_for_running_updates():
+    async def scenario() -> None:
+        coordinator = ShutdownCoordinator(drain_seconds=5)
+        log: list[str] = []
+        tasks = [asyncio.create_task(_tracked(coordinator, 0.01 * n, log, f"u{n}")) for n in (1, 2)]
+        await asyncio.sleep(0)
+        assert coordinator.inflight == 2
+
+        assert await coordinator.drain() == 0
+        assert log == ["u1 finished", "u2 finished"]
+        assert coordinator.inflight == 0
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+
+
+def test_updates_past_the_deadline_are_cancelled():
+    async def scenario() -> None:
+        coordinator = ShutdownCoordinator(drain_seconds=0.05)
+        log: list[str] = []
+        quick = asyncio.create_task(_tracked(coordinator, 0.01, log, "quick"))
+        slow = asyncio.create_task(_tracked(coordinator, 60, log, "slow"))
+        await asyncio.sleep(0)
+
+        assert await asyncio.wait_for(coordinator.drain(), 2) == 1
+        assert log == ["quick finished", "slow cleaned up"]
+        assert quick.done() and slow.cancelled()
+
+    asyncio.run(scenario())
+
+
+def test_no_update_is_admitted_once_draining():
+    async def scenario() -> None:
+        coordinator = ShutdownCoordinator(drain_seconds=1)
+        middleware = ShutdownMiddleware(coordinator)
+        handled: list[int] = []
+
+        async def handler(event: Update, data: dict) -> None:
+            handled.append(event.update_id)
+
+        await middleware(handler, Update(update_id=1), {})
+        assert await coordinator.drain() == 0
+        await middleware(handler, Update(update_id=2), {})
+        assert handled == [1]
+        assert coordinator.draining
+
+    asyncio.run(scenario())
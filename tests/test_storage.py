@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from src.bot_photo.db import Database
+from src.bot_photo.repositories.blobs import BlobRepository
+from src.bot_photo.repositories.faces import FaceRepository
+from src.bot_photo.repositories.sessions import SessionRepository
+from src.bot_photo.repositories.users import UserRepository
+from src.bot_photo.storage import FileStorage
+
+USER_ID = 1
+
+
+async def _storage(database: Database, root: Path) -> tuple[FileStorage, BlobRepository]:
+    await UserRepository(database).upsert_user(USER_ID, "user", "User", False, 10, 5)
+    blobs = BlobRepository(database)
+    return FileStorage(root / "faces", root / "sessions", blobs=blobs), blobs
+
+
+def test_identical_content_is_stored_once(run_with_database, tmp_path):
+    async def scenario(database: Database) -> None:
+        storage, blobs = await _storage(database, tmp_path)
+        try:
+            first = await storage.save_generation(b"same bytes")
+            second = await storage.save_generation(b"same bytes")
+            other = await storage.save_generation(b"other bytes")
+        finally:
+            await storage.close()
+        assert first == second != other
+        assert first.read_bytes() == b"same bytes"
+        assert await blobs.total_size() == len(b"same bytes") + len(b"other bytes")
+
+    run_with_database(scenario)
+
+
+def test_reference_count_follows_the_rows(run_with_database, tmp_path):
+    async def scenario(database: Database) -> None:
+        storage, blobs = await _storage(database, tmp_path)
+        faces = FaceRepository(database)
+        sessions = SessionRepository(database)
+        try:
+            path = (await storage.save_generation(b"face")).as_posix()
+            other = (await storage.save_generation(b"other face")).as_posix()
+        finally:
+            await storage.close()
+
+        async def refcount() -> int:
+            blob = await blobs.get(path)
+            assert blob
+            return blob.refcount
+
+        assert await refcount() == 0
+        face = await faces.add_face(USER_ID, None, None, path)
+        session = await sessions.create_session(USER_ID, "style", None, "processing", 1)
+        await sessions.update_status(session.id, "ready", path)
+        assert await refcount() == 2
+        assert await blobs.referenced_paths([path, other]) == {path}
+
+        await faces.update_file_path(face.id, USER_ID, other)
+        assert await refcount() == 1
+        await database.execute("DELETE FROM sessions WHERE id=?", (session.id,))
+        assert await refcount() == 0
+        assert await blobs.referenced_paths([path, other]) == {other}
+
+    run_with_database(scenario)
+
+
+def test_files_stored_before_blobs_keep_their_rows_count(run_with_database, tmp_path):
+    async def scenario(database: Database) -> None:
+        storage, blobs = await _storage(database, tmp_path)
+        try:
+            path = (await storage.save_generation(b"legacy")).as_posix()
+        finally:
+            await storage.close()
+        await blobs.delete(path)
+        await FaceRepository(database).add_face(USER_ID, None, None, path)
+        # No `blobs` entry yet: the face row itself keeps the file.
+        assert await blobs.referenced_paths([path]) == {path}
+        assert await blobs.still_needed(path, 0)
+        # Recording it later starts the count from the rows already pointing at it.
+        await blobs.record(path, "hash", 6)
+        blob = await blobs.get(path)
+        assert blob and blob.refcount == 1
+
+    run_with_database(scenario)
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import os
+import time
+from pathlib import Path
+
+from src.bot_photo.db import Database
+from src.bot_photo.repositories.blobs import BlobRepository
+from src.bot_photo.repositories.faces import FaceRepository
+from src.bot_photo.repositories.users import UserRepository
+from src.bot_photo.services.storage_gc import StorageGarbageCollector
+from src.bot_photo.storage import FileStorage
+
+USER_ID = 1
+GRACE = 3600
+
+
+class StaleBlobRepository(BlobRepository):
+    """Answers the batch reference query as if it ran before any row pointed at the files."""
+
+    async def referenced_paths(self, paths: list[str]) -> set[str]:
+        return set()
+
+
+async def _stored(database: Database, root: Path, *contents: bytes) -> tuple[FileStorage, list[Path]]:
+    await UserRepository(database).upsert_user(USER_ID, "user", "User", False, 10, 5)
+    storage = FileStorage(root / "faces", root / "sessions", blobs=BlobRepository(database))
+    paths = [await storage.save_generation(content, ".bin") for content in contents]
+    await storage.run_io(_age, paths)
+    # Stored long enough ago for the grace period to have passed.
+    await database.execute("UPDATE blobs SET updated_at=datetime('now', '-2 hours')")
+    return storage, paths
+
+
+def _age(paths: list[Path]) -> None:
+    old = time.time() - 2 * GRACE
+    for path in paths:
+        os.utime(path, (old, old))
+
+
+def test_gc_deletes_only_unreferenced_files(run_with_database, tmp_path):
+    async def scenario(database: Database) -> None:
+        storage, (kept, orphan) = await _stored(database, tmp_path, b"kept", b"orphan")
+        try:
+            await FaceRepository(database).add_face(USER_ID, None, None, kept.as_posix())
+            report = await StorageGarbageCollector(storage, BlobRepository(database), grace_seconds=GRACE).run_pass()
+        finally:
+            await storage.close()
+        assert (report.referenced, report.deleted) == (1, 1)
+        assert kept.exists() and not orphan.exists()
+        assert await BlobRepository(database).get(orphan.as_posix()) is None
+
+    run_with_database(scenario)
+
+
+def test_gc_keeps_young_files_and_dry_run_deletes_nothing(run_with_database, tmp_path):
+    async def scenario(database: Database) -> None:
+        storage, (orphan,) = await _stored(database, tmp_path, b"orphan")
+        young = await storage.save_generation(b"young", ".bin")
+        try:
+            blobs = BlobRepository(database)
+            report = await StorageGarbageCollector(storage, blobs, grace_seconds=GRACE, dry_run=True).run_pass()
+            assert (report.too_young, report.orphaned, report.deleted) == (1, 1, 0)
+            assert orphan.exists()
+            await StorageGarbageCollector(storage, blobs, grace_seconds=GRACE).run_pass()
+        finally:
+            await storage.close()
+        assert young.exists() and not orphan.exists()
+
+    run_with_database(scenario)
+
+
+def test_gc_rechecks_references_before_deleting(run_with_database, tmp_path):
+    async def scenario(database: Database) -> None:
+        storage, (path,) = await _stored(database, tmp_path, b"face")
+        blobs = StaleBlobRepository(database)
+        try:
+            # The batch saw the file unreferenced, but a face row points at it by delete time.
+            await FaceRepository(database).add_face(USER_ID, None, None, path.as_posix())
+            report = await StorageGarbageCollector(storage, blobs, grace_seconds=GRACE).run_pass()
+            assert (report.referenced, report.deleted) == (1, 0)
+            assert path.exists()
+
+            # Stored again within the grace period: kept even with no row, and even
+            # if the backend's modification time says otherwise.
+            await database.execute("DELETE FROM faces")
+            await storage.save_generation(b"face", ".bin")
+            await storage.run_io(_age, [path])
+            report = await StorageGarbageCollector(storage, blobs, grace_seconds=GRACE).run_pass()
+            assert report.deleted == 0
+            assert path.exists()
+        finally:
+            await storage.close()
+
+    run_with_database(scenario)
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+from src.bot_photo.services.examples import ExamplesService
+from src.bot_photo.services.styles import ORIENTATIONS, StyleRegistry
+
+REPO_DATA = Path(__file__).resolve().parents[1] / "repo"
+
+CATALOG = {
+    "default_example": "studio",
+    "aspects": {"vertical": "9:16", "horizontal": "16:9"},
+    "default_prompt": "Фотосессия «{label}»: {scene}",
+    "prompt_suffix": "1080p",
+    "styles": [
+        {"key": "beach", "label": "Пляж", "scene": "sunset beach", "orientation": "horizontal", "example": "beach"},
+        {"key": "studio", "label": "Студия", "scene": "white studio"},
+    ],
+}
+
+
+def _registry(directory: Path, catalog: dict = CATALOG) -> StyleRegistry:
+    path = directory / "styles.json"
+    path.write_text(json.dumps(catalog, ensure_ascii=False), encoding="utf-8")
+    registry = StyleRegistry(path, ExamplesService(directory / "examples"))
+    registry.load()
+    return registry
+
+
+def test_default_prompt_is_precompiled_per_orientation(tmp_path):
+    registry = _registry(tmp_path)
+    assert registry.prompt("beach", "vertical") == "9:16, Фотосессия «Пляж»: sunset beach, 1080p"
+    assert registry.prompt("beach", "horizontal") == "16:9, Фотосессия «Пляж»: sunset beach, 1080p"
+    assert registry.default_orientation("beach") == "horizontal"
+    assert registry.default_orientation("studio") == "vertical"
+
+
+def test_user_prompt_replaces_the_scene(tmp_path):
+    registry = _registry(tmp_path)
+    assert registry.prompt("beach", "vertical", "in a red dress") == "9:16, in a red dress, 1080p"
+    assert registry.prompt("beach", "vertical", "") == registry.prompt("beach", "vertical")
+
+
+def test_unknown_style_still_gets_a_prompt(tmp_path):
+    registry = _registry(tmp_path)
+    assert registry.prompt("gone", "horizontal") == "16:9, Высококлассная реалистичная фотосессия в стиле gone, 1080p"
+    assert registry.prompt("gone", "vertical", "custom") == "9:16, custom, 1080p"
+    assert registry.label("gone") == "gone"
+
+
+def test_shipped_catalog_loads():
+    registry = StyleRegistry(REPO_DATA / "styles.json", ExamplesService(REPO_DATA / "examples"))
+    registry.load()
+    assert registry.choices()
+    for key, label in registry.choices():
+        for orientation in ORIENTATIONS:
+            assert label in registry.prompt(key, orientation)
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from src.bot_photo.db import Database
+from src.bot_photo.models import LedgerReason
+from src.bot_photo.repositories.ledger import LedgerRepository
+from src.bot_photo.repositories.users import UserRepository
+from src.bot_photo.services.tokens import InsufficientTokensError, TokenService
+
+USER_ID = 7
+
+
+async def _tokens(database: Database, starting_tokens: int = 10) -> TokenService:
+    users = UserRepository(database)
+    await users.upsert_user(USER_ID, "user", "User", False, starting_tokens, 10)
+    return TokenService(users, LedgerRepository(database))
+
+
+def test_every_change_is_recorded_in_the_ledger(run_with_database):
+    async def scenario(database: Database) -> None:
+        tokens = await _tokens(database)
+        assert await tokens.spend(USER_ID, 4, LedgerReason.SESSION, "session:1") == 6
+        assert await tokens.add(USER_ID, 5, LedgerReason.PAYMENT, "invoice:1") == 11
+        history = await tokens.history(USER_ID)
+        assert [(entry.delta, entry.balance_after, entry.reason) for entry in history] == [
+            (5, 11, LedgerReason.PAYMENT),
+            (-4, 6, LedgerReason.SESSION),
+            (10, 10, LedgerReason.STARTING_GRANT),
+        ]
+        assert await tokens.check_consistency() == []
+
+    run_with_database(scenario)
+
+
+def test_spend_never_goes_below_zero(run_with_database):
+    async def scenario(database: Database) -> None:
+        tokens = await _tokens(database)
+        results = await asyncio.gather(
+            *(tokens.spend(USER_ID, 3, LedgerReason.PROMPT) for _ in range(5)), return_exceptions=True
+        )
+        assert sum(isinstance(result, InsufficientTokensError) for result in results) == 2
+        assert await tokens.balance(USER_ID) == 1
+        with pytest.raises(InsufficientTokensError):
+            await tokens.spend(USER_ID, 2, LedgerReason.PROMPT)
+        assert len(await tokens.history(USER_ID)) == 4
+        assert await tokens.check_consistency() == []
+
+    run_with_database(scenario)
+
+
+def test_consistency_check_reports_drift(run_with_database):
+    async def scenario(database: Database) -> None:
+        tokens = await _tokens(database)
+        await database.execute("UPDATE users SET tokens = tokens + 3 WHERE telegram_id=?", (USER_ID,))
+        drift = await tokens.check_consistency()
+        assert [(item.user_id, item.balance, item.ledger_balance) for item in drift] == [(USER_ID, 13, 10)]
+
+    run_with_database(scenario)
+
+
+async def _hold_status(database: Database, hold_id: int) -> str:
+    return await database.fetchval("SELECT status FROM token_holds WHERE id=?", (hold_id,))
+
+
+def test_hold_reserves_tokens_until_settled(run_with_database):
+    async def scenario(database: Database) -> None:
+        tokens = await _tokens(database)
+        hold = await tokens.hold(USER_ID, 6, LedgerReason.SESSION, "session:1")
+        assert await tokens.balance(USER_ID) == 4
+        with pytest.raises(InsufficientTokensError):
+            await tokens.hold(USER_ID, 5, LedgerReason.SESSION, "session:2")
+        with pytest.raises(InsufficientTokensError):
+            await tokens.spend(USER_ID, 5, LedgerReason.PROMPT)
+        assert await tokens.commit(hold) == 4
+        assert await tokens.balance(USER_ID) == 4
+
+    run_with_database(scenario)
+
+
+def test_commit_and_release_are_idempotent(run_with_database):
+    async def scenario(database: Database) -> None:
+        tokens = await _tokens(database)
+        committed = await tokens.hold(USER_ID, 3, LedgerReason.SESSION, "session:1")
+        released = await tokens.hold(USER_ID, 3, LedgerReason.PROMPT, "prompt:1")
+        assert await tokens.commit(committed) == 7
+        assert await tokens.commit(committed) is None
+        await tokens.release(committed)
+        assert await _hold_status(database, committed.id) == "committed"
+        await tokens.release(released)
+        await tokens.release(released)
+        assert await tokens.commit(released) is None
+        assert await _hold_status(database, released.id) == "released"
+        assert await tokens.balance(USER_ID) == 7
+        assert [entry.ref for entry in await tokens.history(USER_ID)] == ["session:1", None]
+        assert await tokens.check_consistency() == []
+
+    run_with_database(scenario)
+
+
+def test_expired_holds_free_their_tokens(run_with_database):
+    async def scenario(database: Database) -> None:
+        tokens = await _tokens(database)
+        stale = await tokens.hold(USER_ID, 4, LedgerReason.SESSION, "session:1")
+        live = await tokens.hold(USER_ID, 4, LedgerReason.SESSION, "session:2")
+        await database.execute("UPDATE token_holds SET expires_at=datetime('now', '-1 minute') WHERE id=?", (stale.id,))
+        assert await tokens.release_expired_holds() == 1
+        assert await tokens.release_expired_holds() == 0
+        assert await _hold_status(database, stale.id) == "expired"
+        assert await _hold_status(database, live.id) == "held"
+        assert await tokens.balance(USER_ID) == 6
+
+    run_with_database(scenario)
+
+
+def test_extend_keeps_a_hold_from_expiring(run_with_database):
+    async def scenario(database: Database) -> None:
+        tokens = await _tokens(database)
+        hold = await tokens.hold(USER_ID, 4, LedgerReason.SESSION, "session:1")
+        await database.execute("UPDATE token_holds SET expires_at=datetime('now', '-1 minute') WHERE id=?", (hold.id,))
+        assert await tokens.extend(hold)
+        assert await tokens.release_expired_holds() == 0
+        await tokens.release(hold)
+        assert not await tokens.extend(hold)
+
+    run_with_database(scenario)
+
+
+def test_lapsed_hold_is_still_charged_on_commit(run_with_database):
+    async def scenario(database: Database) -> None:
+        tokens = await _tokens(database)
+        hold = await tokens.hold(USER_ID, 4, LedgerReason.SESSION, "session:1")
+        await database.execute("UPDATE token_holds SET expires_at=datetime('now', '-1 minute') WHERE id=?", (hold.id,))
+        await tokens.release_expired_holds()
+        await tokens.spend(USER_ID, 8, LedgerReason.PROMPT)
+        # Only 2 tokens are left once the lapsed hold no longer reserves its 4.
+        assert await tokens.commit(hold) == 0
+        assert await tokens.commit(hold) is None
+        assert await _hold_status(database, hold.id) == "committed"
+        assert await tokens.check_consistency() == []
+
+    run_with_database(scenario)